@@ -0,0 +1,206 @@
+# backfill.py
+"""Conversão em lote de um diretório inteiro de notas.
+
+As etapas (renderização + OCR local e API) rodam em threads separadas, ligadas por
+filas de tamanho limitado: enquanto a API processa uma nota, a próxima já está
+sendo renderizada e lida pelo TrOCR, página a página.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from itertools import zip_longest
+from typing import List
+
+import config
+import fitz  # PyMuPDF
+import metrics
+import pipeline
+from file_handler import is_candidate_pdf
+from job_journal import JobJournal, file_sha256
+from watch_roots import WatchRoot, root_for_path
+
+logger = logging.getLogger(__name__)
+
+# Marca o fim da fila entre etapas
+_DONE = object()
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Percentil pelo método do rank mais próximo."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class BackfillStats:
+    """Contadores de vazão do backfill."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.documents = 0
+        self.failed = 0
+        self.pages = 0
+        self.pages_processed = 0
+        self.payload_bytes = 0
+        self.api_latencies: List[float] = []
+
+    def record_document(self, state: pipeline.DocumentState):
+        with self._lock:
+            self.documents += 1
+            self.pages += len(state.keys)
+            self.pages_processed += len(state.pages)
+            self.payload_bytes += sum(len(page.payload.data) for page in state.pages)
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        latencies = list(self.api_latencies)
+        return (
+            f"{self.documents} nota(s) convertida(s), {self.failed} com erro, em {elapsed:.1f}s\n"
+            f"Páginas: {self.pages} no total, {self.pages_processed} processadas "
+            f"({self.pages_processed / elapsed:.2f} páginas/s)\n"
+            f"Imagens enviadas: {self.payload_bytes / 1e6:.1f} MB "
+            f"({self.payload_bytes / max(self.pages_processed, 1) / 1e3:.0f} KB/página)\n"
+            f"Latência da API ({len(latencies)} requisições): "
+            f"p50={_percentile(latencies, 50):.1f}s "
+            f"p90={_percentile(latencies, 90):.1f}s "
+            f"p99={_percentile(latencies, 99):.1f}s"
+        )
+
+
+def find_pending_pdfs(root: str, journal: JobJournal, limit: int = None,
+                      roots: List[WatchRoot] = None) -> List[str]:
+    """Lista os PDFs de `root` (recursivamente) cujo .md não está atualizado.
+
+    Cada PDF é comparado com a configuração da pasta de `roots` que o contém.
+    """
+    pending = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if not is_candidate_pdf(path):
+                continue
+            fingerprint = pipeline.pipeline_fingerprint(root_for_path(roots or [], path))
+            if not journal.needs_processing(path, pipeline.markdown_path_for(path), fingerprint):
+                continue
+            pending.append(path)
+            if limit and len(pending) >= limit:
+                return pending
+    return pending
+
+
+def _interleave(lists: List[List[str]]) -> List[str]:
+    """Alterna os itens das listas: uma pasta com muitas notas não passa na frente das outras.
+
+    Itens repetidos (pastas aninhadas) aparecem uma vez só.
+    """
+    return list(dict.fromkeys(item for group in zip_longest(*lists) for item in group if item is not None))
+
+
+def run_backfill(root: str = None, dry_run: bool = False, limit: int = None,
+                 roots: List[WatchRoot] = None) -> BackfillStats:
+    """Converte todos os PDFs desatualizados de `root` ou, sem `root`, de todas as pastas de `roots`.
+
+    Args:
+        root (str): Diretório a percorrer.
+        dry_run (bool): Apenas lista o que seria processado.
+        limit (int): Número máximo de PDFs a processar.
+        roots (List[WatchRoot]): As pastas monitoradas. Cada PDF usa o modelo e o
+            crop da pasta que o contém; os PDFs das várias pastas são intercalados.
+
+    Returns:
+        BackfillStats: As estatísticas de vazão da execução.
+
+    """
+    roots = roots or []
+    journal = JobJournal(config.JOURNAL_PATH)
+    if root:
+        pdfs = find_pending_pdfs(root, journal, limit, roots)
+        logger.info(f"{len(pdfs)} PDF(s) para converter em {root}.")
+    else:
+        pending = [find_pending_pdfs(watch_root.path, journal, limit, roots) for watch_root in roots]
+        for watch_root, paths in zip(roots, pending):
+            logger.info(f"{len(paths)} PDF(s) para converter em {watch_root.name} ({watch_root.path}).")
+        pdfs = _interleave(pending)[:limit]
+
+    stats = BackfillStats()
+    if dry_run:
+        for path in pdfs:
+            with fitz.open(path) as doc:
+                print(f"{path} ({len(doc)} página(s))")
+        return stats
+
+    api_queue = queue.Queue(maxsize=config.BACKFILL_QUEUE_SIZE)
+    write_queue = queue.Queue(maxsize=config.BACKFILL_QUEUE_SIZE)
+    api_workers = max(1, config.BACKFILL_API_WORKERS)
+
+    # Cada item que passa entre as etapas é (caminho, hash, estado, erro)
+    def prepare_stage():
+        for path in pdfs:
+            state = pipeline.DocumentState(path, root=root_for_path(roots, path))
+            try:
+                st = os.stat(path)
+                content_hash = file_sha256(path)
+                journal.mark_processing(path, st.st_mtime, st.st_size, content_hash)
+                api_queue.put((path, content_hash, pipeline.prepare_document(path, state), None))
+            except Exception as e:
+                api_queue.put((path, None, state, e))
+        for _ in range(api_workers):
+            api_queue.put(_DONE)
+
+    def api_stage():
+        while (item := api_queue.get()) is not _DONE:
+            path, content_hash, state, error = item
+            if error is None:
+                try:
+                    pipeline.request_markdown(state, latencies=stats.api_latencies)
+                except Exception as e:
+                    error = e
+            write_queue.put((path, content_hash, state, error))
+        write_queue.put(_DONE)
+
+    threads = [threading.Thread(target=prepare_stage, name="backfill-prepare", daemon=True)]
+    threads += [threading.Thread(target=api_stage, name=f"backfill-api-{i+1}", daemon=True)
+                for i in range(api_workers)]
+    for thread in threads:
+        thread.start()
+
+    # Etapa final (nesta thread): salvar o .md e atualizar o journal
+    finished_workers = 0
+    while finished_workers < api_workers:
+        item = write_queue.get()
+        if item is _DONE:
+            finished_workers += 1
+            continue
+        path, content_hash, state, error = item
+        if error is None:
+            try:
+                with metrics.timed(metrics.STAGE_WRITE, state.timings):
+                    markdown_path = pipeline.save_markdown(path, pipeline.assemble_markdown(state))
+                journal.mark_done(path, content_hash, markdown_path, pipeline.pipeline_fingerprint(state.root))
+                stats.record_document(state)
+                metrics.log_document(path, "done", state.timings, **pipeline.document_summary(state))
+                logger.info(f"[{stats.documents}/{len(pdfs)}] {markdown_path}")
+                continue
+            except Exception as e:
+                error = e
+        stats.record_failure()
+        metrics.log_document(path, "failed", state.timings, **pipeline.document_summary(state))
+        if content_hash is not None:
+            journal.mark_failed(path, str(error))
+        logger.error(f"Falha ao converter '{path}': {error}")
+
+    for thread in threads:
+        thread.join()
+
+    print(stats.summary())
+    return stats
@@ -0,0 +1,295 @@
+# benchmark.py
+"""Benchmark reproduzível do pipeline local (sem API).
+
+Gera PDFs sintéticos com páginas manuscritas (as mesmas de bench_segmentation.py,
+embutidas como imagem), em várias combinações de número de páginas e DPI, e mede
+cada etapa: rasterização, pré-processamento, segmentação, TrOCR e montagem do
+Markdown. O TrOCR usa um VisionEncoderDecoder minúsculo com pesos aleatórios
+(semente fixa), então nada é baixado e o custo por linha é estável.
+
+Cada combinação roda em um processo novo, para que o pico de memória (RSS) seja
+o dela. O resultado é um JSON que pode ser comparado com outro:
+
+    python benchmark.py run --pages 1 4 16 --dpi 150 300 --output base.json
+    python benchmark.py run --pages 1 4 16 --dpi 150 300 --output novo.json
+    python benchmark.py compare base.json novo.json --threshold 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+STAGES = ("rasterize", "preprocess", "segment", "trocr", "assemble")
+
+# Páginas A4 (em pontos do PDF)
+_A4_POINTS = (595, 842)
+
+
+# --- Dados sintéticos ---
+def build_pdf(path: str, pages: int, dpi: int, seed: int = 0):
+    """Grava um PDF com `pages` páginas manuscritas sintéticas escaneadas a `dpi`."""
+    from bench_segmentation import PAGE_SIZE, synthetic_page
+
+    rng = random.Random(seed)
+    scale = dpi / 300.0
+    size = (round(PAGE_SIZE[1] * scale), round(PAGE_SIZE[0] * scale))
+    with fitz.open() as doc:
+        for _ in range(pages):
+            img, _ = synthetic_page(rng, skew=1.5)
+            if scale != 1.0:
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+            _, jpeg = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            page = doc.new_page(width=_A4_POINTS[0], height=_A4_POINTS[1])
+            page.insert_image(page.rect, stream=jpeg.tobytes())
+        doc.save(path)
+
+
+def build_tiny_engine(workdir: str, backend: str = "torch", seed: int = 0):
+    """Cria um TrOCR minúsculo, com pesos aleatórios, e o carrega como OCREngine."""
+    import torch
+    from local_ocr import OCREngine
+    from ocr_backends import load_backend
+    from tokenizers import Tokenizer, models
+    from transformers import (PreTrainedTokenizerFast, TrOCRConfig,
+                              TrOCRProcessor, ViTConfig, ViTImageProcessor,
+                              VisionEncoderDecoderConfig,
+                              VisionEncoderDecoderModel)
+    from transformers.utils import logging as hf_logging
+
+    hf_logging.set_verbosity_error()
+    hf_logging.disable_progress_bar()
+    torch.manual_seed(seed)
+    specials = ["<s>", "<pad>", "</s>", "<unk>"]
+    letters = list("abcdefghijklmnopqrstuvwxyzáéíóúãõç .,")
+    vocab = {token: i for i, token in enumerate(specials + letters)}
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=Tokenizer(models.WordLevel(vocab, unk_token="<unk>")),
+                                        bos_token="<s>", pad_token="<pad>", eos_token="</s>", unk_token="<unk>")
+    image_processor = ViTImageProcessor(size={"height": 64, "width": 64})
+    processor = TrOCRProcessor(image_processor=image_processor, tokenizer=tokenizer)
+
+    encoder = ViTConfig(image_size=64, patch_size=16, hidden_size=64, num_hidden_layers=2,
+                        num_attention_heads=2, intermediate_size=128)
+    decoder = TrOCRConfig(vocab_size=len(vocab), d_model=64, decoder_layers=2, decoder_attention_heads=2,
+                          decoder_ffn_dim=128, bos_token_id=0, pad_token_id=1, eos_token_id=2,
+                          decoder_start_token_id=0)
+    model_config = VisionEncoderDecoderConfig.from_encoder_decoder_configs(encoder, decoder)
+    model_config.decoder_start_token_id = 0
+    model_config.pad_token_id = 1
+    model_config.eos_token_id = 2
+    model = VisionEncoderDecoderModel(model_config)
+    # Sem EOS até o fim: todas as linhas custam o mesmo número de passos do decoder
+    model.generation_config.decoder_start_token_id = 0
+    model.generation_config.pad_token_id = 1
+    model.generation_config.eos_token_id = 2
+    model.generation_config.max_length = 16
+    model.generation_config.min_length = 16
+
+    model_path = os.path.join(workdir, "tiny-trocr")
+    model.save_pretrained(model_path)
+    if backend == "onnx":
+        import export_onnx
+
+        export_onnx.export(model_path, os.path.join(model_path, "onnx"))
+    return OCREngine(processor, load_backend(backend, model_path))
+
+
+# --- Execução ---
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KiB; macOS, em bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(pages: int, dpi: int, repeat: int, backend: str, seed: int) -> Dict:
+    """Mede as etapas para um PDF de `pages` páginas a `dpi` (mediana de `repeat` execuções)."""
+    import local_ocr
+    import pipeline
+    from pdf_processor import (RenderSettings, binarize_page, line_views,
+                               render_for_ocr, segment_lines)
+    from PIL import Image
+
+    settings = RenderSettings(dpi=dpi, crop_box=None, screen_dpi=96, debug_save_images=False)
+    samples = {stage: [] for stage in STAGES}
+    lines_per_run = 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, "bench.pdf")
+        build_pdf(pdf_path, pages, dpi, seed)
+        engine = build_tiny_engine(workdir, backend, seed)
+        # Aquecimento: a primeira inferência paga inicializações do backend
+        local_ocr.recognize_lines([Image.new("RGB", (384, 64), "white")], engine=engine)
+
+        for _ in range(repeat):
+            timings = dict.fromkeys(STAGES, 0.0)
+            lines = []
+            with fitz.open(pdf_path) as doc:
+                for page_num in range(len(doc)):
+                    start = time.perf_counter()
+                    gray = render_for_ocr(doc.load_page(page_num), settings)
+                    timings["rasterize"] += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    binarized = binarize_page(gray, settings.ocr_width)
+                    timings["preprocess"] += time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    lines.append(line_views(binarized, segment_lines(binarized)))
+                    timings["segment"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            flat = [Image.fromarray(line) for page_lines in lines for line in page_lines]
+            texts = local_ocr.recognize_lines(flat, engine=engine)
+            timings["trocr"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            state = pipeline.DocumentState(pdf_path, keys=[""] * pages)
+            offset = 0
+            for page_num, page_lines in enumerate(lines):
+                state.markdown_pages[page_num] = "\n".join(texts[offset:offset + len(page_lines)])
+                offset += len(page_lines)
+            pipeline.assemble_markdown(state)
+            timings["assemble"] += time.perf_counter() - start
+
+            lines_per_run = len(flat)
+            for stage, seconds in timings.items():
+                samples[stage].append(seconds)
+
+    stages = {}
+    for stage, values in samples.items():
+        seconds = statistics.median(values)
+        stages[stage] = {"seconds": round(seconds, 4),
+                         "pages_per_s": round(pages / seconds, 2) if seconds else None}
+    total = sum(stage["seconds"] for stage in stages.values())
+    return {
+        "pages": pages,
+        "dpi": dpi,
+        "lines": lines_per_run,
+        "stages": stages,
+        "total_seconds": round(total, 4),
+        "pages_per_s": round(pages / total, 2) if total else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def _metadata(args) -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    import torch
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "backend": args.backend,
+        "repeat": args.repeat,
+        "seed": args.seed,
+    }
+
+
+def run(args) -> Dict:
+    cases = []
+    context = multiprocessing.get_context("spawn")
+    for pages in args.pages:
+        for dpi in args.dpi:
+            if args.in_process:
+                case = run_case(pages, dpi, args.repeat, args.backend, args.seed)
+            else:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    case = pool.submit(run_case, pages, dpi, args.repeat, args.backend, args.seed).result()
+            print(f"{pages:3d} página(s) @ {dpi} DPI: {case['pages_per_s']} páginas/s, "
+                  f"{case['lines']} linhas, pico de {case['peak_rss_mb']} MB", file=sys.stderr)
+            cases.append(case)
+    return {"meta": _metadata(args), "cases": cases}
+
+
+# --- Comparação ---
+def compare(old: Dict, new: Dict, threshold: float) -> List[str]:
+    """Compara dois resultados e devolve as linhas com regressão acima de `threshold` %."""
+    new_cases = {(case["pages"], case["dpi"]): case for case in new["cases"]}
+    regressions = []
+    print(f"{'caso':<16} {'etapa':<12} {'antes (s)':>10} {'depois (s)':>11} {'variação':>9}")
+    for old_case in old["cases"]:
+        key = (old_case["pages"], old_case["dpi"])
+        new_case = new_cases.get(key)
+        if new_case is None:
+            continue
+        label = f"{key[0]}p @ {key[1]}dpi"
+        rows = [(stage, old_case["stages"][stage]["seconds"], new_case["stages"][stage]["seconds"])
+                for stage in STAGES if stage in old_case["stages"] and stage in new_case["stages"]]
+        rows.append(("total", old_case["total_seconds"], new_case["total_seconds"]))
+        rows.append(("rss (MB)", old_case["peak_rss_mb"], new_case["peak_rss_mb"]))
+        for stage, before, after in rows:
+            change = (after - before) / before * 100 if before else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  <- regressão"
+                regressions.append(f"{label} {stage}: {change:+.1f}%")
+            digits = 1 if stage == "rss (MB)" else 4
+            print(f"{label:<16} {stage:<12} {before:>10.{digits}f} {after:>11.{digits}f} {change:>+8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline local de OCR.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Executa o benchmark e grava o JSON")
+    run_parser.add_argument("--pages", type=int, nargs="+", default=[1, 4, 16])
+    run_parser.add_argument("--dpi", type=int, nargs="+", default=[150, 300])
+    run_parser.add_argument("--repeat", type=int, default=3, help="Execuções por caso (vale a mediana).")
+    run_parser.add_argument("--backend", choices=("torch", "onnx"), default="torch")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--in-process", action="store_true",
+                            help="Roda os casos neste processo (o pico de RSS passa a ser acumulado)")
+    run_parser.add_argument("--output", help="Arquivo JSON de saída (padrão: stdout)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compara dois arquivos de resultado")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="Variação (%%) a partir da qual uma etapa conta como regressão")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        result = json.dumps(run(args), indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(result + "\n")
+        else:
+            print(result)
+    else:
+        with open(args.before, encoding="utf-8") as f:
+            before = json.load(f)
+        with open(args.after, encoding="utf-8") as f:
+            after = json.load(f)
+        regressions = compare(before, after, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressão(ões) acima de {args.threshold:.0f}%:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,16 +7,184 @@ from dotenv import load_dotenv
 # Carrega as variáveis do arquivo .env para o ambiente
 load_dotenv()
 
+# Verificada por main.py antes de iniciar o serviço, e não aqui, para que as
+# ferramentas que não usam a API possam importar este módulo sem a chave
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("A variável de ambiente OPENAI_API_KEY não foi encontrada. Crie um arquivo .env.")
 
 WATCH_DIRECTORY = "/home/felipemarcelino/Google_Drive/onyx/TabUltraCPro/Notebooks/"
+# Arquivo YAML com várias pastas monitoradas, cada uma com o seu modelo e crop
+# (formato em watch_roots.py). Sem ele, só WATCH_DIRECTORY é monitorado
+WATCH_ROOTS_FILE = os.getenv("OCR_ZETTEL_ROOTS")
 
 FINAL_MODEL_PATH = "/home/felipemarcelino/Projects/trocr/meu-trocr-final/"
 
+# Resolução máxima de renderização. As páginas são renderizadas direto no tamanho
+# de cada etapa: OCR_TARGET_WIDTH de largura (em cinza) para o OCR local e o
+# tamanho final da imagem da API (VISION_IMAGE_MAX_*) para a API
 OCR_RESOLUTION_DPI = 300
+# Largura (px) da região recortada usada na binarização e na segmentação em linhas
+OCR_TARGET_WIDTH = 1600
 PDF_ENABLE_CROP = True
 PDF_CROP_BOX = (120, 100, 2350, 3300)
 DEBUG_SAVE_IMAGES = False
+
+# Modelo da OpenAI usado para transcrever e formatar as notas
+VISION_MODEL = "gpt-5"
+# URL alternativa da API (ex.: um servidor local de testes); None usa a padrão
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+# Requisições simultâneas à API, somando todas as notas em processamento
+VISION_MAX_CONCURRENCY = 4
+# Novas tentativas em erros 429/5xx/conexão, com backoff exponencial e jitter
+VISION_MAX_RETRIES = 5
+VISION_BACKOFF_BASE = 1.0
+VISION_BACKOFF_MAX = 60.0
+VISION_REQUEST_TIMEOUT = 600.0
+# Páginas consecutivas enviadas juntas numa mesma requisição (1 = uma requisição
+# por página). Os grupos são enviados em paralelo, até VISION_MAX_CONCURRENCY
+VISION_MAX_PAGES_PER_REQUEST = 3
+# Limite estimado de tokens de entrada (prompt, texto do OCR local e imagens) por grupo
+VISION_REQUEST_TOKEN_BUDGET = 10_000
+# Tokens de resposta permitidos por página da requisição (inclui o raciocínio do modelo)
+VISION_MAX_COMPLETION_TOKENS = 4096
+
+# --- Imagens enviadas à API ---
+# A API reduz as imagens para caber em 2048px e depois deixa o menor lado com 768px;
+# enviar mais que isso só aumenta o upload
+VISION_IMAGE_MAX_LONG_EDGE = 2048
+VISION_IMAGE_MAX_SHORT_EDGE = 768
+# "RGB", "L" (tons de cinza) ou "1" (preto e branco)
+VISION_IMAGE_MODE = "L"
+# "PNG", "JPEG" ou "WEBP"; a qualidade vale para JPEG e WEBP
+VISION_IMAGE_FORMAT = "WEBP"
+VISION_IMAGE_QUALITY = 80
+# Envia a página binarizada por preprocess_page em vez da renderização original
+VISION_SEND_BINARIZED = False
 SCREEN_ASSUMED_DPI = 96
+
+# --- Processamento paralelo das páginas ---
+# Número de processos para renderizar e segmentar as páginas
+PAGE_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+# Abaixo deste número de páginas o PDF é processado sem o pool de processos
+PARALLEL_MIN_PAGES = 4
+# Máximo de páginas renderizadas/segmentadas em memória ao mesmo tempo, somando as
+# em processamento no pool e as que aguardam o OCR local; a memória usada não
+# cresce com o número de páginas do PDF
+PAGE_BUFFER_LIMIT = max(4, 2 * PAGE_WORKERS)
+# O OCR local roda assim que as páginas em espera somam este número de linhas
+# (ou atingem PAGE_BUFFER_LIMIT), para aproveitar os lotes do TrOCR
+OCR_STREAM_MIN_LINES = 64
+
+# --- Segmentação em linhas ---
+# Altura mínima (px, na página com OCR_TARGET_WIDTH de largura) de uma linha de texto
+SEGMENT_MIN_LINE_HEIGHT = 20
+# Largura da dilatação horizontal que junta as palavras de uma linha
+SEGMENT_LINE_KERNEL_WIDTH = 50
+# Fração mínima de tinta na caixa de uma linha (descarta ruído encadeado pela dilatação)
+SEGMENT_MIN_INK_RATIO = 0.02
+# Corrige a inclinação da página antes de segmentar (útil para fotos e scans tortos)
+SEGMENT_DESKEW = False
+# Maior inclinação (graus) procurada pela correção
+SEGMENT_MAX_SKEW_DEGREES = 5.0
+
+# --- Tinta vetorial ---
+# Em PDFs com a escrita em vetores (exportados pelo tablet), as linhas são desenhadas
+# direto dos traços, sem renderizar, binarizar e segmentar a página
+VECTOR_INK = True
+# Páginas com menos traços vetoriais que isto (scans, fotos) seguem pela renderização
+VECTOR_MIN_STROKES = 10
+# Tamanho (largura, altura) em que cada linha é desenhada: a entrada do TrOCR
+VECTOR_LINE_SIZE = (384, 384)
+# Traços cujos centros distam mais que esta fração da altura típica de um traço
+# ficam em linhas diferentes
+VECTOR_LINE_GAP = 0.7
+
+# --- Inferência em lote do TrOCR ---
+# Número máximo de linhas enviadas juntas para model.generate. É o que limita a
+# memória do modelo: o processador redimensiona cada linha para 384x384, então o
+# tensor de entrada tem sempre lote x 3 x 384 x 384
+TROCR_BATCH_SIZE = 16
+# Soma máxima de pixels (largura x altura) dos recortes originais de um lote. Limita
+# só a memória do pré-processamento (as cópias RGB dos recortes antes do redimensionamento);
+# recortes muito largos (páginas inteiras, linhas longas em alta resolução) formam lotes menores
+TROCR_MAX_PREPROCESS_PIXELS = 4_000_000
+
+# --- Backend do OCR local ---
+# "torch" (PyTorch, padrão) ou "onnx" (ONNX Runtime; gere os modelos com export_onnx.py)
+OCR_BACKEND = "torch"
+ONNX_MODEL_DIR = os.path.join(FINAL_MODEL_PATH, "onnx")
+# Usa os modelos quantizados em int8 (export_onnx.py --quantize), se existirem
+ONNX_QUANTIZE = False
+# Threads do ONNX Runtime (0 = padrão do runtime)
+ONNX_NUM_THREADS = 0
+# Número de feixes da busca; None usa a configuração de geração do modelo
+OCR_NUM_BEAMS = None
+# Carrega o TrOCR e o corretor ortográfico em segundo plano ao iniciar o serviço,
+# em vez de esperar a primeira nota
+OCR_WARMUP_IN_BACKGROUND = True
+
+# --- Roteamento por confiança ---
+# Páginas em que a confiança do TrOCR (média, entre as linhas, da probabilidade dos
+# tokens gerados) atinge este valor viram Markdown localmente, sem passar pela API.
+# None envia todas as páginas à API.
+LOCAL_MARKDOWN_MIN_CONFIDENCE = 0.92
+
+# --- Cache de páginas ---
+# Fica fora da pasta sincronizada: um SQLite dentro do Google Drive pode ser corrompido pela sincronização
+CACHE_DIR = os.path.expanduser("~/.cache/ocr-zettel")
+PAGE_CACHE_PATH = os.path.join(CACHE_DIR, "page_cache.sqlite")
+# Tamanho máximo (bytes) das imagens codificadas guardadas no cache de páginas; acima
+# dele as usadas há mais tempo são removidas ao iniciar e em `python main.py cache prune`
+# (só a imagem sai: o texto local e o Markdown da página continuam no cache)
+PAGE_CACHE_MAX_PAYLOAD_BYTES = 500_000_000
+# Páginas (texto local, Markdown e imagem) sem uso há mais de N dias são removidas ao
+# iniciar e em `python main.py cache prune`. None mantém todas.
+PAGE_CACHE_MAX_AGE_DAYS = 180
+
+# --- Cache de respostas da API ---
+# Respostas guardadas pelo conteúdo da requisição (modelo, parâmetros, prompt e
+# bytes das imagens): requisições idênticas não vão de novo à API
+VISION_CACHE_ENABLED = True
+VISION_CACHE_PATH = os.path.join(CACHE_DIR, "vision_cache.sqlite")
+# Tamanho máximo (bytes); acima dele as respostas usadas há mais tempo são removidas
+VISION_CACHE_MAX_BYTES = 200_000_000
+# Validade das respostas em dias; None não expira (use `python main.py cache clear`)
+VISION_CACHE_TTL_DAYS = 90
+
+# --- Correção ortográfica do OCR local ---
+# Índice de deleções simétricas, montado na primeira execução a partir do dicionário pt
+SPELL_INDEX_PATH = os.path.join(CACHE_DIR, "spell_index_pt.npz")
+# Distância de edição máxima aceita para uma correção
+SPELL_MAX_EDIT_DISTANCE = 2
+# Só o prefixo das palavras entra no índice (menor = índice menor, consultas mais lentas)
+SPELL_PREFIX_LENGTH = 7
+# Número de palavras com correção guardada em memória
+SPELL_CACHE_SIZE = 50_000
+
+# --- Gravação do Markdown ---
+# Segundos durante os quais os eventos do watchdog causados pelas gravações do
+# próprio serviço (o .md e o arquivo temporário) são ignorados
+OWN_WRITE_EVENT_WINDOW = 5.0
+
+# --- Fila de processamento ---
+# Número de notas processadas ao mesmo tempo
+JOB_WORKERS = 2
+# Intervalo (s) entre as verificações de estabilidade e quantas precisam ser iguais
+STABILITY_CHECK_INTERVAL = 1.0
+STABILITY_REQUIRED_CHECKS = 3
+# Ao parar (CTRL+C): True espera a fila esvaziar; False grava os jobs pendentes
+DRAIN_ON_SHUTDOWN = False
+PENDING_JOBS_PATH = os.path.join(CACHE_DIR, "pending_jobs.json")
+# Estado persistente de cada PDF (hash, etapa, arquivo gerado)
+JOURNAL_PATH = os.path.join(CACHE_DIR, "journal.sqlite")
+
+# --- Backfill (python main.py backfill) ---
+# Tamanho das filas entre as etapas (renderização e OCR local -> API -> gravação)
+BACKFILL_QUEUE_SIZE = 4
+# Notas enviadas à API ao mesmo tempo durante o backfill
+BACKFILL_API_WORKERS = VISION_MAX_CONCURRENCY
+
+# --- Métricas ---
+# Porta do endpoint /metrics (Prometheus); None desativa
+METRICS_PORT = None
+# Endereço do endpoint; 127.0.0.1 o deixa acessível só nesta máquina
+METRICS_ADDRESS = "127.0.0.1"
@@ -0,0 +1,214 @@
+# export_onnx.py
+"""Exporta o modelo TrOCR de config.FINAL_MODEL_PATH para ONNX.
+
+Uso:
+    python export_onnx.py [--output DIR] [--quantize]
+"""
+import argparse
+import json
+import logging
+import os
+
+import config
+import torch
+from logger_setup import setup_logging
+from ocr_backends import (DECODER_FILE, DECODER_WITH_PAST_FILE, ENCODER_FILE,
+                          ONNX_CONFIG_FILE, quantized_name)
+from transformers import VisionEncoderDecoderModel
+from transformers.cache_utils import DynamicCache, EncoderDecoderCache
+
+logger = logging.getLogger(__name__)
+
+OPSET_VERSION = 17
+
+
+class _EncoderWrapper(torch.nn.Module):
+    """Encoder + projeção para a dimensão do decoder (quando existir)."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.encoder = model.encoder
+        needs_proj = (model.encoder.config.hidden_size != model.decoder.config.hidden_size
+                      and model.decoder.config.cross_attention_hidden_size is None)
+        self.proj = model.enc_to_dec_proj if needs_proj else None
+
+    def forward(self, pixel_values):
+        hidden = self.encoder(pixel_values=pixel_values, return_dict=True).last_hidden_state
+        if self.proj is not None:
+            hidden = self.proj(hidden)
+        return hidden
+
+
+def _layer_tensors(cache, layer_idx):
+    # Compatível com as versões do transformers com e sem `cache.layers`
+    if hasattr(cache, "layers"):
+        layer = cache.layers[layer_idx]
+        return layer.keys, layer.values
+    return cache.key_cache[layer_idx], cache.value_cache[layer_idx]
+
+
+class _DecoderWrapper(torch.nn.Module):
+    """Decoder que recebe e devolve o cache como uma lista plana de tensores."""
+
+    def __init__(self, decoder, num_layers: int, with_past: bool):
+        super().__init__()
+        self.decoder = decoder
+        self.num_layers = num_layers
+        self.with_past = with_past
+
+    def forward(self, input_ids, encoder_hidden_states, *past):
+        cache = EncoderDecoderCache(DynamicCache(), DynamicCache())
+        if self.with_past:
+            for i in range(self.num_layers):
+                self_k, self_v, cross_k, cross_v = past[4 * i:4 * i + 4]
+                cache.self_attention_cache.update(self_k, self_v, i)
+                cache.cross_attention_cache.update(cross_k, cross_v, i)
+                cache.is_updated[i] = True
+
+        outputs = self.decoder(input_ids=input_ids,
+                               encoder_hidden_states=encoder_hidden_states,
+                               past_key_values=cache,
+                               use_cache=True,
+                               return_dict=True)
+        present = []
+        for i in range(self.num_layers):
+            present.extend(_layer_tensors(cache.self_attention_cache, i))
+            present.extend(_layer_tensors(cache.cross_attention_cache, i))
+        return (outputs.logits, *present)
+
+
+def _past_names(prefix: str, num_layers: int) -> list:
+    return [f"{prefix}.{i}.{kind}.{kv}"
+            for i in range(num_layers)
+            for kind in ("decoder", "encoder")
+            for kv in ("key", "value")]
+
+
+def export(model_path: str, output_dir: str, quantize: bool = False):
+    """Exporta encoder, decoder e decoder com cache para `output_dir`."""
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"Carregando o modelo de {model_path}...")
+    model = VisionEncoderDecoderModel.from_pretrained(model_path).eval()
+    model.config.use_cache = True
+    model.decoder.config.use_cache = True
+
+    dec_config = model.decoder.config
+    num_layers = dec_config.decoder_layers
+    num_heads = dec_config.decoder_attention_heads
+    head_dim = dec_config.d_model // num_heads
+    image_size = model.encoder.config.image_size
+    num_channels = model.encoder.config.num_channels
+
+    pixel_values = torch.randn(2, num_channels, image_size, image_size)
+    with torch.no_grad():
+        encoder = _EncoderWrapper(model)
+        encoder_hidden_states = encoder(pixel_values)
+
+    # --- Encoder ---
+    encoder_path = os.path.join(output_dir, ENCODER_FILE)
+    torch.onnx.export(encoder, (pixel_values,), encoder_path,
+                      input_names=["pixel_values"],
+                      output_names=["last_hidden_state"],
+                      dynamic_axes={"pixel_values": {0: "batch"},
+                                    "last_hidden_state": {0: "batch", 1: "encoder_sequence"}},
+                      opset_version=OPSET_VERSION, dynamo=False)
+    logger.info(f"Encoder exportado para {encoder_path}")
+
+    # --- Decoder (primeiro passo, sem cache) ---
+    input_ids = torch.full((2, 1), model.config.decoder_start_token_id, dtype=torch.long)
+    present_names = _past_names("present", num_layers)
+    present_axes = {}
+    for name in present_names:
+        seq_axis = "past_sequence + 1" if ".decoder." in name else "encoder_sequence"
+        present_axes[name] = {0: "batch", 2: seq_axis}
+
+    decoder_path = os.path.join(output_dir, DECODER_FILE)
+    decoder = _DecoderWrapper(model.decoder, num_layers, with_past=False)
+    torch.onnx.export(decoder, (input_ids, encoder_hidden_states), decoder_path,
+                      input_names=["input_ids", "encoder_hidden_states"],
+                      output_names=["logits", *present_names],
+                      dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                                    "encoder_hidden_states": {0: "batch", 1: "encoder_sequence"},
+                                    "logits": {0: "batch", 1: "sequence"},
+                                    **present_axes},
+                      opset_version=OPSET_VERSION, dynamo=False)
+    logger.info(f"Decoder exportado para {decoder_path}")
+
+    # --- Decoder com cache de chaves/valores ---
+    with torch.no_grad():
+        past = decoder(input_ids, encoder_hidden_states)[1:]
+    past_names = _past_names("past_key_values", num_layers)
+    past_axes = {}
+    for name in past_names:
+        seq_axis = "past_sequence" if ".decoder." in name else "encoder_sequence"
+        past_axes[name] = {0: "batch", 2: seq_axis}
+
+    decoder_with_past_path = os.path.join(output_dir, DECODER_WITH_PAST_FILE)
+    decoder_with_past = _DecoderWrapper(model.decoder, num_layers, with_past=True)
+    torch.onnx.export(decoder_with_past, (input_ids, encoder_hidden_states, *past), decoder_with_past_path,
+                      input_names=["input_ids", "encoder_hidden_states", *past_names],
+                      output_names=["logits", *present_names],
+                      dynamic_axes={"input_ids": {0: "batch"},
+                                    "encoder_hidden_states": {0: "batch", 1: "encoder_sequence"},
+                                    "logits": {0: "batch"},
+                                    **past_axes, **present_axes},
+                      opset_version=OPSET_VERSION, dynamo=False)
+    logger.info(f"Decoder com cache exportado para {decoder_with_past_path}")
+
+    # --- Configuração de geração usada pelo OnnxTrOCRBackend ---
+    generation_config = model.generation_config
+    eos_token_id = generation_config.eos_token_id
+    if eos_token_id is None:
+        eos_token_id = model.decoder.config.eos_token_id
+    if isinstance(eos_token_id, list):
+        eos_token_id = eos_token_id[0]
+    onnx_config = {
+        "decoder_start_token_id": model.config.decoder_start_token_id,
+        "eos_token_id": eos_token_id,
+        "pad_token_id": model.config.pad_token_id,
+        "max_length": generation_config.max_length,
+        "num_beams": generation_config.num_beams,
+        # Restrições da busca, aplicadas pelo OnnxTrOCRBackend como no `generate`
+        "min_length": generation_config.min_length,
+        "no_repeat_ngram_size": generation_config.no_repeat_ngram_size,
+        "length_penalty": generation_config.length_penalty,
+        "early_stopping": generation_config.early_stopping,
+        "num_layers": num_layers,
+        "num_heads": num_heads,
+        "head_dim": head_dim,
+    }
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(onnx_config, f, indent=2)
+
+    if quantize:
+        quantize_models(output_dir)
+
+
+def quantize_models(output_dir: str):
+    """Gera versões int8 (quantização dinâmica) dos modelos exportados."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for filename in (ENCODER_FILE, DECODER_FILE, DECODER_WITH_PAST_FILE):
+        src = os.path.join(output_dir, filename)
+        dst = os.path.join(output_dir, quantized_name(filename))
+        quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+        logger.info(f"Modelo quantizado salvo em {dst}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o TrOCR para ONNX Runtime.")
+    parser.add_argument("--model", default=config.FINAL_MODEL_PATH,
+                        help="Diretório do modelo TrOCR (padrão: config.FINAL_MODEL_PATH)")
+    parser.add_argument("--output", default=config.ONNX_MODEL_DIR,
+                        help="Diretório de saída (padrão: config.ONNX_MODEL_DIR)")
+    parser.add_argument("--quantize", action="store_true",
+                        help="Também gera as versões quantizadas em int8")
+    args = parser.parse_args()
+
+    setup_logging()
+    export(args.model, args.output, quantize=args.quantize)
+    logger.info("Exportação concluída.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,124 +1,197 @@
 # file_handler.py
 import logging
 import os
+import threading
 import time
-
-import gpt_vision_client
-import local_ocr
+from typing import List, Optional
+
+import config
+import markdown_writer
+import metrics
+import pipeline
+from gpt_vision_client import VisionAPIError
+from job_journal import JobJournal, file_sha256
+from job_queue import (PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL,
+                       JobQueue, StabilityMonitor, WorkerPool, load_pending,
+                       save_pending)
+from watch_roots import WatchRoot, default_root, root_for_path
 from watchdog.events import FileSystemEventHandler
 
 logger = logging.getLogger(__name__)
 
-import logging
-
-# file_handler.py
-
-
-logger = logging.getLogger(__name__)
+def is_candidate_pdf(path: str) -> bool:
+    """Indica se `path` é um PDF que deve ser processado (ignora temporários "~")."""
+    return (not os.path.isdir(path)
+            and path.lower().endswith(".pdf")
+            and not os.path.basename(path).startswith("~"))
 
 class PDFChangeHandler(FileSystemEventHandler):
     """Manipulador de eventos que reage à criação e modificação de arquivos PDF,
     com uma verificação de estabilidade para lidar com sincronização de nuvem.
-    """
-
-    def __init__(self):
-        super().__init__()
-        self.processed_files = {}
 
-    def _should_process(self, path: str) -> bool:
-        """Verifica se um arquivo deve ser processado com base no nome e no tempo."""
-        if os.path.isdir(path) or not path.lower().endswith(".pdf") or os.path.basename(path).startswith("~"):
-            return False
+    Os eventos apenas enfileiram o arquivo; a verificação de estabilidade e o
+    processamento rodam fora da thread do observador.
 
-        # Evita processamento duplicado muito rápido (debounce)
-        now = time.time()
-        last_processed_time = self.processed_files.get(path, 0)
-        if now - last_processed_time < 10: # Aumentado para 10 segundos
-            return False
-
-        return True
+    Um mesmo manipulador atende todas as pastas monitoradas (`roots`): cada PDF é
+    processado com o modelo e o crop da sua pasta, e a fila reparte os workers
+    entre as pastas.
+    """
 
-    def _is_file_stable(self, file_path: str) -> bool:
-        """Verifica se o arquivo parou de ser modificado, aguardando até que seu tamanho
-        permaneça o mesmo por alguns segundos.
+    def __init__(self, workers: int = None, roots: List[WatchRoot] = None):
+        super().__init__()
+        self.roots = roots or [default_root()]
+        self.journal = JobJournal(config.JOURNAL_PATH)
+        self.job_queue = JobQueue(group_of=self._group_of,
+                                  weights={root.name: root.weight for root in self.roots})
+        self.stability_monitor = StabilityMonitor(self._on_stable,
+                                                  interval=config.STABILITY_CHECK_INTERVAL,
+                                                  required_checks=config.STABILITY_REQUIRED_CHECKS)
+        self.worker_pool = WorkerPool(self.job_queue, self._process_file,
+                                      workers or config.JOB_WORKERS)
+        # Tempo de espera pela estabilidade de cada arquivo, para o log do documento
+        self._stability_waits = {}
+        self._stability_lock = threading.Lock()
+        metrics.QUEUE_DEPTH.set_function(lambda: len(self.job_queue))
+
+    def start(self):
+        """Inicia os workers e retoma os jobs pendentes da execução anterior."""
+        self.stability_monitor.start()
+        self.worker_pool.start()
+        pending = load_pending(config.PENDING_JOBS_PATH)
+        if pending:
+            logger.info(f"Retomando {len(pending)} job(s) pendente(s) da execução anterior.")
+        for job in pending:
+            self.enqueue(job.path, job.priority)
+
+    def stop(self, drain: bool = False):
+        """Para o processamento.
+
+        Com `drain`, espera a fila esvaziar; senão termina apenas os jobs em
+        andamento e grava os pendentes para a próxima execução.
         """
-        if not os.path.exists(file_path):
-            return False
-
-        logger.info(f"Verificando estabilidade do arquivo: {file_path}")
-        try:
-            last_size = -1
-            stable_count = 0
-            # O arquivo precisa ter o mesmo tamanho por 3 segundos consecutivos
-            stability_threshold = 3
-
-            while stable_count < stability_threshold:
-                if not os.path.exists(file_path):
-                    logger.warning(f"Arquivo {file_path} desapareceu durante verificação. Cancelando.")
-                    return False
-
-                current_size = os.path.getsize(file_path)
-
-                if current_size == 0:
-                    logger.debug(f"Arquivo {file_path} ainda está com 0 bytes. Aguardando...")
-                    stable_count = 0 # Reinicia se o arquivo ainda estiver vazio
-                    time.sleep(1)
+        watching = self.stability_monitor.stop()
+        if drain:
+            for job in watching:
+                self.job_queue.put(job.path, job.priority)
+            watching = []
+            logger.info(f"Aguardando {len(self.job_queue)} job(s) na fila...")
+        self.job_queue.close(drain=drain)
+        self.worker_pool.join()
+
+        pending = self.job_queue.pending() + watching
+        if pending:
+            save_pending(config.PENDING_JOBS_PATH, pending)
+            logger.info(f"{len(pending)} job(s) pendente(s) gravados em {config.PENDING_JOBS_PATH}.")
+
+    def enqueue(self, path: str, priority: int = PRIORITY_NORMAL):
+        """Agenda um arquivo para processamento, depois que ele ficar estável."""
+        if self._should_process(path):
+            self.stability_monitor.watch(path, priority)
+
+    def catch_up(self, root: str):
+        """Percorre `root` e enfileira os PDFs que mudaram desde a última execução
+        bem-sucedida (ou que nunca foram processados). PDFs sem registro no journal
+        cujo .md é mais novo que eles não são reprocessados (ver JobJournal.needs_processing).
+        """
+        logger.info(f"Procurando PDFs alterados enquanto o serviço estava parado em: {root}")
+        queued = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if not self._should_process(path):
                     continue
+                try:
+                    if self.journal.needs_processing(path, pipeline.markdown_path_for(path),
+                                                     pipeline.pipeline_fingerprint(self.root_for(path))):
+                        self.enqueue(path, PRIORITY_LOW)
+                        queued += 1
+                except OSError as e:
+                    logger.warning(f"Não foi possível verificar {path}: {e}")
+        logger.info(f"Verificação inicial concluída: {queued} PDF(s) enfileirados.")
+
+    def root_for(self, path: str) -> Optional[WatchRoot]:
+        """A pasta monitorada de `path` (None se estiver fora de todas)."""
+        return root_for_path(self.roots, path)
+
+    def _group_of(self, path: str) -> str:
+        root = self.root_for(path)
+        return root.name if root else ""
+
+    def _on_stable(self, path: str, priority: int, waited: float):
+        metrics.observe_stage(metrics.STAGE_STABILITY_WAIT, waited)
+        with self._stability_lock:
+            self._stability_waits[path] = waited
+        self.job_queue.put(path, priority)
 
-                if current_size == last_size:
-                    stable_count += 1
-                else:
-                    last_size = current_size
-                    stable_count = 0  # Reinicia a contagem se o tamanho mudar
-
-                time.sleep(1)
-
-            logger.info(f"Arquivo está estável com {last_size} bytes.")
-            return True
-
-        except FileNotFoundError:
-            logger.warning(f"Arquivo {file_path} não encontrado durante verificação. Pode ter sido temporário.")
-            return False
-        except Exception as e:
-            logger.error(f"Erro ao verificar estabilidade do arquivo {file_path}: {e}")
-            return False
-
+    def _should_process(self, path: str) -> bool:
+        """Verifica se um arquivo deve ser processado com base no nome."""
+        return is_candidate_pdf(path)
 
     def _process_file(self, pdf_path: str):
         """Orquestra o fluxo de processamento para um único arquivo PDF."""
-        if not self._should_process(pdf_path):
+        with self._stability_lock:
+            waited = self._stability_waits.pop(pdf_path, None)
+
+        if not os.path.exists(pdf_path):
+            logger.warning(f"Arquivo {pdf_path} não existe mais. Ignorando.")
             return
 
-        # --- NOVA LÓGICA DE ESTABILIDADE ---
-        if not self._is_file_stable(pdf_path):
-            logger.warning(f"Processamento de {pdf_path} cancelado por instabilidade do arquivo.")
+        # Evita reprocessar um arquivo cujo conteúdo (e a configuração da pasta) não
+        # mudou desde a última execução
+        root = self.root_for(pdf_path)
+        fingerprint = pipeline.pipeline_fingerprint(root)
+        st = os.stat(pdf_path)
+        content_hash = file_sha256(pdf_path)
+        if self.journal.is_up_to_date(pdf_path, content_hash, fingerprint):
+            logger.info(f"Conteúdo de {pdf_path} não mudou desde o último processamento. Ignorando.")
+            self.journal.mark_unchanged(pdf_path, st.st_mtime, st.st_size)
+            metrics.DOCUMENTS.labels("unchanged").inc()
             return
 
         logger.info(f"Arquivo estável. Iniciando processamento completo de: {pdf_path}")
-        self.processed_files[pdf_path] = time.time() # Marca como processado
+        self.journal.mark_processing(pdf_path, st.st_mtime, st.st_size, content_hash)
 
-        try:
-            # 1. Extrair texto com OCR local
-            local_text, images = local_ocr.extract_text_from_pdf(pdf_path)
+        state = pipeline.DocumentState(pdf_path, root=root)
+        if waited is not None:
+            state.timings[metrics.STAGE_STABILITY_WAIT] = waited
 
-            # 2. Chamar a API GPT-4o para obter o Markdown
-            markdown_result = gpt_vision_client.get_markdown_from_vision(local_text, images)
+        start = time.perf_counter()
+        outcome = "failed"
+        try:
+            # 1. OCR local + API, reaproveitando as páginas que não mudaram
+            markdown_result = pipeline.process_document(pdf_path, state)
 
-            # 3. Salvar o resultado em um arquivo .md
-            markdown_path = os.path.splitext(pdf_path)[0] + ".md"
-            with open(markdown_path, "w", encoding="utf-8") as f:
-                f.write(markdown_result)
+            # 2. Salvar o resultado em um arquivo .md
+            with metrics.timed(metrics.STAGE_WRITE, state.timings):
+                markdown_path = pipeline.save_markdown(pdf_path, markdown_result)
 
+            self.journal.mark_done(pdf_path, content_hash, markdown_path, fingerprint)
+            outcome = "done"
             logger.info(f"Arquivo Markdown salvo com sucesso em: {markdown_path}")
 
+        except VisionAPIError as e:
+            self.journal.mark_failed(pdf_path, str(e))
+            logger.error(f"A API não gerou o Markdown de '{pdf_path}'; o arquivo .md não foi alterado. {e}")
         except Exception as e:
+            self.journal.mark_failed(pdf_path, str(e))
             logger.error(f"Ocorreu um erro inesperado no fluxo de processamento para '{pdf_path}': {e}", exc_info=True)
+        finally:
+            metrics.observe_stage(metrics.STAGE_TOTAL, time.perf_counter() - start, state.timings)
+            metrics.log_document(pdf_path, outcome, state.timings, **pipeline.document_summary(state))
+
 
+    def _on_event(self, path: str, priority: int):
+        # Os .md (e os temporários) gravados pelo próprio serviço também geram eventos
+        # nas pastas monitoradas; descarta-os antes de qualquer outro filtro
+        if markdown_writer.is_own_write(path):
+            logger.debug(f"Evento causado pela gravação do próprio serviço ignorado: {path}")
+            return
+        self.enqueue(path, priority)
 
     def on_created(self, event):
         """Chamado quando um arquivo ou diretório é criado."""
-        self._process_file(event.src_path)
+        self._on_event(event.src_path, PRIORITY_HIGH)
 
     def on_modified(self, event):
         """Chamado quando um arquivo ou diretório é modificado."""
-        self._process_file(event.src_path)
+        self._on_event(event.src_path, PRIORITY_NORMAL)
@@ -1,59 +1,90 @@
 # gpt_vision_client.py
+import asyncio
 import base64
+import email.utils
 import io
 import logging
-from typing import List
+import math
+import random
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Union
 
 import config
-from openai import OpenAI
+import metrics
+from image_encoder import EncodedImage
+from markdown_stitcher import PAGE_MARKER
 from PIL import Image
+from response_cache import CachedResponse, ResponseCache, get_response_cache, request_key
+
+if TYPE_CHECKING:
+    # O pacote openai só é importado na primeira requisição (o import é lento)
+    from openai import APIStatusError, AsyncOpenAI
 
 logger = logging.getLogger(__name__)
 
-# Inicializa o cliente da OpenAI uma vez
-try:
-    client = OpenAI(api_key=config.OPENAI_API_KEY)
-except Exception as e:
-    logger.error(f"Falha ao inicializar o cliente da OpenAI. Verifique sua API Key. Erro: {e}")
-    client = None
+# Uma página pode ser enviada como imagem PIL, bytes PNG ou já codificada
+PageImage = Union[Image.Image, bytes, EncodedImage]
 
-def get_markdown_from_vision(local_ocr_text: str, images: List[Image.Image]) -> str:
-    """Envia o texto do OCR local e as imagens do PDF para o GPT-4 Vision e pede
-    uma versão corrigida e formatada em Markdown.
 
-    Args:
-        local_ocr_text (str): O texto preliminar extraído pelo OCR local.
-        images (List[Image.Image]): A lista de imagens das páginas do PDF.
+class VisionAPIError(Exception):
+    """Falha definitiva ao obter o Markdown da API (após esgotar as tentativas)."""
 
-    Returns:
-        str: O conteúdo em Markdown retornado pela API.
 
-    """
-    print(f"Local OCR: {local_ocr_text}")
-    if not client:
-        logger.error("Cliente da OpenAI não inicializado. Abortando requisição.")
-        return "Erro: Cliente da API não configurado."
+# O cliente da OpenAI é criado uma vez, na primeira requisição. As novas tentativas
+# são feitas por este módulo (com backoff e jitter), por isso max_retries=0 no cliente.
+_client = None
+_client_lock = threading.Lock()
 
-    logger.info("Preparando requisição para a API do GPT-5...")
 
-    # Converte imagens para base64
-    base64_images = []
-    for img in images:
-        buffered = io.BytesIO()
-        # Salva a imagem em formato PNG para manter a qualidade
-        img.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        base64_images.append(f"data:image/png;base64,{img_str}")
+def get_client() -> Optional["AsyncOpenAI"]:
+    """Devolve o cliente da API, criando-o na primeira chamada. None se falhar."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                from openai import AsyncOpenAI
 
-    # Monta o prompt
-    prompt_messages = [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": (
-                            f"""
+                _client = AsyncOpenAI(api_key=config.OPENAI_API_KEY,
+                                      base_url=config.OPENAI_BASE_URL,
+                                      timeout=config.VISION_REQUEST_TIMEOUT,
+                                      max_retries=0)
+            except Exception as e:
+                logger.error(f"Falha ao inicializar o cliente da OpenAI. Verifique sua API Key. Erro: {e}")
+                return None
+        return _client
+
+# --- Loop de eventos compartilhado ---
+# Todas as requisições rodam em um único loop asyncio, numa thread própria, para que
+# o semáforo limite as requisições em andamento do processo inteiro, quaisquer que
+# sejam as threads (ou os loops) de quem chama a API.
+_loop = None
+_semaphore = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="vision-api-loop", daemon=True)
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """O semáforo de config.VISION_MAX_CONCURRENCY, criado no primeiro uso (no loop compartilhado)."""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(config.VISION_MAX_CONCURRENCY)
+    return _semaphore
+
+
+# Prompt enviado junto com as imagens; {local_ocr_text} é o texto do OCR local
+PROMPT_TEMPLATE = """
                             Sua tarefa tem duas fases: transcrever, formatar
 
                             **FASE 1: TRANSCRIÇÃO**
@@ -82,7 +113,68 @@ def get_markdown_from_vision(local_ocr_text: str, images: List[Image.Image]) ->
                             --- INÍCIO DO TEXTO DO OCR LOCAL (APENAS PARA CONTEXTO, IGNORE SE ESTIVER ERRADO) ---
                             {local_ocr_text}
                             --- FIM DO TEXTO DO OCR LOCAL ---"""
-                    ),
+
+# Acrescentado ao prompt nas requisições com várias páginas, para separar o Markdown de cada uma
+MULTI_PAGE_TEMPLATE = """
+
+                            **VÁRIAS PÁGINAS:**
+                            As {page_count} imagens são páginas consecutivas da mesma nota, em ordem. Antes do conteúdo de cada página, escreva uma linha contendo apenas o marcador da página, exatamente assim: {first_marker}, {second_marker} e assim por diante. Se um parágrafo, lista ou tabela continuar na página seguinte, continue normalmente depois do marcador."""
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Tokens de entrada de uma imagem em alta resolução: 85 + 170 por bloco de 512x512px."""
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def estimate_request_tokens(local_ocr_text: str, images: Sequence[EncodedImage]) -> int:
+    """Estimativa dos tokens de entrada de uma requisição (prompt, texto e imagens).
+
+    Conta cerca de 4 caracteres por token de texto; as imagens devem já estar
+    codificadas, com o tamanho que chega à API.
+    """
+    text_tokens = (len(PROMPT_TEMPLATE) + len(local_ocr_text)) // 4
+    return text_tokens + sum(estimate_image_tokens(img.width, img.height) for img in images)
+
+
+def _image_data(img: PageImage) -> Tuple[bytes, str]:
+    """Os bytes codificados de uma página e o seu tipo MIME."""
+    if isinstance(img, EncodedImage):
+        return img.data, img.mime_type
+    if isinstance(img, bytes):
+        return img, "image/png"
+    buffered = io.BytesIO()
+    # Salva a imagem em formato PNG para manter a qualidade
+    img.save(buffered, format="PNG")
+    return buffered.getvalue(), "image/png"
+
+
+def _build_messages(local_ocr_text: str, images: Sequence[PageImage],
+                    page_markers: bool = False) -> list:
+    """Monta a mensagem com o prompt e as imagens codificadas em base64.
+
+    Com `page_markers`, pede à API um marcador (markdown_stitcher.PAGE_MARKER)
+    antes do conteúdo de cada página.
+    """
+    # Converte imagens para base64
+    base64_images = []
+    for data, mime_type in (_image_data(img) for img in images):
+        img_str = base64.b64encode(data).decode("utf-8")
+        base64_images.append(f"data:{mime_type};base64,{img_str}")
+    logger.debug(f"Imagens da requisição: {sum(len(url) for url in base64_images)} bytes em base64.")
+
+    # Monta o prompt
+    prompt = PROMPT_TEMPLATE.format(local_ocr_text=local_ocr_text)
+    if page_markers:
+        prompt += MULTI_PAGE_TEMPLATE.format(page_count=len(images),
+                                             first_marker=PAGE_MARKER.format(number=1),
+                                             second_marker=PAGE_MARKER.format(number=2))
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt,
                 },
                 *[
                     {"type": "image_url", "image_url": {"url": b64_img}}
@@ -92,18 +184,229 @@ def get_markdown_from_vision(local_ocr_text: str, images: List[Image.Image]) ->
         },
     ]
 
+
+def _retry_after_seconds(error: "APIStatusError") -> Optional[float]:
+    """Lê o tempo de espera sugerido pelo servidor (Retry-After), se houver."""
+    headers = error.response.headers if error.response is not None else {}
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
     try:
-        logger.info("Enviando requisição para a API. Isso pode demorar...")
-        response = client.chat.completions.create(
-            model="gpt-5",
-            messages=prompt_messages,
-            max_completion_tokens=4096,  # Aumente se suas notas forem muito longas
-            reasoning_effort="high",
-        )
-
-        markdown_content = response.choices[0].message.content
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        # Retry-After também pode vir como data HTTP
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+    if isinstance(error, (APIConnectionError, APITimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _backoff_delay(attempt: int, error: Exception) -> float:
+    """Backoff exponencial com jitter completo; respeita o Retry-After do servidor."""
+    from openai import APIStatusError
+
+    delay = random.uniform(0, min(config.VISION_BACKOFF_MAX, config.VISION_BACKOFF_BASE * (2 ** attempt)))
+    if isinstance(error, APIStatusError):
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = min(config.VISION_BACKOFF_MAX, retry_after)
+    return delay
+
+
+def _lookup_cached(cache: ResponseCache, params: Dict[str, object], prompt: str,
+                   images: Sequence[PageImage]) -> Tuple[str, Optional[CachedResponse]]:
+    """Calcula a chave da requisição e busca a resposta no cache (None se não houver)."""
+    key = request_key(config.VISION_MODEL, params, prompt, [_image_data(img)[0] for img in images])
+    try:
+        return key, cache.get(key)
+    except sqlite3.Error as e:
+        logger.warning(f"Falha ao ler o cache de respostas: {e}")
+        return key, None
+
+
+def _store_cached(cache: ResponseCache, key: str, markdown: str, usage: Dict[str, int]):
+    try:
+        cache.put(key, config.VISION_MODEL, markdown, usage)
+    except sqlite3.Error as e:
+        logger.warning(f"Falha ao gravar no cache de respostas: {e}")
+
+
+async def get_markdown_from_vision_async(local_ocr_text: str,
+                                         images: Sequence[PageImage],
+                                         usage: Dict[str, int] = None,
+                                         page_markers: bool = False) -> str:
+    """Versão assíncrona de `get_markdown_from_vision`.
+
+    Pode ser aguardada em qualquer loop: a requisição roda no loop compartilhado,
+    dentro do limite de config.VISION_MAX_CONCURRENCY do processo.
+
+    Uma requisição idêntica a outra já respondida (mesmo modelo, parâmetros, prompt
+    e imagens) é servida pelo response_cache, sem chamar a API.
+
+    Args:
+        usage: Se informado, recebe a soma dos tokens usados (prompt, completion, reasoning).
+        page_markers: Pede um marcador antes do conteúdo de cada página (ver `_build_messages`).
+
+    Raises:
+        VisionAPIError: Se a API falhar após todas as tentativas ou não devolver conteúdo.
+
+    """
+    shared_loop = _get_loop()
+    request = _request_markdown(local_ocr_text, images, usage, page_markers)
+    if asyncio.get_running_loop() is shared_loop:
+        return await request
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(request, shared_loop))
+
+
+async def _request_markdown(local_ocr_text: str, images: Sequence[PageImage],
+                            usage: Optional[Dict[str, int]], page_markers: bool) -> str:
+    """A requisição de `get_markdown_from_vision_async`, já no loop compartilhado."""
+    logger.debug(f"Local OCR: {local_ocr_text}")
+    prompt_messages = _build_messages(local_ocr_text, images, page_markers)
+    # O limite de resposta cresce com o número de páginas, para notas longas não serem cortadas
+    max_completion_tokens = config.VISION_MAX_COMPLETION_TOKENS * max(1, len(images))
+    params = {"max_completion_tokens": max_completion_tokens, "reasoning_effort": "high"}
+
+    # Uma requisição idêntica já respondida não vai de novo à API (nem precisa da API Key).
+    # O hash das imagens e o SQLite rodam fora do loop, que é compartilhado por todas as threads.
+    loop = asyncio.get_running_loop()
+    cache = get_response_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key, cached = await loop.run_in_executor(
+            None, _lookup_cached, cache, params, prompt_messages[0]["content"][0]["text"], images)
+        if cached is not None:
+            metrics.VISION_CACHE.labels("hit").inc()
+            for kind, count in cached.usage.items():
+                metrics.VISION_CACHE_SAVED_TOKENS.labels(kind).inc(count)
+            logger.info(f"Resposta servida pelo cache ({len(images)} página(s)); nenhuma requisição à API.")
+            return cached.markdown
+        metrics.VISION_CACHE.labels("miss").inc()
+
+    client = get_client()
+    if not client:
+        raise VisionAPIError("Cliente da API não configurado.")
+
+    attempt = 0
+    start = time.perf_counter()
+    while True:
+        try:
+            async with _get_semaphore():
+                logger.info("Enviando requisição para a API. Isso pode demorar...")
+                response = await client.chat.completions.create(
+                    model=config.VISION_MODEL,
+                    messages=prompt_messages,
+                    **params,
+                )
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= config.VISION_MAX_RETRIES:
+                metrics.API_REQUESTS.labels("error").inc()
+                raise VisionAPIError(f"Erro ao chamar a API de visão: {e}") from e
+            delay = _backoff_delay(attempt, e)
+            attempt += 1
+            metrics.API_RETRIES.inc()
+            logger.warning(f"Erro temporário na API ({e}). Tentativa {attempt}/{config.VISION_MAX_RETRIES} em {delay:.1f}s.")
+            await asyncio.sleep(delay)
+            continue
+
+        metrics.API_REQUEST_SECONDS.observe(time.perf_counter() - start)
+        response_usage = {}
+        metrics.record_usage(response.usage, response_usage)
+        if usage is not None:
+            for kind, count in response_usage.items():
+                usage[kind] = usage.get(kind, 0) + count
+
+        choice = response.choices[0]
+        markdown_content = choice.message.content
+        if not markdown_content:
+            metrics.API_REQUESTS.labels("empty").inc()
+            raise VisionAPIError(f"A API não retornou conteúdo (finish_reason={choice.finish_reason}).")
+
+        if choice.finish_reason == "length":
+            logger.warning(f"Resposta da API cortada no limite de {max_completion_tokens} tokens "
+                           f"({len(images)} página(s)).")
+        elif cache is not None:
+            # Respostas cortadas não vão para o cache: a próxima tentativa pode dar certo
+            await loop.run_in_executor(None, _store_cached, cache, cache_key, markdown_content, response_usage)
+        metrics.API_REQUESTS.labels("ok").inc()
         logger.info("Resposta recebida com sucesso da API.")
         return markdown_content
-    except Exception as e:
-        logger.error(f"Erro ao chamar a API do GPT-4 Vision: {e}", exc_info=True)
-        return f"## Erro na API\n\nOcorreu um erro ao processar a nota: {e}"
+
+
+def get_markdown_from_vision(local_ocr_text: str, images: List[PageImage]) -> str:
+    """Envia o texto do OCR local e as imagens do PDF ao modelo de visão
+    (config.VISION_MODEL) e pede uma versão corrigida e formatada em Markdown.
+
+    Args:
+        local_ocr_text (str): O texto preliminar extraído pelo OCR local.
+        images (List[PageImage]): As páginas do PDF, como imagens, bytes PNG ou
+            já codificadas por image_encoder.
+
+    Returns:
+        str: O conteúdo em Markdown retornado pela API.
+
+    Raises:
+        VisionAPIError: Se a API falhar após todas as tentativas.
+
+    """
+    logger.info(f"Preparando requisição para a API ({config.VISION_MODEL})...")
+    future = asyncio.run_coroutine_threadsafe(get_markdown_from_vision_async(local_ocr_text, images), _get_loop())
+    return future.result()
+
+
+def get_markdown_for_pages(requests: Sequence[Tuple[str, List[PageImage]]],
+                           latencies: List[float] = None,
+                           usage: Dict[str, int] = None,
+                           page_markers: bool = False) -> List[Union[str, VisionAPIError]]:
+    """Envia várias requisições em paralelo, respeitando config.VISION_MAX_CONCURRENCY.
+
+    Args:
+        requests: Pares (texto do OCR local, imagens) de cada requisição.
+        page_markers: Nas requisições com mais de uma imagem, pede um marcador antes
+            do conteúdo de cada página, para separá-las com markdown_stitcher.split_pages.
+        latencies: Se informada, recebe a duração (s) de cada requisição bem-sucedida,
+            incluindo as novas tentativas.
+        usage: Se informado, recebe a soma dos tokens usados em todas as requisições.
+
+    Returns:
+        List[Union[str, VisionAPIError]]: O Markdown de cada requisição, na mesma ordem,
+            ou o erro, para quem chama decidir o que fazer com as que falharam. Outras
+            falhas (ex.: do cache de respostas) também chegam como VisionAPIError.
+
+    """
+    async def _timed(text, imgs):
+        start = time.perf_counter()
+        try:
+            markdown = await get_markdown_from_vision_async(text, imgs, usage, page_markers and len(imgs) > 1)
+        except VisionAPIError:
+            raise
+        except Exception as e:
+            raise VisionAPIError(f"Erro ao preparar a requisição: {e}") from e
+        if latencies is not None:
+            latencies.append(time.perf_counter() - start)
+        return markdown
+
+    async def _gather():
+        return await asyncio.gather(*(_timed(text, imgs) for text, imgs in requests),
+                                    return_exceptions=True)
+
+    logger.info(f"Preparando {len(requests)} requisição(ões) para a API ({config.VISION_MODEL})...")
+    return asyncio.run_coroutine_threadsafe(_gather(), _get_loop()).result()
@@ -0,0 +1,80 @@
+# image_encoder.py
+import io
+import logging
+from typing import NamedTuple
+
+import config
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class EncodeSettings(NamedTuple):
+    """Parâmetros de codificação das imagens enviadas à API."""
+
+    max_long_edge: int
+    max_short_edge: int
+    mode: str
+    image_format: str
+    quality: int
+    send_binarized: bool
+
+
+class EncodedImage(NamedTuple):
+    """Uma página já codificada, pronta para ir no corpo da requisição."""
+
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+
+
+def encode_settings_from_config() -> EncodeSettings:
+    """Monta os parâmetros de codificação a partir dos valores atuais do config."""
+    return EncodeSettings(config.VISION_IMAGE_MAX_LONG_EDGE,
+                          config.VISION_IMAGE_MAX_SHORT_EDGE,
+                          config.VISION_IMAGE_MODE,
+                          config.VISION_IMAGE_FORMAT.upper(),
+                          config.VISION_IMAGE_QUALITY,
+                          config.VISION_SEND_BINARIZED)
+
+
+def _target_size(width: int, height: int, settings: EncodeSettings):
+    """Reproduz o redimensionamento feito pela API (maior lado, depois menor lado),
+    para não enviar pixels que seriam descartados.
+    """
+    scale = min(1.0,
+                settings.max_long_edge / max(width, height),
+                settings.max_short_edge / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def encode_image(img: Image.Image, settings: EncodeSettings) -> EncodedImage:
+    """Redimensiona, converte (cor, cinza ou preto e branco) e comprime uma página."""
+    if settings.mode in ("L", "1"):
+        img = img.convert("L")
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+
+    size = _target_size(img.width, img.height, settings)
+    if size != img.size:
+        img = img.resize(size, Image.LANCZOS)
+
+    if settings.mode == "1":
+        # Limiar simples, sem dithering: o traço manuscrito fica nítido
+        img = img.convert("1", dither=Image.Dither.NONE)
+        if settings.image_format != "PNG":
+            # JPEG e WebP não têm modo de 1 bit
+            img = img.convert("L")
+
+    save_kwargs = {}
+    if settings.image_format in ("JPEG", "WEBP"):
+        save_kwargs["quality"] = settings.quality
+    else:
+        save_kwargs["optimize"] = True
+
+    buffered = io.BytesIO()
+    img.save(buffered, format=settings.image_format, **save_kwargs)
+    return EncodedImage(buffered.getvalue(), _MIME_TYPES[settings.image_format], img.width, img.height)
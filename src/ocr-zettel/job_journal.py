@@ -0,0 +1,157 @@
+# job_journal.py
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Etapas registradas para cada arquivo
+STAGE_PROCESSING = "processing"
+STAGE_DONE = "done"
+STAGE_FAILED = "failed"
+
+
+class JournalEntry(NamedTuple):
+    path: str
+    mtime: float
+    size: int
+    content_hash: Optional[str]
+    stage: str
+    output_path: Optional[str]
+    last_success_hash: Optional[str]
+    error: Optional[str]
+    updated_at: float
+    # Configuração do pipeline (pipeline.pipeline_fingerprint) da última execução bem-sucedida
+    fingerprint: Optional[str]
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Calcula o SHA-256 do conteúdo de um arquivo."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class JobJournal:
+    """Registro persistente (SQLite) do estado de processamento de cada PDF.
+
+    Permite que, depois de reiniciar, o serviço processe apenas os arquivos que
+    mudaram desde a última execução bem-sucedida.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                       path TEXT PRIMARY KEY,
+                       mtime REAL NOT NULL,
+                       size INTEGER NOT NULL,
+                       content_hash TEXT,
+                       stage TEXT NOT NULL,
+                       output_path TEXT,
+                       last_success_hash TEXT,
+                       error TEXT,
+                       updated_at REAL NOT NULL,
+                       fingerprint TEXT
+                   )""",
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+            if "fingerprint" not in columns:
+                self._conn.execute("ALTER TABLE files ADD COLUMN fingerprint TEXT")
+        logger.info(f"Journal de jobs em: {db_path}")
+
+    def get(self, path: str) -> Optional[JournalEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JournalEntry._fields)} FROM files WHERE path = ?", (path,),
+            ).fetchone()
+        return JournalEntry(*row) if row else None
+
+    def _update(self, path: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE files SET {assignments} WHERE path = ?",
+                               (*fields.values(), path))
+
+    def mark_processing(self, path: str, mtime: float, size: int, content_hash: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO files (path, mtime, size, content_hash, stage, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime,
+                                                  size = excluded.size,
+                                                  content_hash = excluded.content_hash,
+                                                  stage = excluded.stage,
+                                                  error = NULL,
+                                                  updated_at = excluded.updated_at""",
+                (path, mtime, size, content_hash, STAGE_PROCESSING, time.time()),
+            )
+
+    def mark_done(self, path: str, content_hash: str, output_path: str, fingerprint: str = None):
+        self._update(path, stage=STAGE_DONE, last_success_hash=content_hash,
+                     output_path=output_path, error=None, fingerprint=fingerprint)
+
+    def mark_failed(self, path: str, error: str):
+        self._update(path, stage=STAGE_FAILED, error=error)
+
+    def mark_unchanged(self, path: str, mtime: float, size: int):
+        """Registra que o conteúdo de `path` é o da última execução bem-sucedida."""
+        self._update(path, mtime=mtime, size=size, stage=STAGE_DONE, error=None)
+
+    @staticmethod
+    def _same_pipeline(entry: JournalEntry, fingerprint: Optional[str]) -> bool:
+        # Registros anteriores ao fingerprint contam como feitos com a configuração atual
+        return fingerprint is None or entry.fingerprint is None or entry.fingerprint == fingerprint
+
+    def is_up_to_date(self, path: str, content_hash: str, fingerprint: str = None) -> bool:
+        """Indica se `content_hash` já foi processado com sucesso, com a configuração
+        `fingerprint` do pipeline, e o .md ainda existe.
+        """
+        entry = self.get(path)
+        return (entry is not None
+                and entry.last_success_hash == content_hash
+                and self._same_pipeline(entry, fingerprint)
+                and entry.output_path is not None
+                and os.path.exists(entry.output_path))
+
+    def needs_processing(self, path: str, markdown_path: str = None, fingerprint: str = None) -> bool:
+        """Indica se `path` mudou desde a última execução bem-sucedida.
+
+        Compara primeiro mtime e tamanho; o hash do conteúdo só é calculado
+        quando eles diferem do que foi registrado. Com `fingerprint`, um PDF
+        processado com outra configuração do pipeline (modelo, crop, backend)
+        também precisa ser refeito. Um PDF sem registro (o journal é mais novo
+        que o arquivo) está em dia se `markdown_path` existir e não for mais
+        antigo que ele.
+        """
+        st = os.stat(path)
+        entry = self.get(path)
+        if entry is None:
+            return not (markdown_path is not None and os.path.exists(markdown_path)
+                        and os.path.getmtime(markdown_path) >= st.st_mtime)
+        if entry.last_success_hash is None or not self._same_pipeline(entry, fingerprint):
+            return True
+        if entry.output_path is None or not os.path.exists(entry.output_path):
+            return True
+        if entry.stage == STAGE_DONE and entry.mtime == st.st_mtime and entry.size == st.st_size:
+            return False
+
+        if file_sha256(path) == entry.last_success_hash:
+            self.mark_unchanged(path, st.st_mtime, st.st_size)
+            return False
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,303 @@
+# job_queue.py
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Prioridades dos jobs: valores menores são processados primeiro
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class Job(NamedTuple):
+    path: str
+    priority: int
+
+
+class JobQueue:
+    """Fila de arquivos a processar, ordenada por prioridade.
+
+    Eventos repetidos para o mesmo arquivo são agrupados em um único job. Se o
+    arquivo já estiver sendo processado, ele volta para a fila quando o
+    processamento atual terminar.
+
+    Os jobs podem ser separados em grupos (as pastas monitoradas, via `group_of`).
+    Entre grupos com jobs da mesma prioridade, o próximo job é do grupo que menos
+    recebeu até agora, proporcionalmente ao seu peso (`weights`, padrão 1): uma
+    pasta com centenas de notas atrasadas não impede as outras de andar.
+    """
+
+    def __init__(self, group_of: Callable[[str], str] = None, weights: Dict[str, float] = None):
+        self._cond = threading.Condition()
+        self._group_of = group_of or (lambda path: "")
+        self._weights = weights or {}
+        # Um heap por grupo e o serviço já recebido por cada um (jobs / peso)
+        self._heaps: Dict[str, list] = {}
+        self._served: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self._queued: Dict[str, tuple] = {}
+        self._running = set()
+        self._rerun: Dict[str, int] = {}
+        self._closed = False
+        self._drain = True
+
+    def _push(self, path: str, priority: int):
+        """Enfileira `path` no heap do seu grupo (com o lock adquirido)."""
+        group = self._group_of(path)
+        heap = self._heaps.setdefault(group, [])
+        if not self._has_jobs(group):
+            # Um grupo que volta a ter jobs não acumula crédito pelo tempo parado
+            active = [served for g, served in self._served.items() if g != group and self._has_jobs(g)]
+            self._served[group] = max(self._served.get(group, 0.0), min(active, default=0.0))
+        entry = (priority, next(self._seq))
+        self._queued[path] = entry
+        heapq.heappush(heap, (*entry, path))
+        self._cond.notify()
+
+    def _has_jobs(self, group: str) -> bool:
+        """Descarta as entradas substituídas do topo do heap e diz se ainda há jobs."""
+        heap = self._heaps.get(group)
+        while heap and self._queued.get(heap[0][2]) != heap[0][:2]:
+            heapq.heappop(heap)
+        return bool(heap)
+
+    def _pop(self) -> Optional[Job]:
+        """Retira o próximo job: a maior prioridade e, no empate, o grupo menos servido."""
+        best = None
+        for group in self._heaps:
+            if not self._has_jobs(group):
+                continue
+            priority, seq, _ = self._heaps[group][0]
+            rank = (priority, self._served.get(group, 0.0), seq)
+            if best is None or rank < best[0]:
+                best = (rank, group)
+        if best is None:
+            return None
+        group = best[1]
+        priority, _, path = heapq.heappop(self._heaps[group])
+        self._served[group] = self._served.get(group, 0.0) + 1.0 / self._weights.get(group, 1.0)
+        del self._queued[path]
+        self._running.add(path)
+        return Job(path, priority)
+
+    def put(self, path: str, priority: int = PRIORITY_NORMAL) -> bool:
+        """Enfileira um arquivo. Retorna False se a fila já foi fechada."""
+        with self._cond:
+            if self._closed:
+                return False
+            if path in self._running:
+                self._rerun[path] = min(priority, self._rerun.get(path, priority))
+                return True
+            current = self._queued.get(path)
+            if current and current[0] <= priority:
+                return True
+            self._push(path, priority)
+            return True
+
+    def get(self) -> Optional[Job]:
+        """Bloqueia até haver um job. Retorna None quando a fila for fechada."""
+        with self._cond:
+            while True:
+                if self._closed and not self._drain:
+                    return None
+                job = self._pop()
+                if job is not None:
+                    return job
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+    def task_done(self, path: str):
+        """Marca o processamento de `path` como concluído."""
+        with self._cond:
+            self._running.discard(path)
+            priority = self._rerun.pop(path, None)
+            if priority is not None:
+                self._push(path, priority)
+
+    def close(self, drain: bool = True):
+        """Impede novos jobs. Com `drain`, os workers ainda esvaziam a fila."""
+        with self._cond:
+            self._closed = True
+            self._drain = drain
+            self._cond.notify_all()
+
+    def pending(self) -> List[Job]:
+        """Jobs que ainda não foram processados, em ordem de prioridade."""
+        with self._cond:
+            jobs = {path: entry[0] for path, entry in self._queued.items()}
+            for path, priority in self._rerun.items():
+                jobs[path] = min(priority, jobs.get(path, priority))
+            return sorted((Job(path, priority) for path, priority in jobs.items()),
+                          key=lambda job: job.priority)
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._queued)
+
+
+class _WatchState:
+    __slots__ = ("signature", "stable_count", "priority", "since")
+
+    def __init__(self, priority: int):
+        self.signature = None
+        self.stable_count = 0
+        self.priority = priority
+        self.since = time.monotonic()
+
+
+class StabilityMonitor:
+    """Verifica, sem bloquear quem chama, se um arquivo parou de ser modificado.
+
+    Cada arquivo é conferido a cada `interval` segundos por uma única thread; quando
+    tamanho e data de modificação ficam iguais por `required_checks` verificações
+    seguidas, `on_stable(path, priority, waited)` é chamado, com o tempo (s) desde
+    o primeiro evento.
+    """
+
+    def __init__(self, on_stable: Callable[[str, int, float], None],
+                 interval: float = 1.0, required_checks: int = 3):
+        self._on_stable = on_stable
+        self._interval = interval
+        self._required_checks = required_checks
+        self._cond = threading.Condition()
+        self._heap = []
+        self._watched: Dict[str, _WatchState] = {}
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="stability-monitor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def watch(self, path: str, priority: int = PRIORITY_NORMAL):
+        """Começa (ou reinicia) a verificação de estabilidade de `path`."""
+        with self._cond:
+            if self._stopped:
+                return
+            state = self._watched.get(path)
+            if state:
+                # Novo evento: o arquivo mudou, a contagem recomeça
+                state.stable_count = 0
+                state.priority = min(state.priority, priority)
+                return
+            logger.info(f"Verificando estabilidade do arquivo: {path}")
+            self._watched[path] = _WatchState(priority)
+            heapq.heappush(self._heap, (time.monotonic() + self._interval, path))
+            self._cond.notify()
+
+    def stop(self) -> List[Job]:
+        """Para a thread e devolve os arquivos que ainda estavam em verificação."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+        return [Job(path, state.priority) for path, state in self._watched.items()]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                _, path = heapq.heappop(self._heap)
+
+            stable, state = self._check(path)
+
+            with self._cond:
+                if state is None or self._stopped:
+                    continue
+                if stable:
+                    del self._watched[path]
+                else:
+                    heapq.heappush(self._heap, (time.monotonic() + self._interval, path))
+                    continue
+
+            logger.info(f"Arquivo está estável: {path}")
+            self._on_stable(path, state.priority, time.monotonic() - state.since)
+
+    def _check(self, path: str):
+        with self._cond:
+            state = self._watched.get(path)
+        if state is None:
+            return False, None
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            logger.warning(f"Arquivo {path} desapareceu durante verificação. Cancelando.")
+            with self._cond:
+                self._watched.pop(path, None)
+            return False, None
+
+        signature = (st.st_size, st.st_mtime_ns)
+        with self._cond:
+            if st.st_size == 0:
+                logger.debug(f"Arquivo {path} ainda está com 0 bytes. Aguardando...")
+                state.stable_count = 0
+            elif signature == state.signature:
+                state.stable_count += 1
+            else:
+                state.signature = signature
+                state.stable_count = 0
+            return state.stable_count >= self._required_checks, state
+
+
+class WorkerPool:
+    """Threads que consomem a fila e executam `handler(path)` para cada job."""
+
+    def __init__(self, job_queue: JobQueue, handler: Callable[[str], None], workers: int):
+        self._queue = job_queue
+        self._handler = handler
+        self._threads = [threading.Thread(target=self._run, name=f"job-worker-{i+1}", daemon=True)
+                         for i in range(max(1, workers))]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"{len(self._threads)} worker(s) de processamento iniciados.")
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                self._handler(job.path)
+            except Exception as e:
+                logger.error(f"Erro inesperado no job '{job.path}': {e}", exc_info=True)
+            finally:
+                self._queue.task_done(job.path)
+
+
+def save_pending(path: str, jobs: List[Job]):
+    """Grava os jobs pendentes para serem retomados na próxima execução."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([job._asdict() for job in jobs], f, ensure_ascii=False, indent=2)
+
+
+def load_pending(path: str) -> List[Job]:
+    """Lê (e remove) os jobs pendentes gravados por `save_pending`."""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, encoding="utf-8") as f:
+            jobs = [Job(item["path"], item["priority"]) for item in json.load(f)]
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Não foi possível ler os jobs pendentes de {path}: {e}")
+        jobs = []
+    os.remove(path)
+    return jobs
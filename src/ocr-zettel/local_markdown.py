@@ -0,0 +1,88 @@
+# local_markdown.py
+"""Formatação em Markdown do texto do OCR local, sem a API.
+
+Usada nas páginas em que o TrOCR tem confiança alta: o texto já está correto, só
+falta a estrutura. As regras seguem o prompt da API, de forma simplificada:
+- `tag: carreira` vira `#carreira`;
+- linhas começando com marcadores (-, *, •) ou números (1., 2)) viram listas;
+- o título da nota e linhas curtas em maiúsculas viram títulos.
+"""
+import re
+from typing import List, Tuple
+
+# Linhas que o OCR local marca como vazias
+_EMPTY_LINE_RE = re.compile(r"^\[Nenhum texto detectado na linha \d+, página \d+\]$")
+_TAG_RE = re.compile(r"^\s*tags?\s*[:\-]\s*(.+)$", re.IGNORECASE)
+_HEADING_RE = re.compile(r"^\s*(#{1,6})\s+(.+)$")
+_BULLET_RE = re.compile(r"^\s*[-*•·–—]\s+(.+)$")
+_NUMBERED_RE = re.compile(r"^\s*(\d{1,2})[.)]\s+(.+)$")
+# Títulos são curtos e não terminam como frase
+_MAX_HEADING_WORDS = 8
+_SENTENCE_END = tuple(".,;!?")
+
+
+def _tags(value: str) -> str:
+    """`carreira, gestão de tempo` -> `#carreira #gestão-de-tempo`."""
+    names = [re.sub(r"\s+", "-", name.strip().lstrip("#")) for name in re.split(r"[,;]", value)]
+    return " ".join(f"#{name.lower()}" for name in names if name)
+
+
+def _looks_like_heading(line: str) -> bool:
+    return len(line.split()) <= _MAX_HEADING_WORDS and not line.endswith(_SENTENCE_END)
+
+
+def _is_caps_heading(line: str) -> bool:
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 3 and all(c.isupper() for c in letters) and _looks_like_heading(line)
+
+
+def _format_line(line: str) -> Tuple[str, str]:
+    """Formata uma linha e devolve (tipo, Markdown); tipo é heading, list, tags ou text."""
+    if match := _TAG_RE.match(line):
+        return "tags", _tags(match.group(1))
+    if match := _HEADING_RE.match(line):
+        return "heading", f"{match.group(1)} {match.group(2).strip()}"
+    if match := _NUMBERED_RE.match(line):
+        return "list", f"{match.group(1)}. {match.group(2).strip()}"
+    if match := _BULLET_RE.match(line):
+        return "list", f"- {match.group(1).strip()}"
+    if _is_caps_heading(line):
+        return "heading", f"## {line}"
+    return "text", line
+
+
+def _text_lines(text: str) -> List[str]:
+    """As linhas reconhecidas, sem as vazias e as marcadas como sem texto pelo OCR local."""
+    lines = [line.strip() for line in text.splitlines()]
+    return [line for line in lines if line and not _EMPTY_LINE_RE.match(line)]
+
+
+def has_text(text: str) -> bool:
+    """Indica se o OCR local reconheceu alguma linha com texto na página."""
+    return bool(_text_lines(text))
+
+
+def format_page(text: str, first_page: bool = False) -> str:
+    """Converte o texto de uma página (uma linha do OCR por linha) em Markdown.
+
+    Args:
+        text (str): O texto da página, como devolvido por local_ocr.extract_text_from_pages.
+        first_page (bool): Se é a primeira página da nota; a primeira linha dela,
+            se for curta, vira o título (`#`).
+
+    """
+    lines = _text_lines(text)
+
+    blocks: List[List[str]] = []
+    previous_kind = None
+    for i, line in enumerate(lines):
+        kind, markdown = _format_line(line)
+        if i == 0 and first_page and kind == "text" and _looks_like_heading(line):
+            kind, markdown = "heading", f"# {line}"
+        # Linhas seguidas do mesmo tipo (parágrafo, lista) ficam no mesmo bloco
+        if kind in ("text", "list") and kind == previous_kind:
+            blocks[-1].append(markdown)
+        else:
+            blocks.append([markdown])
+        previous_kind = kind
+    return "\n\n".join("\n".join(block) for block in blocks)
@@ -1,103 +1,305 @@
 # local_ocr.py
 import logging
-from typing import List
+import math
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 import config
-import torch
-from pdf_processor import (preprocess_page, process_pdf_to_images,
-                           segment_blocks_and_lines)
+import metrics
+from image_encoder import EncodedImage
+from ocr_backends import load_backend
+from pdf_processor import iter_pdf_pages
 from PIL import Image
-from spellchecker import SpellChecker
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+from spell_correction import get_corrector
 
 logger = logging.getLogger(__name__)
 
 
-spell = SpellChecker(language="pt")
-
 # --- Inicialização do Motor TrOCR ---
-# Carregamos o modelo e o processador uma única vez para evitar recarregá-los
-# a cada arquivo processado. Isso pode consumir uma quantidade significativa de RAM.
-try:
-    logger.info("Inicializando o motor TrOCR da Microsoft (pode demorar na primeira vez)...")
+# O modelo e o processador são carregados no primeiro uso (ou pelo warm-up) e uma
+# única vez por modelo, para não atrasar o import deste módulo nem recarregá-los a
+# cada arquivo processado. Isso pode consumir uma quantidade significativa de RAM.
+class OCREngine(NamedTuple):
+    """Processador e backend de um modelo TrOCR carregado."""
+
+    processor: object
+    backend: object
+
+
+_engines: Dict[str, Optional[OCREngine]] = {}
+_engines_lock = threading.Lock()
 
-    # Verifica se há uma GPU disponível e a define como dispositivo principal
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    logger.info(f"TrOCR usará o dispositivo: {device.type}")
 
-    # O processador prepara a imagem para o modelo (redimensiona, normaliza, etc.)
-    processor = TrOCRProcessor.from_pretrained(config.FINAL_MODEL_PATH)
+def _normalize(model_path: str) -> str:
+    return os.path.normpath(os.path.expanduser(model_path))
 
-    # O modelo é a rede neural que faz a "leitura" da imagem
-    model = VisionEncoderDecoderModel.from_pretrained(config.FINAL_MODEL_PATH).to(device)
 
-    logger.info("Motor TrOCR inicializado com sucesso.")
+def _load_engine(model_path: str) -> Optional[OCREngine]:
+    try:
+        logger.info(f"Inicializando o motor TrOCR (backend: {config.OCR_BACKEND}, pode demorar na primeira vez)...")
+        from transformers import TrOCRProcessor
+
+        # O processador prepara a imagem para o modelo (redimensiona, normaliza, etc.)
+        start = time.perf_counter()
+        processor = TrOCRProcessor.from_pretrained(model_path)
+        logger.info(f"Processador do TrOCR carregado em {time.perf_counter() - start:.1f}s.")
 
-except Exception as e:
-    logger.error(f"Falha ao inicializar o motor TrOCR. Verifique a instalação do PyTorch e transformers. Erro: {e}", exc_info=True)
-    processor = None
-    model = None
-    device = "cpu"
+        # O backend é quem executa a rede neural que faz a "leitura" da imagem
+        start = time.perf_counter()
+        onnx_dir = config.ONNX_MODEL_DIR if model_path == _normalize(config.FINAL_MODEL_PATH) else None
+        backend = load_backend(config.OCR_BACKEND,
+                               model_path,
+                               onnx_dir=onnx_dir,
+                               quantized=config.ONNX_QUANTIZE,
+                               num_beams=config.OCR_NUM_BEAMS,
+                               num_threads=config.ONNX_NUM_THREADS)
+        logger.info(f"Modelo do TrOCR carregado em {time.perf_counter() - start:.1f}s.")
+
+        logger.info("Motor TrOCR inicializado com sucesso.")
+        return OCREngine(processor, backend)
+
+    except Exception as e:
+        logger.error(f"Falha ao inicializar o motor TrOCR. Verifique a instalação do backend '{config.OCR_BACKEND}'. Erro: {e}", exc_info=True)
+        return None
+
+
+def get_engine(model_path: str = None) -> Optional[OCREngine]:
+    """Devolve o motor TrOCR de `model_path` (padrão: config.FINAL_MODEL_PATH),
+    carregando-o na primeira chamada. Retorna None se o carregamento falhar.
+
+    Caminhos que diferem só na forma (`~`, barra no fim) usam o mesmo motor.
+    """
+    model_path = _normalize(model_path or config.FINAL_MODEL_PATH)
+    with _engines_lock:
+        if model_path not in _engines:
+            _engines[model_path] = _load_engine(model_path)
+        return _engines[model_path]
+
+
+def warmup(run_inference: bool = False, model_paths: List[str] = None):
+    """Carrega o TrOCR e o corretor ortográfico antes da primeira nota chegar.
+
+    Com `run_inference`, executa também uma inferência com uma linha em branco,
+    para que a primeira nota não pague a inicialização preguiçosa do backend.
+    `model_paths` lista os modelos a carregar (padrão: config.FINAL_MODEL_PATH).
+    """
+    start = time.perf_counter()
+    engines = [get_engine(model_path) for model_path in dict.fromkeys(model_paths or [None])]
+
+    spell_start = time.perf_counter()
+    get_corrector()
+    logger.info(f"Corretor ortográfico carregado em {time.perf_counter() - spell_start:.1f}s.")
+
+    for engine in engines:
+        if run_inference and engine:
+            inference_start = time.perf_counter()
+            recognize_lines([Image.new("RGB", (384, 64), "white")], engine=engine)
+            logger.info(f"Inferência de aquecimento concluída em {time.perf_counter() - inference_start:.1f}s.")
+
+    logger.info(f"Warm-up do OCR local concluído em {time.perf_counter() - start:.1f}s.")
+
+
+def start_warmup(run_inference: bool = False, model_paths: List[str] = None) -> threading.Thread:
+    """Executa `warmup` em uma thread de fundo."""
+    thread = threading.Thread(target=warmup, args=(run_inference, model_paths), name="ocr-warmup", daemon=True)
+    thread.start()
+    return thread
 
 
 def clean_text(text: str) -> str:
     """Corrige palavras do texto usando spell checker em português."""
-    words = text.split()
-    corrected = [spell.correction(w) if w not in spell else w for w in words]
-    corrected_filtered = " ".join([s for s in corrected  if s is not None])
-    return " ".join(corrected_filtered)
+    return get_corrector().correct(text)
+
+def _build_batches(images: List[Image.Image],
+                   max_batch_size: int,
+                   max_preprocess_pixels: int) -> List[List[int]]:
+    """Agrupa os índices das linhas em lotes, ordenados pela largura do recorte.
+
+    O processador do TrOCR redimensiona todas as linhas para o mesmo tamanho, então
+    agrupar por largura serve para juntar linhas de comprimento parecido: o generate
+    de um lote só termina quando a sequência mais longa termina.
+
+    `max_batch_size` limita o tensor do modelo; `max_preprocess_pixels` limita a
+    soma dos recortes originais, que o processador converte para RGB antes de
+    redimensionar.
+    """
+    order = sorted(range(len(images)), key=lambda i: images[i].width)
+
+    batches = []
+    current = []
+    current_pixels = 0
+    for idx in order:
+        width, height = images[idx].size
+        pixels = width * height
+        if current and (len(current) >= max_batch_size or current_pixels + pixels > max_preprocess_pixels):
+            batches.append(current)
+            current = []
+            current_pixels = 0
+        current.append(idx)
+        current_pixels += pixels
+    if current:
+        batches.append(current)
+    return batches
+
+def recognize_lines(images: List[Image.Image],
+                    max_batch_size: int = None,
+                    max_preprocess_pixels: int = None,
+                    engine: OCREngine = None,
+                    confidences: List[float] = None) -> List[str]:
+    """Executa o TrOCR em lote sobre as imagens de linha.
+
+    Args:
+        confidences (List[float]): Se informada, recebe a confiança de cada linha
+            (a probabilidade média dos tokens gerados, entre 0 e 1), na ordem de `images`.
+
+    Returns:
+        List[str]: O texto bruto de cada linha, na mesma ordem de `images`.
+
+    """
+    processor, backend = engine or get_engine()
+    max_batch_size = max_batch_size or config.TROCR_BATCH_SIZE
+    max_preprocess_pixels = max_preprocess_pixels or config.TROCR_MAX_PREPROCESS_PIXELS
+
+    texts = [""] * len(images)
+    line_confidences = [0.0] * len(images)
+    batches = _build_batches(images, max_batch_size, max_preprocess_pixels)
+    logger.info(f"TrOCR: {len(images)} linha(s) divididas em {len(batches)} lote(s).")
+
+    for batch in batches:
+        # O TrOCR espera imagens no formato RGB
+        batch_imgs = [images[i] if images[i].mode == "RGB" else images[i].convert("RGB") for i in batch]
+
+        # Prepara as imagens usando o processador
+        pixel_values = processor(images=batch_imgs, return_tensors="np").pixel_values
+
+        # Gera os IDs dos tokens a partir dos pixels das imagens
+        if confidences is None:
+            generated_ids = backend.generate(pixel_values)
+        else:
+            generated_ids, log_probs = backend.generate_with_scores(pixel_values)
+            for i, log_prob in zip(batch, log_probs.tolist()):
+                line_confidences[i] = math.exp(log_prob)
+
+        # Decodifica os IDs dos tokens para texto legível
+        decoded = processor.batch_decode(generated_ids, skip_special_tokens=True)
+        for i, text in zip(batch, decoded):
+            texts[i] = text
+
+    if confidences is not None:
+        # Linhas em que nada foi reconhecido não contam como confiáveis
+        confidences.extend(confidence if text else 0.0 for text, confidence in zip(texts, line_confidences))
+    return texts
+
+def _format_lines(texts: List[str], page_number: int) -> str:
+    """Aplica a correção ortográfica e monta o texto de uma página."""
+    # Corrige todas as linhas da página de uma vez
+    cleaned_texts = get_corrector().correct_lines(texts)
+    all_lines_text = []
+    for i, (generated_text, cleaned_text) in enumerate(zip(texts, cleaned_texts)):
+        if generated_text:
+            all_lines_text.append(cleaned_text)
+            logger.debug(f"Texto extraído da linha {i+1}, página {page_number}.")
+        else:
+            logger.info(f"Nenhum texto detectado na linha {i+1}, página {page_number} pelo TrOCR.")
+            all_lines_text.append(f"[Nenhum texto detectado na linha {i+1}, página {page_number}]")
+    return "\n".join(all_lines_text)
 
 def extract_text_with_trocr(images: List[Image.Image], page_number: int) -> str:
     """Usa o modelo TrOCR da Microsoft para extrair texto manuscrito de imagens.
     """
-    if not model or not processor:
+    engine = get_engine()
+    if not engine:
         logger.error("Motor TrOCR não está disponível. Pulando extração de texto.")
         return "[ERRO: MOTOR TrOCR NÃO INICIALIZADO]"
 
-    all_lines_text = []
-    logger.info(f"Iniciando extração de texto com TrOCR para {len(images)} página(s)...")
+    logger.info(f"Iniciando extração de texto com TrOCR para {len(images)} linha(s) da página {page_number}...")
 
     try:
-        for i, img in enumerate(images):
-            # O TrOCR espera imagens no formato RGB
-            if img.mode != "RGB":
-                img = img.convert("RGB")
+        texts = recognize_lines(images, engine=engine)
+        logger.info("Extração de texto com TrOCR concluída.")
+        return _format_lines(texts, page_number)
 
-            # Prepara a imagem usando o processador e envia para o dispositivo (CPU ou GPU)
-            pixel_values = processor(images=img, return_tensors="pt").pixel_values.to(device)
+    except Exception as e:
+        logger.error(f"Erro durante a execução do TrOCR: {e}", exc_info=True)
+        return "[ERRO DURANTE A EXECUÇÃO DO OCR LOCAL COM TrOCR]"
 
-            # Gera os IDs dos tokens a partir dos pixels da imagem
-            generated_ids = model.generate(pixel_values)i
+def extract_text_from_pages(pages_lines: List[List[Image.Image]],
+                            page_numbers: List[int] = None,
+                            timings: Dict[str, float] = None,
+                            confidences: List[float] = None,
+                            model_path: str = None) -> List[str]:
+    """Extrai o texto de várias páginas de uma vez, agrupando as linhas de todas
+    as páginas nos mesmos lotes do TrOCR.
 
-            # Decodifica os IDs dos tokens para texto legível
-            generated_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+    Args:
+        pages_lines (List[List[Image.Image]]): As imagens de linha de cada página.
+        page_numbers (List[int]): Índice de cada página no PDF, usado nas mensagens.
+            Por padrão, as páginas são numeradas na ordem da lista.
+        timings (Dict[str, float]): Se informado, a duração (s) do TrOCR e da
+            correção ortográfica é somada nele.
+        confidences (List[float]): Se informada, recebe a confiança de cada página:
+            a média da confiança das suas linhas (0 para páginas sem linhas ou com erro).
+        model_path (str): O modelo TrOCR a usar (padrão: config.FINAL_MODEL_PATH).
 
-            if generated_text:
-                cleaned_text = clean_text(generated_text)
-                all_lines_text.append(cleaned_text)
-                logger.info(f"Texto extraído da linha {i+1}, página {pg_number}.")
-            else:
-                logger.info(f"Nenhum texto detectado na página linha {i+1}, página {pg_number} pelo TrOCR.")
-                all_lines_text.append(f"[Nenhum texto detectado na linha {i+1}, página {pg_number}]")
+    Returns:
+        List[str]: O texto de cada página, na ordem original (página, linha).
 
-        logger.info("Extração de texto com TrOCR concluída.")
-        return "\n".join(all_lines_text)
+    """
+    engine = get_engine(model_path)
+    if not engine:
+        logger.error("Motor TrOCR não está disponível. Pulando extração de texto.")
+        if confidences is not None:
+            confidences.extend([0.0] * len(pages_lines))
+        return ["[ERRO: MOTOR TrOCR NÃO INICIALIZADO]"] * len(pages_lines)
 
+    flat_lines = [line for lines in pages_lines for line in lines]
+    logger.info(f"Iniciando extração de texto com TrOCR para {len(pages_lines)} página(s), {len(flat_lines)} linha(s)...")
+
+    line_confidences = [] if confidences is not None else None
+    try:
+        with metrics.accumulate(metrics.STAGE_TROCR, timings):
+            flat_texts = recognize_lines(flat_lines, engine=engine, confidences=line_confidences)
     except Exception as e:
         logger.error(f"Erro durante a execução do TrOCR: {e}", exc_info=True)
-        return "[ERRO DURANTE A EXECUÇÃO DO OCR LOCAL COM TrOCR]"
+        if confidences is not None:
+            confidences.extend([0.0] * len(pages_lines))
+        return ["[ERRO DURANTE A EXECUÇÃO DO OCR LOCAL COM TrOCR]"] * len(pages_lines)
 
+    if page_numbers is None:
+        page_numbers = list(range(len(pages_lines)))
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    images = process_pdf_to_images(pdf_path)
+    pages_text = []
+    offset = 0
+    with metrics.accumulate(metrics.STAGE_SPELL, timings):
+        for page_num, lines in zip(page_numbers, pages_lines):
+            page_texts = flat_texts[offset:offset + len(lines)]
+            if confidences is not None:
+                page_confidences = line_confidences[offset:offset + len(lines)]
+                confidences.append(sum(page_confidences) / len(page_confidences) if page_confidences else 0.0)
+            offset += len(lines)
+            pages_text.append(_format_lines(page_texts, page_num + 1))
+
+    logger.info("Extração de texto com TrOCR concluída.")
+    return pages_text
+
+
+def extract_text_from_pdf(pdf_path: str) -> Tuple[str, List[EncodedImage]]:
+    """Extrai o texto local do PDF e devolve também as páginas codificadas para a API.
+
+    As páginas são lidas uma a uma; depois do OCR só a imagem codificada é mantida.
+    """
+    all_text, images = [], []
+    try:
+        for page in iter_pdf_pages(pdf_path):
+            all_text += extract_text_from_pages([[Image.fromarray(line) for line in page.lines]],
+                                                page_numbers=[page.page_num])
+            images.append(page.payload)
+    except Exception as e:
+        logger.error(f"Falha ao processar PDF: {e}", exc_info=True)
+        return "[ERRO: Nenhuma imagem extraída do PDF]", []
     if not images:
-        return "[ERRO: Nenhuma imagem extraída do PDF]"
-
-    all_text = []
-    for page_num, page_img in enumerate(images):
-        preprocessed_img = preprocess_page(page_img)
-        lines_img = segment_blocks_and_lines(preprocessed_img)
-        lines_txt = extract_text_with_trocr(lines_img, pag_num)
-        all_text.append(lines_txt)
+        return "[ERRO: Nenhuma imagem extraída do PDF]", []
 
     return ("\n\n---\n[Nova Página]\n---\n\n".join(all_text), images)
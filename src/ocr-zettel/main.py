@@ -1,35 +1,66 @@
 
+import argparse
 import logging
+import os
+import threading
 import time
+from typing import List
 
 import config
+import local_ocr
+import metrics
 from file_handler import PDFChangeHandler
 from logger_setup import setup_logging
+from watch_roots import WatchRoot, configured_roots
 from watchdog.observers import Observer
 
 # Configura o logging antes de qualquer outra coisa
 setup_logging()
 logger = logging.getLogger(__name__)
 
-def main():
-    """Função principal para iniciar o monitoramento."""
+def main(warmup: bool = False, roots: List[WatchRoot] = None):
+    """Função principal para iniciar o monitoramento.
+
+    Args:
+        warmup (bool): Executa uma inferência de aquecimento do TrOCR ao iniciar.
+        roots (List[WatchRoot]): As pastas monitoradas (padrão: as do config).
+
+    """
+    startup = time.perf_counter()
     logger.info("Iniciando o serviço de monitoramento de notas...")
-    logger.info(f"Monitorando o diretório: {config.WATCH_DIRECTORY}")
 
-    if not os.path.isdir(config.WATCH_DIRECTORY):
-        logger.error(f"O diretório '{config.WATCH_DIRECTORY}' não existe. Verifique o arquivo config.py.")
+    roots = [root for root in (roots or configured_roots()) if _check_root(root)]
+    if not roots:
+        logger.error("Nenhuma pasta para monitorar. Verifique o arquivo config.py ou o arquivo de pastas.")
         return
 
-    # Cria o manipulador de eventos
-    event_handler = PDFChangeHandler()
+    # Carrega os modelos em segundo plano, sem atrasar o início do monitoramento
+    if config.OCR_WARMUP_IN_BACKGROUND or warmup:
+        local_ocr.start_warmup(run_inference=warmup, model_paths=[root.model_path for root in roots])
+
+    # Cria o manipulador de eventos e inicia os workers de processamento
+    phase_start = time.perf_counter()
+    event_handler = PDFChangeHandler(roots=roots)
+    event_handler.start()
+    logger.info(f"Fila de jobs pronta em {time.perf_counter() - phase_start:.2f}s.")
 
     # Cria e configura o observador
+    phase_start = time.perf_counter()
     observer = Observer()
-    observer.schedule(event_handler, config.WATCH_DIRECTORY, recursive=True)
+    for root in roots:
+        observer.schedule(event_handler, root.path, recursive=True)
 
     # Inicia o observador em uma thread separada
     observer.start()
-    logger.info("Observador iniciado. Pressione CTRL+C para parar.")
+    logger.info(f"Observador iniciado em {time.perf_counter() - phase_start:.2f}s.")
+    logger.info(f"Serviço pronto em {time.perf_counter() - startup:.2f}s. Pressione CTRL+C para parar.")
+
+    # Enfileira o que mudou enquanto o serviço estava parado, sem atrasar o observador
+    def catch_up():
+        for root in roots:
+            event_handler.catch_up(root.path)
+
+    threading.Thread(target=catch_up, name="catch-up-scan", daemon=True).start()
 
     try:
         # Mantém o script principal rodando para que o observador continue ativo
@@ -41,12 +72,111 @@ def main():
 
     # Aguarda a thread do observador terminar
     observer.join()
-    logger.info("Observador parado. O programa foi encerrado.")
+    logger.info("Observador parado. Finalizando os jobs em andamento...")
+
+    event_handler.stop(drain=config.DRAIN_ON_SHUTDOWN)
+    logger.info("O programa foi encerrado.")
+
+def _check_root(root: WatchRoot) -> bool:
+    """Registra a pasta no log e verifica se ela existe."""
+    if not os.path.isdir(root.path):
+        logger.error(f"O diretório '{root.path}' (pasta '{root.name}') não existe e não será monitorado.")
+        return False
+    crop = root.crop_box or "página inteira"
+    logger.info(f"Monitorando o diretório: {root.path} (pasta '{root.name}', modelo {root.model_path}, "
+                f"crop {crop}, peso {root.weight:g})")
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Converte notas manuscritas em PDF para Markdown.")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Executa uma inferência de aquecimento do TrOCR ao iniciar")
+    parser.add_argument("--metrics-port", type=int, default=config.METRICS_PORT,
+                        help="Expõe as métricas do Prometheus em /metrics nesta porta")
+    parser.add_argument("--roots", default=config.WATCH_ROOTS_FILE,
+                        help="Arquivo YAML com as pastas monitoradas (padrão: config.WATCH_ROOTS_FILE; "
+                             "sem ele, config.WATCH_DIRECTORY)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("watch", help="Monitora as pastas configuradas (padrão)")
+
+    backfill_parser = subparsers.add_parser("backfill", help="Converte todos os PDFs desatualizados de um diretório")
+    backfill_parser.add_argument("directory", nargs="?", default=None,
+                                 help="Diretório a percorrer (padrão: todas as pastas monitoradas)")
+    backfill_parser.add_argument("--dry-run", action="store_true",
+                                 help="Apenas lista os PDFs que seriam convertidos")
+    backfill_parser.add_argument("--limit", type=int, default=None,
+                                 help="Número máximo de PDFs a converter")
+
+    cache_parser = subparsers.add_parser("cache", help="Gerencia o cache de respostas da API")
+    cache_parser.add_argument("action", choices=["stats", "prune", "clear"],
+                              help="stats: tamanho dos caches; prune: aplica a validade e os limites de "
+                                   "tamanho (respostas da API e imagens do cache de páginas); "
+                                   "clear: apaga as respostas")
+    cache_parser.add_argument("--older-than", type=float, default=None, metavar="DIAS",
+                              help="Com clear, apaga só as respostas criadas há mais de DIAS dias")
+    cache_parser.add_argument("--model", default=None,
+                              help="Com clear, apaga só as respostas deste modelo")
+    return parser.parse_args()
+
+def run_cache_command(args):
+    """Executa `python main.py cache ...`."""
+    from page_cache import PageCache
+    from response_cache import cache_from_config
+
+    cache = cache_from_config()
+    if args.action == "stats":
+        stats = cache.stats()
+        print(f"{stats.entries} resposta(s), {stats.size_bytes / 1e6:.1f} MB "
+              f"(limite: {config.VISION_CACHE_MAX_BYTES / 1e6:.0f} MB)")
+        if stats.entries:
+            print(f"Mais antiga: {time.strftime('%Y-%m-%d %H:%M', time.localtime(stats.oldest))}; "
+                  f"mais recente: {time.strftime('%Y-%m-%d %H:%M', time.localtime(stats.newest))}")
+        page_cache = PageCache(config.PAGE_CACHE_PATH)
+        pages = page_cache.page_stats()
+        count, size = page_cache.payload_stats()
+        page_cache.close()
+        print(f"Cache de páginas: {pages} página(s), {count} imagem(ns), {size / 1e6:.1f} MB "
+              f"(limite: {config.PAGE_CACHE_MAX_PAYLOAD_BYTES / 1e6:.0f} MB)")
+    elif args.action == "prune":
+        print(f"{cache.prune()} resposta(s) removidas.")
+        page_cache = PageCache(config.PAGE_CACHE_PATH)
+        if config.PAGE_CACHE_MAX_AGE_DAYS is not None:
+            print(f"{page_cache.prune_pages(config.PAGE_CACHE_MAX_AGE_DAYS * 86400)} página(s) "
+                  f"removidas do cache de páginas.")
+        if config.PAGE_CACHE_MAX_PAYLOAD_BYTES is not None:
+            print(f"{page_cache.prune_payloads(config.PAGE_CACHE_MAX_PAYLOAD_BYTES)} imagem(ns) "
+                  f"removidas do cache de páginas.")
+        page_cache.close()
+    else:
+        older_than = args.older_than * 86400 if args.older_than is not None else None
+        print(f"{cache.clear(older_than, args.model)} resposta(s) apagadas.")
+    cache.close()
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "cache":
+        run_cache_command(args)
+        raise SystemExit(0)
+
     # Verifica a existência da chave de API antes de rodar
-    import os
     if not config.OPENAI_API_KEY:
         logger.error("A chave da API da OpenAI não foi configurada. Encerrando.")
+        raise SystemExit(1)
+
+    if args.metrics_port:
+        metrics.start_server(args.metrics_port, config.METRICS_ADDRESS)
+
+    try:
+        roots = configured_roots(args.roots)
+    except (OSError, ValueError) as e:
+        logger.error(f"Não foi possível ler as pastas monitoradas: {e}")
+        raise SystemExit(1)
+
+    if args.command == "backfill":
+        import backfill
+        if args.warmup:
+            local_ocr.start_warmup(run_inference=True, model_paths=[root.model_path for root in roots])
+        backfill.run_backfill(args.directory, dry_run=args.dry_run, limit=args.limit, roots=roots)
     else:
-        main()
+        main(warmup=args.warmup, roots=roots)
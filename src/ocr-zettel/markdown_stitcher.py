@@ -0,0 +1,159 @@
+# markdown_stitcher.py
+"""Junta o Markdown gerado em partes (páginas ou grupos de páginas) de uma nota.
+
+Cada parte é transcrita pela API sem ver as demais, então nas emendas aparecem
+títulos repetidos, a hierarquia recomeçando do `#`, tags repetidas e parágrafos
+ou listas partidos ao meio. `stitch` corrige esses casos ao juntar as partes.
+"""
+import re
+from typing import List, Optional
+
+# Separador padrão entre partes consecutivas
+PAGE_SEPARATOR = "\n\n"
+
+# Marcador pedido à API antes do conteúdo de cada página de uma requisição com várias páginas
+PAGE_MARKER = "<!-- página {number} -->"
+_PAGE_MARKER_RE = re.compile(r"^[ \t]*<!--\s*p[áa]gina\s+(\d+)\s*-->[ \t]*$", re.IGNORECASE | re.MULTILINE)
+
+_HEADING_RE = re.compile(r"^(#{1,6})[ \t]+(.*?)[ \t#]*$")
+# Tags no estilo do Obsidian: # colado na palavra (títulos têm espaço depois do #)
+_TAG_RE = re.compile(r"(?<![\w#])#[^\s#]+")
+_TAG_LINE_RE = re.compile(r"^[ \t]*#[^\s#]+(?:[ \t]+#[^\s#]+)*[ \t]*$")
+_LIST_ITEM_RE = re.compile(r"^[ \t]*(?:[-*+]|\d+[.)])[ \t]+")
+_FENCE_RE = re.compile(r"^[ \t]*(```|~~~|\$\$)")
+# Fim de frase: quem termina assim não continua na próxima parte
+_SENTENCE_END = tuple(".!?:;)]}\"'»…|")
+
+
+def split_pages(markdown: str, page_count: int) -> Optional[List[str]]:
+    """Separa a resposta de uma requisição com várias páginas pelos marcadores de página.
+
+    Returns:
+        Optional[List[str]]: O Markdown de cada página, ou None se os marcadores
+            não vierem todos, em ordem.
+
+    """
+    markers = list(_PAGE_MARKER_RE.finditer(markdown))
+    if [int(m.group(1)) for m in markers] != list(range(1, page_count + 1)):
+        return None
+    pages = []
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(markdown)
+        pages.append(markdown[marker.end():end].strip("\n"))
+    # Texto antes do primeiro marcador pertence à primeira página
+    preamble = markdown[:markers[0].start()].strip("\n")
+    if preamble:
+        pages[0] = f"{preamble}\n{pages[0]}" if pages[0] else preamble
+    return pages
+
+
+def _outside_fences(lines: List[str]) -> List[bool]:
+    """Para cada linha, se ela está fora de blocos de código, mermaid ou $$ (LaTeX)."""
+    result, fence = [], None
+    for line in lines:
+        match = _FENCE_RE.match(line)
+        if fence is None:
+            if match:
+                fence = match.group(1)
+                result.append(False)
+            else:
+                result.append(True)
+        else:
+            result.append(False)
+            if match and match.group(1) == fence:
+                fence = None
+    return result
+
+
+def _normalize_heading(text: str) -> str:
+    return re.sub(r"\s+", " ", text.replace("*", "").replace("_", "")).strip().casefold()
+
+
+class _Stitcher:
+    """Estado acumulado ao juntar as partes, em ordem."""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.title_count = 0
+        self.last_heading: Optional[str] = None
+        self.seen_tags = set()
+
+    def _clean(self, text: str) -> str:
+        lines = text.strip("\n").splitlines()
+        outside = _outside_fences(lines)
+
+        # A parte recomeça a hierarquia do `#` numa nota que já tem um título: desce um nível
+        levels = [len(m.group(1)) for line, ok in zip(lines, outside) if ok and (m := _HEADING_RE.match(line))]
+        shift = 1 if self.title_count == 1 and levels and min(levels) == 1 else 0
+
+        cleaned, first_content = [], True
+        for line, ok in zip(lines, outside):
+            if not ok:
+                cleaned.append(line)
+                first_content = False
+                continue
+            heading = _HEADING_RE.match(line)
+            if heading:
+                text_key = _normalize_heading(heading.group(2))
+                # Título repetido logo no início da parte (a API repete o da página anterior)
+                if first_content and text_key == self.last_heading:
+                    continue
+                level = min(6, len(heading.group(1)) + shift)
+                if level == 1:
+                    self.title_count += 1
+                self.last_heading = text_key
+                line = f"{'#' * level} {heading.group(2)}"
+            elif _TAG_LINE_RE.match(line):
+                # Linhas só de tags: cada tag aparece uma vez na nota
+                tags = [tag for tag in _TAG_RE.findall(line) if tag.casefold() not in self.seen_tags]
+                self.seen_tags.update(tag.casefold() for tag in tags)
+                if not tags:
+                    continue
+                line = " ".join(tags)
+            if line.strip():
+                first_content = False
+            cleaned.append(line)
+        return "\n".join(cleaned).strip("\n")
+
+    def _separator(self, previous: str, following: str) -> str:
+        last_line = previous.rsplit("\n", 1)[-1]
+        first_line = following.split("\n", 1)[0]
+        # Lista que continua na parte seguinte
+        if _LIST_ITEM_RE.match(last_line) and _LIST_ITEM_RE.match(first_line):
+            return "\n"
+        # Frase partida entre as partes: continua no mesmo parágrafo
+        if (last_line.strip() and not last_line.rstrip().endswith(_SENTENCE_END)
+                and not _HEADING_RE.match(last_line) and not _LIST_ITEM_RE.match(last_line)
+                and not _TAG_LINE_RE.match(last_line) and not _FENCE_RE.match(last_line)
+                and first_line[:1].islower()):
+            return " "
+        return PAGE_SEPARATOR
+
+    def add(self, text: str):
+        text = self._clean(text)
+        if not text.strip():
+            return
+        if self.parts:
+            separator = self._separator(self.parts[-1], text)
+            if separator == " ":
+                self.parts[-1] = self.parts[-1].rstrip()
+            self.parts.append(separator)
+        self.parts.append(text)
+
+    def result(self) -> str:
+        return "".join(self.parts)
+
+
+def stitch(parts: List[str]) -> str:
+    """Junta o Markdown das partes de uma nota, na ordem, tratando as emendas.
+
+    - Um título igual ao último da parte anterior, logo no início da parte, é removido.
+    - Se a nota tem um único título `#` e uma parte seguinte recomeça do `#`, os
+      títulos dessa parte descem um nível.
+    - Tags que já apareceram em linhas só de tags não são repetidas.
+    - Listas e frases que continuam na parte seguinte são emendadas.
+    """
+    stitcher = _Stitcher()
+    for part in parts:
+        stitcher.add(part or "")
+    return stitcher.result()
@@ -0,0 +1,112 @@
+# markdown_writer.py
+"""Gravação do Markdown na pasta sincronizada.
+
+O .md fica ao lado do PDF, dentro da pasta do Google Drive. Por isso:
+- o arquivo só é regravado se o conteúdo mudou (uma regravação igual ainda gera
+  upload e eventos do watchdog);
+- a gravação é atômica: o conteúdo vai para um arquivo temporário na mesma pasta,
+  é sincronizado no disco (fsync) e só então substitui o .md (rename), de modo que
+  o Drive nunca vê um arquivo pela metade;
+- os caminhos gravados pelo serviço ficam registrados por alguns segundos, para
+  que o manipulador de eventos ignore os eventos causados por essas gravações.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Caminho gravado -> instante (time.monotonic) até o qual os eventos dele são ignorados
+_own_writes: Dict[str, float] = {}
+_own_writes_lock = threading.Lock()
+
+
+def _register_own_write(path: str, window: float):
+    expires = time.monotonic() + window
+    with _own_writes_lock:
+        _own_writes[os.path.abspath(path)] = expires
+
+
+def is_own_write(path: str) -> bool:
+    """Indica se `path` foi gravado pelo serviço há pouco (o evento deve ser ignorado)."""
+    now = time.monotonic()
+    with _own_writes_lock:
+        for expired in [p for p, expires in _own_writes.items() if expires < now]:
+            del _own_writes[expired]
+        return os.path.abspath(path) in _own_writes
+
+
+def _same_content(path: str, data: bytes) -> bool:
+    """Compara `data` com o conteúdo atual de `path` (o tamanho primeiro, sem ler o arquivo)."""
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, "rb") as f:
+            return f.read() == data
+    except FileNotFoundError:
+        return False
+
+
+def _fsync_directory(directory: str):
+    """Grava no disco a entrada do diretório (o rename); nem todo sistema permite."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _file_mode(path: str) -> int:
+    """Permissões do arquivo atual ou, se ele não existir, 0o644."""
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        return 0o644
+
+
+def write_if_changed(path: str, text: str, event_window: float = 5.0) -> bool:
+    """Grava `text` em `path` de forma atômica, se o conteúdo for diferente do atual.
+
+    Args:
+        path (str): O arquivo de destino.
+        text (str): O conteúdo, gravado em UTF-8.
+        event_window (float): Segundos durante os quais os eventos de `path` (e do
+            arquivo temporário) são considerados gravações do próprio serviço.
+
+    Returns:
+        bool: True se o arquivo foi gravado; False se já tinha esse conteúdo.
+
+    """
+    data = text.encode("utf-8")
+    if _same_content(path, data):
+        return False
+
+    directory = os.path.dirname(os.path.abspath(path))
+    # O prefixo "~" também faz o manipulador de eventos ignorar o temporário
+    fd, temp_path = tempfile.mkstemp(prefix=f"~{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp cria o arquivo só com permissão para o dono
+        os.chmod(temp_path, _file_mode(path))
+        _register_own_write(temp_path, event_window)
+        _register_own_write(path, event_window)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    _fsync_directory(directory)
+    return True
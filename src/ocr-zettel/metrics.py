@@ -0,0 +1,143 @@
+# metrics.py
+"""Métricas do serviço (Prometheus) e log estruturado por documento.
+
+As etapas de cada nota são medidas com `timed`, que alimenta o histograma
+`ocr_zettel_stage_seconds` e, opcionalmente, um dicionário com o total por etapa
+do documento. Esse dicionário vai para a linha JSON registrada por
+`log_document` ao fim de cada nota.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Nomes das etapas medidas
+STAGE_STABILITY_WAIT = "stability_wait"
+STAGE_RENDER = "render"
+STAGE_PREPROCESS = "preprocess"
+STAGE_SEGMENT = "segment"
+STAGE_ENCODE = "encode"
+STAGE_TROCR = "trocr"
+STAGE_SPELL = "spell"
+STAGE_VISION_API = "vision_api"
+STAGE_WRITE = "write"
+STAGE_TOTAL = "total"
+
+# Etapas de poucos milissegundos (por página) até minutos (API com novas tentativas)
+_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+STAGE_SECONDS = Histogram("ocr_zettel_stage_seconds",
+                          "Duração de cada etapa por documento (s). Etapas feitas no pool "
+                          "de processos somam o tempo de todas as páginas.",
+                          ["stage"], buckets=_BUCKETS)
+DOCUMENTS = Counter("ocr_zettel_documents_total", "Documentos processados, por resultado.", ["outcome"])
+PAGES = Counter("ocr_zettel_pages_total", "Páginas por origem (processadas ou reaproveitadas do cache).",
+                ["source"])
+LINES = Counter("ocr_zettel_lines_total", "Linhas de texto enviadas ao TrOCR.")
+PAGE_ROUTES = Counter("ocr_zettel_page_routes_total",
+                      "Páginas por destino do Markdown (local ou API), segundo a confiança do TrOCR.",
+                      ["route"])
+API_REQUESTS = Counter("ocr_zettel_api_requests_total", "Requisições à API de visão, por resultado.",
+                       ["outcome"])
+API_RETRIES = Counter("ocr_zettel_api_retries_total", "Novas tentativas após erros temporários da API.")
+API_REQUEST_SECONDS = Histogram("ocr_zettel_api_request_seconds",
+                                "Duração das requisições à API, incluindo novas tentativas (s).",
+                                buckets=_BUCKETS)
+API_TOKENS = Counter("ocr_zettel_api_tokens_total", "Tokens consumidos na API de visão, por tipo.", ["kind"])
+MARKDOWN_WRITES = Counter("ocr_zettel_markdown_writes_total",
+                          "Gravações do .md: regravado (written) ou já com o mesmo conteúdo (unchanged).",
+                          ["result"])
+VISION_CACHE = Counter("ocr_zettel_vision_cache_total",
+                       "Consultas ao cache de respostas da API (hit: a requisição não foi enviada).",
+                       ["result"])
+VISION_CACHE_SAVED_TOKENS = Counter("ocr_zettel_vision_cache_saved_tokens_total",
+                                    "Tokens que as respostas servidas pelo cache custaram originalmente.",
+                                    ["kind"])
+QUEUE_DEPTH = Gauge("ocr_zettel_queue_depth", "Jobs aguardando na fila de processamento.")
+
+
+def observe_stage(stage: str, seconds: float, timings: Optional[Dict[str, float]] = None):
+    """Registra a duração de uma etapa (e soma em `timings`, se informado)."""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str, timings: Optional[Dict[str, float]] = None):
+    """Mede o bloco como uma etapa; ver `observe_stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, timings)
+
+
+@contextmanager
+def accumulate(stage: str, timings: Optional[Dict[str, float]]):
+    """Soma a duração do bloco em `timings`, sem registrar no histograma.
+
+    Para etapas executadas em várias partes, registradas uma única vez no fim.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def record_usage(usage, totals: Optional[Dict[str, int]] = None):
+    """Contabiliza os tokens de `response.usage` (e soma em `totals`, se informado)."""
+    if usage is None:
+        return
+    details = getattr(usage, "completion_tokens_details", None)
+    counts = {
+        "prompt": getattr(usage, "prompt_tokens", None) or 0,
+        "completion": getattr(usage, "completion_tokens", None) or 0,
+        "reasoning": getattr(details, "reasoning_tokens", None) or 0,
+    }
+    for kind, count in counts.items():
+        if count:
+            API_TOKENS.labels(kind).inc(count)
+        if totals is not None:
+            totals[kind] = totals.get(kind, 0) + count
+
+
+def log_document(pdf_path: str, outcome: str, timings: Dict[str, float], **fields):
+    """Registra uma linha JSON com o resultado e o tempo de cada etapa de um documento."""
+    DOCUMENTS.labels(outcome).inc()
+    record = {
+        "event": "document",
+        "path": pdf_path,
+        "outcome": outcome,
+        "stages": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+        **fields,
+    }
+    logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def log_page_route(pdf_path: str, page_num: int, route: str, confidence: Optional[float],
+                   threshold: Optional[float]):
+    """Registra uma linha JSON com a decisão (Markdown local ou API) de uma página."""
+    PAGE_ROUTES.labels(route).inc()
+    record = {
+        "event": "page_route",
+        "path": pdf_path,
+        "page": page_num + 1,
+        "route": route,
+        "confidence": None if confidence is None else round(confidence, 4),
+        "threshold": threshold,
+    }
+    logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def start_server(port: int, address: str = "127.0.0.1"):
+    """Expõe as métricas em http://<address>:<port>/metrics."""
+    start_http_server(port, addr=address)
+    logger.info(f"Métricas disponíveis em http://{address}:{port}/metrics")
@@ -0,0 +1,328 @@
+# ocr_backends.py
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Nome dos arquivos gerados por export_onnx.py
+ENCODER_FILE = "encoder_model.onnx"
+DECODER_FILE = "decoder_model.onnx"
+DECODER_WITH_PAST_FILE = "decoder_with_past_model.onnx"
+ONNX_CONFIG_FILE = "ocr_onnx_config.json"
+QUANTIZED_SUFFIX = "_int8"
+
+
+def quantized_name(filename: str) -> str:
+    """Nome do arquivo quantizado (int8) correspondente a um modelo ONNX."""
+    base, ext = os.path.splitext(filename)
+    return f"{base}{QUANTIZED_SUFFIX}{ext}"
+
+
+def _log_softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+def mean_token_log_probs(tokens: np.ndarray, token_log_probs: np.ndarray, eos_id: int) -> np.ndarray:
+    """Média da log-probabilidade dos tokens gerados, até o primeiro EOS (inclusive).
+
+    Args:
+        tokens (np.ndarray): Os tokens gerados (sem o token inicial), (batch, passos).
+        token_log_probs (np.ndarray): A log-probabilidade de cada um, mesma forma.
+        eos_id (int): O token de fim de sequência; o que vem depois dele é pad.
+
+    """
+    is_eos = tokens == eos_id
+    last = np.where(is_eos.any(axis=1), is_eos.argmax(axis=1), tokens.shape[1] - 1)
+    mask = np.arange(tokens.shape[1])[None, :] <= last[:, None]
+    return np.where(mask, token_log_probs, 0.0).sum(axis=1) / np.maximum(mask.sum(axis=1), 1)
+
+
+def ban_repeated_ngrams(sequences: np.ndarray, scores: np.ndarray, ngram_size: int) -> np.ndarray:
+    """Proíbe (-inf em `scores`) os tokens que repetiriam um n-grama de cada sequência.
+
+    Como o `no_repeat_ngram_size` do transformers: o próximo token não pode fechar
+    um n-grama que já aparece na sequência (incluindo o token inicial).
+    """
+    cur_len = sequences.shape[1]
+    if not ngram_size or cur_len < ngram_size:
+        return scores
+    windows = np.lib.stride_tricks.sliding_window_view(sequences, ngram_size, axis=1)
+    prefix = sequences[:, cur_len + 1 - ngram_size:]
+    rows, cols = np.nonzero((windows[..., :-1] == prefix[:, None, :]).all(axis=-1))
+    scores[rows, windows[rows, cols, -1]] = -np.inf
+    return scores
+
+
+class TorchTrOCRBackend:
+    """Executa o TrOCR com PyTorch, usando o `generate` do transformers."""
+
+    name = "torch"
+
+    def __init__(self, model_path: str, num_beams: int = None):
+        import torch
+        from transformers import VisionEncoderDecoderModel
+
+        self._torch = torch
+        # Verifica se há uma GPU disponível e a define como dispositivo principal
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        logger.info(f"TrOCR usará o dispositivo: {self.device.type}")
+
+        # O modelo é a rede neural que faz a "leitura" da imagem
+        self.model = VisionEncoderDecoderModel.from_pretrained(model_path).to(self.device)
+        self.model.eval()
+        self.num_beams = num_beams
+
+    def generate(self, pixel_values: np.ndarray) -> np.ndarray:
+        """Gera os IDs dos tokens para um lote de imagens já pré-processadas."""
+        kwargs = {}
+        if self.num_beams:
+            kwargs["num_beams"] = self.num_beams
+        with self._torch.no_grad():
+            tensor = self._torch.from_numpy(pixel_values).to(self.device)
+            generated_ids = self.model.generate(tensor, **kwargs)
+        return generated_ids.cpu().numpy()
+
+    def generate_with_scores(self, pixel_values: np.ndarray):
+        """Como `generate`, mas devolve também a log-probabilidade média dos tokens de cada sequência."""
+        kwargs = {}
+        if self.num_beams:
+            kwargs["num_beams"] = self.num_beams
+        with self._torch.no_grad():
+            tensor = self._torch.from_numpy(pixel_values).to(self.device)
+            output = self.model.generate(tensor, output_scores=True, return_dict_in_generate=True, **kwargs)
+            beam_indices = getattr(output, "beam_indices", None)
+            # Na busca em feixe os scores já são log-probabilidades; no greedy são logits
+            transition = self.model.compute_transition_scores(output.sequences, output.scores, beam_indices,
+                                                              normalize_logits=beam_indices is None)
+        sequences = output.sequences.cpu().numpy()
+        transition = transition.float().cpu().numpy()
+        eos_id = self.model.generation_config.eos_token_id
+        if isinstance(eos_id, (list, tuple)):
+            eos_id = eos_id[0]
+        return sequences, mean_token_log_probs(sequences[:, -transition.shape[1]:], transition, eos_id)
+
+
+class OnnxTrOCRBackend:
+    """Executa o TrOCR exportado para ONNX com o ONNX Runtime.
+
+    O decodificador é exportado em dois grafos, como no optimum: um para o primeiro
+    passo (sem cache) e outro que recebe o cache de chaves/valores dos passos
+    anteriores, de modo que cada passo processa apenas o último token.
+    """
+
+    name = "onnx"
+
+    def __init__(self, onnx_dir: str, quantized: bool = False,
+                 num_beams: int = None, num_threads: int = 0):
+        import onnxruntime as ort
+
+        with open(os.path.join(onnx_dir, ONNX_CONFIG_FILE), encoding="utf-8") as f:
+            self.gen_config = json.load(f)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        def _session(filename):
+            if quantized:
+                q_path = os.path.join(onnx_dir, quantized_name(filename))
+                if os.path.exists(q_path):
+                    return ort.InferenceSession(q_path, options, providers=["CPUExecutionProvider"])
+                logger.warning(f"Modelo quantizado {q_path} não encontrado. Usando a versão fp32.")
+            path = os.path.join(onnx_dir, filename)
+            return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+        self.encoder = _session(ENCODER_FILE)
+        self.decoder = _session(DECODER_FILE)
+        self.decoder_with_past = _session(DECODER_WITH_PAST_FILE)
+
+        self.num_layers = self.gen_config["num_layers"]
+        self.num_beams = num_beams or self.gen_config.get("num_beams") or 1
+        self.max_length = self.gen_config.get("max_length") or 20
+        self.start_id = self.gen_config["decoder_start_token_id"]
+        self.eos_id = self.gen_config["eos_token_id"]
+        self.pad_id = self.gen_config.get("pad_token_id")
+        if self.pad_id is None:
+            self.pad_id = self.eos_id
+        # Mesmos padrões do GenerationConfig do transformers
+        if "no_repeat_ngram_size" not in self.gen_config:
+            logger.warning(f"{ONNX_CONFIG_FILE} sem os parâmetros de geração (no_repeat_ngram_size, "
+                           f"length_penalty...); exporte o modelo de novo para o resultado igualar o do torch.")
+        self.no_repeat_ngram_size = self.gen_config.get("no_repeat_ngram_size") or 0
+        self.length_penalty = self.gen_config.get("length_penalty", 1.0)
+        self.early_stopping = self.gen_config.get("early_stopping", False)
+        self.min_length = self.gen_config.get("min_length") or 0
+
+        self._past_names = [
+            f"past_key_values.{i}.{kind}.{kv}"
+            for i in range(self.num_layers)
+            for kind in ("decoder", "encoder")
+            for kv in ("key", "value")
+        ]
+
+    @staticmethod
+    def _run(session, feeds: dict) -> list:
+        # O exportador remove entradas que o grafo não usa; envia só as que existem
+        names = {i.name for i in session.get_inputs()}
+        return session.run(None, {k: v for k, v in feeds.items() if k in names})
+
+    def _step(self, input_ids, encoder_hidden_states, past):
+        feeds = {"input_ids": input_ids, "encoder_hidden_states": encoder_hidden_states}
+        if past is None:
+            outputs = self._run(self.decoder, feeds)
+        else:
+            feeds.update(zip(self._past_names, past))
+            outputs = self._run(self.decoder_with_past, feeds)
+        return outputs[0][:, -1, :], outputs[1:]
+
+    def generate(self, pixel_values: np.ndarray) -> np.ndarray:
+        """Gera os IDs dos tokens para um lote de imagens já pré-processadas."""
+        return self.generate_with_scores(pixel_values)[0]
+
+    def generate_with_scores(self, pixel_values: np.ndarray):
+        """Como `generate`, mas devolve também a log-probabilidade média dos tokens de cada sequência."""
+        encoder_hidden_states = self._run(self.encoder, {"pixel_values": pixel_values.astype(np.float32)})[0]
+        if self.num_beams > 1:
+            return self._beam_search(encoder_hidden_states)
+        return self._greedy(encoder_hidden_states)
+
+    def _process(self, sequences: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """Aplica a `scores` do próximo token as restrições de geração do modelo.
+
+        Como os logits processors do transformers: o EOS é proibido antes de
+        `min_length` tokens (contando o inicial) e nenhum n-grama se repete.
+        """
+        if sequences.shape[1] < self.min_length:
+            scores[:, self.eos_id] = -np.inf
+        return ban_repeated_ngrams(sequences, scores, self.no_repeat_ngram_size)
+
+    def _greedy(self, encoder_hidden_states: np.ndarray) -> np.ndarray:
+        batch_size = encoder_hidden_states.shape[0]
+        sequences = np.full((batch_size, 1), self.start_id, dtype=np.int64)
+        finished = np.zeros(batch_size, dtype=bool)
+        score_sum = np.zeros(batch_size, dtype=np.float32)
+        lengths = np.zeros(batch_size, dtype=np.float32)
+        past = None
+
+        while sequences.shape[1] < self.max_length and not finished.all():
+            logits, past = self._step(sequences[:, -1:], encoder_hidden_states, past)
+            logits = self._process(sequences, logits)
+            next_tokens = logits.argmax(axis=-1)
+            chosen = _log_softmax(logits)[np.arange(batch_size), next_tokens]
+            score_sum += np.where(finished, 0.0, chosen)
+            lengths += ~finished
+            next_tokens = np.where(finished, self.pad_id, next_tokens)
+            finished |= next_tokens == self.eos_id
+            sequences = np.concatenate([sequences, next_tokens[:, None]], axis=1)
+
+        return sequences, score_sum / np.maximum(lengths, 1)
+
+    def _beam_search(self, encoder_hidden_states: np.ndarray) -> np.ndarray:
+        """Busca em feixe com as mesmas regras do `generate` do transformers.
+
+        A cada passo ficam os 2 * num_beams melhores candidatos. Os que terminam
+        (EOS ou max_length) entre os num_beams primeiros disputam as vagas das
+        hipóteses finalizadas, com a soma das log-probabilidades dividida por
+        `comprimento ** length_penalty`; os demais seguem como feixes ativos. A
+        busca para quando nenhuma imagem pode melhorar as hipóteses finalizadas
+        (ver `early_stopping`) ou todos os candidatos chegam a max_length.
+        """
+        num_beams = self.num_beams
+        batch_size = encoder_hidden_states.shape[0]
+        candidates = 2 * num_beams
+        batch_offset = np.arange(batch_size)[:, None]
+        # Cada imagem é repetida num_beams vezes: (batch * beams, seq, hidden)
+        encoder_hidden_states = np.repeat(encoder_hidden_states, num_beams, axis=0)
+
+        running = np.full((batch_size * num_beams, 1), self.start_id, dtype=np.int64)
+        # Só o primeiro feixe de cada imagem começa ativo, para não duplicar hipóteses
+        running_scores = np.full((batch_size, num_beams), -1e9, dtype=np.float32)
+        running_scores[:, 0] = 0.0
+
+        # Hipóteses finalizadas de cada imagem, da melhor para a pior
+        done_sequences = np.full((batch_size, num_beams, self.max_length), self.pad_id, dtype=np.int64)
+        done_scores = np.full((batch_size, num_beams), -np.inf, dtype=np.float32)
+        done_sums = np.zeros((batch_size, num_beams), dtype=np.float32)
+        done_lengths = np.ones((batch_size, num_beams), dtype=np.int64)
+        can_improve = np.ones(batch_size, dtype=bool)
+        past = None
+
+        while True:
+            cur_len = running.shape[1]
+            logits, past = self._step(running[:, -1:], encoder_hidden_states, past)
+            log_probs = self._process(running, _log_softmax(logits))
+            vocab_size = log_probs.shape[-1]
+            scores = (running_scores.reshape(-1, 1) + log_probs).reshape(batch_size, num_beams * vocab_size)
+
+            top = np.argpartition(-scores, candidates - 1, axis=1)[:, :candidates]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1),
+                                                     axis=1, kind="stable"), axis=1)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            origin = top // vocab_size + batch_offset * num_beams
+            tokens = top % vocab_size
+            top_sequences = np.concatenate([running[origin.reshape(-1)], tokens.reshape(-1, 1)], axis=1)
+            top_sequences = top_sequences.reshape(batch_size, candidates, cur_len + 1)
+            ends = (tokens == self.eos_id) | (cur_len + 1 >= self.max_length)
+
+            # Os melhores candidatos que não terminaram seguem como feixes ativos
+            running_top = np.argsort(-np.where(ends, -np.inf, top_scores), axis=1, kind="stable")[:, :num_beams]
+            running_scores = np.take_along_axis(top_scores + ends * np.float32(-1e9), running_top, axis=1)
+            running = top_sequences[batch_offset, running_top].reshape(batch_size * num_beams, cur_len + 1)
+            beam_origin = np.take_along_axis(origin, running_top, axis=1).reshape(-1)
+            past = [p[beam_origin] for p in past]
+
+            # Os que terminaram entre os num_beams primeiros disputam as vagas das finalizadas
+            generated = cur_len
+            new_scores = top_scores / np.float32(generated ** self.length_penalty)
+            accepts = can_improve & ~(np.isfinite(done_scores).all(axis=1) & (self.early_stopping is True))
+            new_finished = ends & (np.arange(candidates) < num_beams)[None, :] & accepts[:, None]
+            new_scores = np.where(new_finished, new_scores, -np.inf)
+            merged_scores = np.concatenate([done_scores, new_scores], axis=1)
+            keep = np.argsort(-merged_scores, axis=1, kind="stable")[:, :num_beams]
+            from_new = keep >= num_beams
+            new_index = np.where(from_new, keep - num_beams, 0)
+            old_index = np.where(from_new, 0, keep)
+
+            padded = np.full((batch_size, candidates, self.max_length), self.pad_id, dtype=np.int64)
+            padded[:, :, :cur_len + 1] = top_sequences
+            done_sequences = np.where(from_new[..., None], padded[batch_offset, new_index],
+                                      done_sequences[batch_offset, old_index])
+            done_sums = np.where(from_new, np.take_along_axis(top_scores, new_index, axis=1),
+                                 np.take_along_axis(done_sums, old_index, axis=1))
+            done_lengths = np.where(from_new, generated, np.take_along_axis(done_lengths, old_index, axis=1))
+            done_scores = np.take_along_axis(merged_scores, keep, axis=1)
+
+            # Um feixe ativo ainda pode superar a pior hipótese finalizada?
+            if self.early_stopping == "never" and self.length_penalty > 0.0:
+                best_length = self.max_length - 1
+            else:
+                best_length = generated
+            best_running = running_scores[:, 0] / np.float32(best_length ** self.length_penalty)
+            full = np.isfinite(done_scores).all(axis=1)
+            can_improve &= np.where(full, best_running > done_scores.min(axis=1), best_running > -1e9)
+
+            if (not can_improve.any() or ends.all()
+                    or (full.all() and self.early_stopping is True)):
+                break
+
+        length = int(done_lengths[:, 0].max()) + 1
+        return done_sequences[:, 0, :length], done_sums[:, 0] / done_lengths[:, 0]
+
+
+def load_backend(name: str, model_path: str, onnx_dir: str = None,
+                 quantized: bool = False, num_beams: int = None, num_threads: int = 0):
+    """Cria o backend de OCR indicado por `name` ("torch" ou "onnx").
+
+    Sem `onnx_dir`, os modelos ONNX são procurados em `<model_path>/onnx`.
+    """
+    if name == "torch":
+        return TorchTrOCRBackend(model_path, num_beams=num_beams)
+    if name == "onnx":
+        return OnnxTrOCRBackend(onnx_dir or os.path.join(model_path, "onnx"), quantized=quantized,
+                                num_beams=num_beams, num_threads=num_threads)
+    raise ValueError(f"Backend de OCR desconhecido: '{name}'. Use 'torch' ou 'onnx'.")
@@ -0,0 +1,182 @@
+# page_cache.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from image_encoder import EncodedImage
+
+logger = logging.getLogger(__name__)
+
+# Chaves por consulta `IN (...)`: o SQLite limita o número de parâmetros de cada
+# comando (999 nas versões antigas), e um caderno grande pode passar disso
+_KEYS_PER_QUERY = 500
+
+
+def _chunks(keys: List[str]):
+    keys = list(keys)
+    for start in range(0, len(keys), _KEYS_PER_QUERY):
+        yield keys[start:start + _KEYS_PER_QUERY]
+
+
+class CachedPage(NamedTuple):
+    """Resultados guardados para uma página."""
+
+    local_text: Optional[str]
+    markdown: Optional[str]
+    # Confiança do TrOCR no texto local (None em páginas gravadas sem ela)
+    confidence: Optional[float] = None
+
+
+class PageCache:
+    """Cache persistente (SQLite) com os resultados de cada página.
+
+    A chave de cada página é o hash do seu conteúdo combinado com a configuração
+    do pipeline, então páginas que não mudaram reaproveitam o texto do OCR local,
+    a imagem codificada para a API e o Markdown gerado.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS pages (
+                       key TEXT PRIMARY KEY,
+                       local_text TEXT,
+                       markdown TEXT,
+                       updated_at REAL NOT NULL
+                   )""",
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pages)")}
+            if "confidence" not in columns:
+                self._conn.execute("ALTER TABLE pages ADD COLUMN confidence REAL")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS pages_updated ON pages (updated_at)")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS payloads (
+                       key TEXT PRIMARY KEY,
+                       data BLOB NOT NULL,
+                       mime_type TEXT NOT NULL,
+                       width INTEGER NOT NULL,
+                       height INTEGER NOT NULL,
+                       updated_at REAL NOT NULL
+                   )""",
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS payloads_updated ON payloads (updated_at)")
+        logger.info(f"Cache de páginas em: {db_path}")
+
+    def get_many(self, keys: List[str]) -> Dict[str, CachedPage]:
+        """Busca as páginas em cache (e as marca como usadas agora, para o `prune_pages`);
+        chaves ausentes não aparecem no resultado."""
+        rows = self._fetch_and_touch("pages", "key, local_text, markdown, confidence", keys)
+        return {key: CachedPage(local_text, markdown, confidence) for key, local_text, markdown, confidence in rows}
+
+    def get_payloads(self, keys: List[str]) -> Dict[str, EncodedImage]:
+        """Busca as páginas já codificadas para a API (e as marca como usadas agora, para o `prune_payloads`)."""
+        rows = self._fetch_and_touch("payloads", "key, data, mime_type, width, height", keys)
+        return {key: EncodedImage(data, mime_type, width, height) for key, data, mime_type, width, height in rows}
+
+    def _fetch_and_touch(self, table: str, columns: str, keys: List[str]) -> list:
+        """Lê as linhas de `keys` em lotes de _KEYS_PER_QUERY e atualiza o `updated_at` das encontradas."""
+        rows = []
+        now = time.time()
+        with self._lock, self._conn:
+            for chunk in _chunks(keys):
+                placeholders = ",".join("?" * len(chunk))
+                found = self._conn.execute(
+                    f"SELECT {columns} FROM {table} WHERE key IN ({placeholders})", chunk,
+                ).fetchall()
+                if found:
+                    self._conn.execute(
+                        f"UPDATE {table} SET updated_at = ? WHERE key IN ({','.join('?' * len(found))})",
+                        [now, *(row[0] for row in found)],
+                    )
+                rows.extend(found)
+        return rows
+
+    def put_local_text(self, key: str, local_text: str, confidence: Optional[float] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO pages (key, local_text, confidence, updated_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET local_text = excluded.local_text,
+                                                  confidence = excluded.confidence,
+                                                  updated_at = excluded.updated_at""",
+                (key, local_text, confidence, time.time()),
+            )
+
+    def put_markdown(self, key: str, markdown: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO pages (key, markdown, updated_at) VALUES (?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET markdown = excluded.markdown,
+                                                  updated_at = excluded.updated_at""",
+                (key, markdown, time.time()),
+            )
+
+    def put_payload(self, key: str, payload: EncodedImage):
+        """Guarda a página já codificada, para não renderizá-la de novo."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO payloads (key, data, mime_type, width, height, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (key, payload.data, payload.mime_type, payload.width, payload.height, time.time()),
+            )
+
+    def prune_payloads(self, max_bytes: int) -> int:
+        """Remove as imagens codificadas usadas há mais tempo até o total caber em `max_bytes`.
+
+        As imagens são só um atalho (evitam renderizar de novo a página); o texto
+        local e o Markdown das páginas continuam no cache.
+
+        Returns:
+            int: Quantas imagens foram removidas.
+
+        """
+        with self._lock, self._conn:
+            removed = self._conn.execute(
+                """DELETE FROM payloads WHERE key IN (
+                       SELECT key FROM (
+                           SELECT key, SUM(length(data)) OVER (ORDER BY updated_at DESC, key) AS running
+                           FROM payloads)
+                       WHERE running > ?)""",
+                (max_bytes,),
+            ).rowcount
+        if removed:
+            logger.info(f"{removed} imagem(ns) removidas do cache de páginas para caber em {max_bytes} bytes.")
+        return removed
+
+    def prune_pages(self, max_age: float) -> int:
+        """Remove as páginas não usadas há mais de `max_age` segundos (e as imagens delas).
+
+        Uma página removida só volta a custar o OCR local (e a API, se o Markdown
+        também saiu) quando o PDF dela for processado de novo.
+
+        Returns:
+            int: Quantas páginas foram removidas.
+
+        """
+        cutoff = time.time() - max_age
+        with self._lock, self._conn:
+            removed = self._conn.execute("DELETE FROM pages WHERE updated_at < ?", (cutoff,)).rowcount
+            self._conn.execute("DELETE FROM payloads WHERE updated_at < ?", (cutoff,))
+        if removed:
+            logger.info(f"{removed} página(s) sem uso há mais de {max_age / 86400:.0f} dia(s) removidas do cache de páginas.")
+        return removed
+
+    def page_stats(self) -> int:
+        """Número de páginas (texto local e Markdown) em cache."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def payload_stats(self) -> Tuple[int, int]:
+        """Número de imagens codificadas em cache e o tamanho total (bytes)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length(data)), 0) FROM payloads").fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
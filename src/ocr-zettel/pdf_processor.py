@@ -1,12 +1,25 @@
 # pdf_ocr_pipeline.py
+import ctypes
+import hashlib
 import logging
+import multiprocessing
 import os
-from typing import List
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
 import config
 import cv2
 import fitz  # PyMuPDF
+import metrics
 import numpy as np
+import vector_ink
+from image_encoder import (EncodedImage, EncodeSettings, encode_image,
+                           encode_settings_from_config)
 from PIL import Image
 
 logger = logging.getLogger(__name__)
@@ -14,14 +27,21 @@ logger = logging.getLogger(__name__)
 # --- Inicialização do motor TrOCR ---
 
 # --- Funções de pré-processamento ---
+def binarize_page(gray: np.ndarray, target_width=1600) -> np.ndarray:
+    """Redimensiona e binariza uma página em escala de cinza (uint8, HxW).
+
+    Páginas renderizadas já na largura `target_width` não são redimensionadas.
+    """
+    img = gray
+    if gray.shape[1] != target_width:
+        scale = target_width / gray.shape[1]
+        img = cv2.resize(gray, (target_width, int(gray.shape[0] * scale)))
+    return cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY, 15, 10)
+
 def preprocess_page(pil_img: Image.Image, target_width=1600) -> Image.Image:
     """Pré-processa a página: converte para grayscale, binariza e redimensiona."""
-    img = np.array(pil_img.convert("L"))
-    scale = target_width / img.shape[1]
-    img = cv2.resize(img, (target_width, int(img.shape[0] * scale)))
-    img = cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                cv2.THRESH_BINARY, 15, 10)
-    return Image.fromarray(img)
+    return Image.fromarray(binarize_page(np.asarray(pil_img.convert("L")), target_width))
 
 def segment_blocks_and_lines(pil_img: Image.Image,
                              min_block_height=40,
@@ -58,44 +78,474 @@ def segment_blocks_and_lines(pil_img: Image.Image,
     lines = [img for y, img in sorted(lines, key=lambda x: x[0])]
     return lines
 
+# --- Segmentação vetorizada ---
+_kernels = {}
+
+def _line_kernel(width: int) -> np.ndarray:
+    """Elemento estruturante horizontal, criado uma única vez por largura."""
+    kernel = _kernels.get(width)
+    if kernel is None:
+        kernel = _kernels[width] = cv2.getStructuringElement(cv2.MORPH_RECT, (width, 1))
+    return kernel
+
+def estimate_skew(binarized: np.ndarray, max_angle: float = 5.0, step: float = 0.5) -> float:
+    """Estima a inclinação (graus) que deixa as linhas de texto na horizontal.
+
+    Testa os ângulos em uma cópia reduzida da página e escolhe o que maximiza a
+    variância do perfil de projeção horizontal (linhas alinhadas = picos nítidos).
+    """
+    ink = cv2.threshold(binarized, 200, 255, cv2.THRESH_BINARY_INV)[1]
+    small = cv2.resize(ink, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+    h, w = small.shape
+    center = (w / 2, h / 2)
+
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rotation = cv2.getRotationMatrix2D(center, float(angle), 1.0)
+        rotated = cv2.warpAffine(small, rotation, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+        score = float(np.var(rotated.sum(axis=1, dtype=np.float64)))
+        # Em caso de empate, fica com o ângulo mais próximo de zero
+        if score > best_score or (score == best_score and abs(angle) < abs(best_angle)):
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def deskew_page(binarized: np.ndarray, max_angle: float = 5.0) -> np.ndarray:
+    """Gira a página binarizada para corrigir a inclinação estimada."""
+    angle = estimate_skew(binarized, max_angle)
+    if angle == 0.0:
+        return binarized
+    h, w = binarized.shape
+    rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    logger.debug(f"Corrigindo inclinação da página: {angle:.1f}°")
+    return cv2.warpAffine(binarized, rotation, (w, h), flags=cv2.INTER_NEAREST, borderValue=255)
+
+def _reading_order(boxes: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """Ordena as caixas por linha (de cima para baixo) e, na mesma linha, da esquerda para a direita.
+
+    Uma caixa pertence à linha atual quando seu centro vertical cai dentro dela.
+    """
+    rows = []
+    bottom = -1
+    for x, y, w, h in boxes[np.argsort(boxes[:, 1], kind="stable")].tolist():
+        if rows and y + h / 2 < bottom:
+            rows[-1].append((x, y, w, h))
+            bottom = max(bottom, y + h)
+        else:
+            rows.append([(x, y, w, h)])
+            bottom = y + h
+    return [box for row in rows for box in sorted(row)]
+
+def segment_lines(binarized: np.ndarray,
+                  min_line_height: int = 20,
+                  line_kernel_width: int = 50,
+                  min_ink_ratio: float = 0.02) -> List[Tuple[int, int, int, int]]:
+    """Encontra as linhas de texto de uma página binarizada em uma única passada.
+
+    Dilata a tinta horizontalmente (juntando as palavras de uma linha) e rotula os
+    componentes conexos da página inteira de uma vez, sem recortar blocos.
+
+    Args:
+        binarized (np.ndarray): Página em escala de cinza (uint8, HxW), texto escuro.
+        min_line_height (int): Componentes mais baixos que isso são descartados.
+        line_kernel_width (int): Largura da dilatação horizontal.
+        min_ink_ratio (float): Fração mínima de tinta na caixa; abaixo disso o
+            componente é ruído do scan encadeado pela dilatação.
+
+    Returns:
+        List[Tuple[int, int, int, int]]: Caixas (x, y, largura, altura) em ordem de leitura.
+
+    """
+    ink = cv2.threshold(binarized, 200, 255, cv2.THRESH_BINARY_INV)[1]
+    dilated = cv2.dilate(ink, _line_kernel(line_kernel_width))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(dilated, connectivity=8)
+    ink_pixels = np.bincount(labels[ink > 0], minlength=count)
+
+    # O rótulo 0 é o fundo
+    boxes = stats[1:, :4]
+    area = boxes[:, 2] * boxes[:, 3]
+    keep = (boxes[:, 3] >= min_line_height) & (ink_pixels[1:] >= min_ink_ratio * area)
+    return _reading_order(boxes[keep])
+
+def line_views(img: np.ndarray, boxes: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+    """Recortes das linhas como views de `img` (sem cópia)."""
+    return [img[y:y + h, x:x + w] for x, y, w, h in boxes]
+
 # --- Função para processar PDF ---
-def process_pdf_to_images(pdf_path: str) -> List[Image.Image]:
-    images = []
+class RenderSettings(NamedTuple):
+    """Parâmetros de renderização, copiados do config para poderem ser enviados
+    aos processos do pool (que não enxergam alterações feitas em tempo de execução).
+    """
+
+    dpi: int
+    crop_box: Optional[Tuple[int, int, int, int]]
+    screen_dpi: int
+    debug_save_images: bool
+    ocr_width: int = 1600
+    min_line_height: int = 20
+    line_kernel_width: int = 50
+    min_ink_ratio: float = 0.02
+    deskew: bool = False
+    max_skew_degrees: float = 5.0
+    vector_ink: bool = False
+    vector_min_strokes: int = 10
+    vector_line_size: Tuple[int, int] = (384, 384)
+    vector_line_gap: float = 0.7
+
+def crop_box_from_config() -> Optional[Tuple[int, int, int, int]]:
+    """O crop do config, ou None se estiver desativado."""
+    if config.PDF_ENABLE_CROP and config.PDF_CROP_BOX and len(config.PDF_CROP_BOX) == 4:
+        return tuple(config.PDF_CROP_BOX)
+    return None
+
+def render_settings_from_config() -> RenderSettings:
+    """Monta os parâmetros de renderização a partir dos valores atuais do config."""
+    return RenderSettings(config.OCR_RESOLUTION_DPI, crop_box_from_config(),
+                          config.SCREEN_ASSUMED_DPI, config.DEBUG_SAVE_IMAGES, config.OCR_TARGET_WIDTH,
+                          config.SEGMENT_MIN_LINE_HEIGHT, config.SEGMENT_LINE_KERNEL_WIDTH,
+                          config.SEGMENT_MIN_INK_RATIO, config.SEGMENT_DESKEW, config.SEGMENT_MAX_SKEW_DEGREES,
+                          config.VECTOR_INK, config.VECTOR_MIN_STROKES, tuple(config.VECTOR_LINE_SIZE),
+                          config.VECTOR_LINE_GAP)
+
+def page_clip(page, settings: RenderSettings):
+    """Região renderizada, em pontos do PDF: o crop configurado ou a página inteira.
+
+    O crop é dado em pixels a `settings.screen_dpi`; a parte fora da página é ignorada.
+    """
+    if not settings.crop_box:
+        return page.rect
+    scale = 72.0 / settings.screen_dpi
+    clip = fitz.Rect(*(c * scale for c in settings.crop_box)) & page.rect
+    if clip.is_empty:
+        logger.error(f"O crop {settings.crop_box} está fora da página {page.number + 1}; usando a página inteira.")
+        return page.rect
+    return clip
+
+def render_pixels(page, clip, zoom: float, gray: bool = True) -> np.ndarray:
+    """Renderiza só a região `clip` da página, com `zoom` pixels por ponto.
+
+    Returns:
+        np.ndarray: (H, W) em escala de cinza ou (H, W, 3) em RGB, uint8. O array
+            usa a memória do pixmap, sem cópia; o pixmap fica vivo enquanto o
+            array (ou uma visão dele) existir.
+
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip,
+                          colorspace=fitz.csGRAY if gray else fitz.csRGB, alpha=False)
+    buffer = (ctypes.c_ubyte * (pix.stride * pix.height)).from_address(pix.samples_ptr)
+    buffer.pixmap = pix
+    pixels = np.frombuffer(buffer, dtype=np.uint8).reshape(pix.height, pix.stride)
+    pixels = pixels[:, :pix.width * pix.n]
+    if pix.n > 1:
+        pixels = pixels.reshape(pix.height, pix.width, pix.n)
+    return pixels
+
+def ocr_zoom(clip, settings: RenderSettings) -> float:
+    """Zoom que deixa a região com `settings.ocr_width` pixels de largura, até `settings.dpi`."""
+    return min(settings.ocr_width / clip.width, settings.dpi / 72.0)
+
+def vision_zoom(clip, settings: RenderSettings, encode_settings: EncodeSettings) -> float:
+    """Zoom que já entrega a região no tamanho final da imagem enviada à API.
+
+    Um pixel de folga em cada limite compensa o arredondamento da renderização,
+    para que encode_image não precise redimensionar a imagem.
+    """
+    long_side, short_side = max(clip.width, clip.height), min(clip.width, clip.height)
+    return min((encode_settings.max_long_edge - 1) / long_side,
+               (encode_settings.max_short_edge - 1) / short_side,
+               settings.dpi / 72.0)
+
+def render_for_ocr(page, settings: RenderSettings) -> np.ndarray:
+    """Renderiza a região do OCR em escala de cinza, já na largura usada na binarização."""
+    clip = page_clip(page, settings)
+    gray = render_pixels(page, clip, ocr_zoom(clip, settings), gray=True)
+    # O arredondamento da renderização pode acrescentar uma coluna; cortá-la evita um resize
+    return gray[:, :settings.ocr_width]
+
+def encode_page(page, settings: RenderSettings, encode_settings: EncodeSettings) -> EncodedImage:
+    """Renderiza a região na resolução e nas cores da imagem enviada à API e a codifica."""
+    clip = page_clip(page, settings)
+    pixels = render_pixels(page, clip, vision_zoom(clip, settings, encode_settings),
+                           gray=encode_settings.mode in ("L", "1"))
+    return encode_image(Image.fromarray(pixels), encode_settings)
+
+def _render_page(page, settings: RenderSettings, base_filename: str, page_num: int) -> Image.Image:
+    """Renderiza a região configurada da página, em RGB e a `settings.dpi`."""
+    zoom = settings.dpi / 72.0
+    img = Image.fromarray(render_pixels(page, page_clip(page, settings), zoom, gray=False))
+
+    if settings.debug_save_images:
+        debug_filename = f"debug_{base_filename}_page_{page_num+1}.png"
+        img.save(debug_filename)
+        logger.info(f"Imagem de debug salva em: {os.path.abspath(debug_filename)}")
+
+    return img
+
+def process_pdf_to_images(pdf_path: str) -> Iterator[Image.Image]:
+    """Renderiza as páginas do PDF uma a uma (só a página atual fica em memória)."""
     base_filename = os.path.splitext(os.path.basename(pdf_path))[0]
 
     try:
         logger.info(f"Processando PDF: {pdf_path}")
-        doc = fitz.open(pdf_path)
-        render_zoom = config.OCR_RESOLUTION_DPI / 72.0
-        mat = fitz.Matrix(render_zoom, render_zoom)
-        coord_scale_factor = config.OCR_RESOLUTION_DPI / config.SCREEN_ASSUMED_DPI
+        settings = render_settings_from_config()
+        with fitz.open(pdf_path) as doc:
+            for page_num in range(len(doc)):
+                page = doc.load_page(page_num)
+                yield _render_page(page, settings, base_filename, page_num)
+    except Exception as e:
+        logger.error(f"Falha ao processar PDF: {e}", exc_info=True)
+
+# --- Pipeline paralelo por página ---
+class PageResult(NamedTuple):
+    """Resultado do processamento de uma página.
+
+    Attributes:
+        page_num (int): Índice da página no PDF (começando em 0).
+        lines (List[np.ndarray]): Recortes das linhas em escala de cinza (binarizados, ou
+            desenhados a partir da tinta vetorial).
+        payload (EncodedImage): A página codificada para a API.
+        timings (Dict[str, float]): Duração (s) de cada etapa feita no worker.
+
+    """
+
+    page_num: int
+    lines: List[np.ndarray]
+    payload: EncodedImage
+    timings: Optional[Dict[str, float]] = None
 
-        for page_num in range(len(doc)):
+def _raster_lines(page, settings: RenderSettings, base_filename: str, page_num: int,
+                  timings: Dict[str, float]) -> Tuple[List[np.ndarray], np.ndarray]:
+    """Renderiza, binariza e segmenta a página; devolve as linhas e a página binarizada."""
+    start = time.perf_counter()
+    gray = render_for_ocr(page, settings)
+    if settings.debug_save_images:
+        debug_filename = f"debug_{base_filename}_page_{page_num+1}.png"
+        Image.fromarray(gray).save(debug_filename)
+        logger.info(f"Imagem de debug salva em: {os.path.abspath(debug_filename)}")
+    timings[metrics.STAGE_RENDER] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    binarized = binarize_page(gray, settings.ocr_width)
+    del gray
+    if settings.deskew:
+        binarized = deskew_page(binarized, settings.max_skew_degrees)
+    timings[metrics.STAGE_PREPROCESS] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    boxes = segment_lines(binarized, settings.min_line_height,
+                          settings.line_kernel_width, settings.min_ink_ratio)
+    lines = line_views(binarized, boxes)
+    timings[metrics.STAGE_SEGMENT] = timings.get(metrics.STAGE_SEGMENT, 0.0) + time.perf_counter() - start
+    return lines, binarized
+
+def _iter_page_range(pdf_path: str, page_numbers: List[int],
+                     settings: RenderSettings,
+                     encode_settings: EncodeSettings) -> Iterator[PageResult]:
+    """Extrai as linhas e codifica as páginas para a API, uma de cada vez.
+
+    Páginas com tinta vetorial têm as linhas desenhadas direto dos traços
+    (vector_ink); as demais são renderizadas, binarizadas e segmentadas. Só a
+    página atual fica renderizada: a imagem é descartada assim que as linhas e a
+    página codificada ficam prontas.
+    """
+    base_filename = os.path.splitext(os.path.basename(pdf_path))[0]
+
+    with fitz.open(pdf_path) as doc:
+        for page_num in page_numbers:
+            timings = {}
             page = doc.load_page(page_num)
-            pix = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB)
-            img = Image.frombytes("RGBA" if pix.alpha else "RGB",
-                                  [pix.width, pix.height],
-                                  pix.samples)
-            if pix.alpha:
-                img = img.convert("RGB")
-
-            # Crop
-            if config.PDF_ENABLE_CROP and config.PDF_CROP_BOX and len(config.PDF_CROP_BOX) == 4:
-                try:
-                    scaled_crop_box = tuple(int(c * coord_scale_factor) for c in config.PDF_CROP_BOX)
-                    img = img.crop(scaled_crop_box)
-                except Exception as e:
-                    logger.error(f"Erro ao aplicar crop: {e}", exc_info=True)
-
-            if config.DEBUG_SAVE_IMAGES:
-                debug_filename = f"debug_{base_filename}_page_{page_num+1}.png"
-                img.save(debug_filename)
-                logger.info(f"Imagem de debug salva em: {os.path.abspath(debug_filename)}")
-
-            images.append(img)
-        doc.close()
-        return images
+            lines = None
+            if settings.vector_ink:
+                start = time.perf_counter()
+                lines = vector_ink.extract_lines(page, page_clip(page, settings), settings.vector_line_size,
+                                                 settings.vector_min_strokes, settings.vector_line_gap)
+                timings[metrics.STAGE_SEGMENT] = time.perf_counter() - start
+
+            binarized = None
+            if lines is None:
+                lines, binarized = _raster_lines(page, settings, base_filename, page_num, timings)
+
+            start = time.perf_counter()
+            if encode_settings.send_binarized:
+                if binarized is None:
+                    binarized = binarize_page(render_for_ocr(page, settings), settings.ocr_width)
+                payload = encode_image(Image.fromarray(binarized), encode_settings)
+            else:
+                payload = encode_page(page, settings, encode_settings)
+            timings[metrics.STAGE_ENCODE] = time.perf_counter() - start
+            yield PageResult(page_num, lines, payload, timings)
+
+def _process_page_range(pdf_path: str, page_numbers: List[int],
+                        settings: RenderSettings,
+                        encode_settings: EncodeSettings) -> List[PageResult]:
+    """Versão de `_iter_page_range` que roda dentro dos processos do pool.
+
+    Cada chamada abre o documento por conta própria e devolve apenas dados
+    compactos (linhas e a página já codificada).
+    """
+    return list(_iter_page_range(pdf_path, page_numbers, settings, encode_settings))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _ignore_sigint():
+    """Inicializador dos workers: o CTRL+C é tratado só pelo processo principal.
+
+    Sem isso, o SIGINT chega também aos processos do pool, que morrem e deixam o
+    pool quebrado enquanto o serviço ainda termina (ou esvazia) a fila.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Cria (uma única vez, ou de novo depois de `_discard_pool`) o pool de processos das páginas."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn" evita herdar as threads do watchdog e do PyTorch via fork
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_ignore_sigint)
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Descarta um pool quebrado (um worker morreu); o próximo `_get_pool` cria outro."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    # As tarefas ainda pendentes já foram canceladas por quem consumia (_iter_in_pool);
+    # cancel_futures só existe a partir do Python 3.9
+    pool.shutdown(wait=False)
+
+
+def _iter_in_pool(pool: ProcessPoolExecutor, pdf_path: str, page_numbers: List[int],
+                  settings: RenderSettings, encode_settings: EncodeSettings,
+                  max_buffered: int, held: Callable[[], int]) -> Iterator[PageResult]:
+    """Processa as páginas no pool, uma tarefa por página.
+
+    Só há uma nova tarefa quando as pendentes mais as `held()` páginas retidas por
+    quem consome ficam abaixo de `max_buffered` (sempre ao menos uma pendente).
+    """
+    remaining = iter(page_numbers)
+    in_flight = deque()
+
+    def fill():
+        while not in_flight or len(in_flight) + held() < max_buffered:
+            page_num = next(remaining, None)
+            if page_num is None:
+                return
+            in_flight.append(pool.submit(_process_page_range, pdf_path, [page_num], settings, encode_settings))
+
+    try:
+        fill()
+        while in_flight:
+            yield from in_flight.popleft().result()
+            fill()
+    finally:
+        # Quem consome pode parar no meio (erro no OCR, por exemplo)
+        for future in in_flight:
+            future.cancel()
+
+
+def iter_pdf_pages(pdf_path: str, workers: int = None,
+                   page_numbers: List[int] = None,
+                   max_buffered: int = None,
+                   settings: RenderSettings = None,
+                   held: Callable[[], int] = None) -> Iterator[PageResult]:
+    """Processa as páginas do PDF e as devolve uma a uma, na ordem.
+
+    No pool de processos, cada página é uma tarefa, e no máximo `max_buffered`
+    (padrão: config.PAGE_BUFFER_LIMIT) ficam processadas ou em processamento sem
+    terem sido consumidas. Assim a memória não cresce com o número de páginas.
+    Se quem consome guarda as páginas por um tempo (ex.: até juntar um lote de
+    OCR), `held` informa quantas ainda estão com ele, e elas contam no mesmo limite.
+    Documentos pequenos (ou com um único worker) são processados no próprio
+    processo, uma página por vez. Se `page_numbers` for informado, só essas
+    páginas são processadas. `settings` substitui os parâmetros de renderização
+    do config (ex.: o crop de cada pasta monitorada).
+
+    Se um processo do pool morrer, o pool é recriado e as páginas que faltam são
+    repetidas uma vez; se ele quebrar de novo, o erro vai para quem consome e o
+    próximo documento já encontra um pool novo.
+
+    Raises:
+        Exception: Os erros de renderização são repassados a quem consome.
+
+    """
+    workers = workers or config.PAGE_WORKERS
+    max_buffered = max(1, max_buffered or config.PAGE_BUFFER_LIMIT)
+    held = held or (lambda: 0)
+    settings = settings or render_settings_from_config()
+    encode_settings = encode_settings_from_config()
+
+    logger.info(f"Processando PDF: {pdf_path}")
+    if page_numbers is None:
+        with fitz.open(pdf_path) as doc:
+            page_numbers = list(range(len(doc)))
+    page_count = len(page_numbers)
+    if page_count == 0:
+        return
+
+    if workers <= 1 or page_count < config.PARALLEL_MIN_PAGES:
+        yield from _iter_page_range(pdf_path, page_numbers, settings, encode_settings)
+        return
+
+    logger.info(f"Processando {page_count} página(s) com {workers} processo(s), "
+                f"até {max_buffered} em memória.")
+    done = 0
+    for attempt in range(2):
+        pool = _get_pool(workers)
+        try:
+            for page in _iter_in_pool(pool, pdf_path, page_numbers[done:], settings, encode_settings,
+                                     max_buffered, held):
+                done += 1
+                yield page
+            return
+        except BrokenProcessPool:
+            # Um worker morreu (falta de memória, falha do MuPDF): sem descartar o pool,
+            # todos os documentos seguintes falhariam do mesmo jeito
+            _discard_pool(pool)
+            if attempt:
+                raise
+            logger.warning(f"Um processo do pool terminou inesperadamente em {pdf_path}; "
+                           f"repetindo as {page_count - done} página(s) restantes em um pool novo.")
+
+
+def process_pdf_pages(pdf_path: str, workers: int = None,
+                      page_numbers: List[int] = None) -> List[PageResult]:
+    """Processa todas as páginas do PDF, em paralelo quando valer a pena.
+
+    Guarda todas as páginas em memória; para documentos grandes, prefira
+    `iter_pdf_pages`.
+
+    Returns:
+        List[PageResult]: Os resultados na ordem das páginas (vazio se falhar).
+
+    """
+    try:
+        return list(iter_pdf_pages(pdf_path, workers, page_numbers))
     except Exception as e:
         logger.error(f"Falha ao processar PDF: {e}", exc_info=True)
         return []
 
+# --- Identificação do conteúdo das páginas ---
+def page_content_hashes(pdf_path: str) -> List[str]:
+    """Calcula um hash do conteúdo de cada página sem renderizá-la.
+
+    Usa o content stream da página, os streams das imagens e XObjects que ela
+    referencia e a sua geometria, de modo que o hash só muda se o desenho mudar.
+    """
+    hashes = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            h = hashlib.sha256()
+            h.update(page.read_contents())
+            for xref in sorted({img[0] for img in page.get_images(full=True)} |
+                               {xobj[0] for xobj in page.get_xobjects()}):
+                h.update(doc.xref_stream_raw(xref) or b"")
+            h.update(repr((tuple(page.rect), page.rotation)).encode("utf-8"))
+            hashes.append(h.hexdigest())
+    return hashes
@@ -0,0 +1,384 @@
+# pipeline.py
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import config
+import gpt_vision_client
+import local_markdown
+import local_ocr
+import markdown_stitcher
+import markdown_writer
+import metrics
+from image_encoder import encode_settings_from_config
+from page_cache import CachedPage, PageCache
+from pdf_processor import (PageResult, RenderSettings, iter_pdf_pages,
+                           page_content_hashes, render_settings_from_config)
+from PIL import Image
+from watch_roots import WatchRoot, default_root
+
+logger = logging.getLogger(__name__)
+
+_page_cache = None
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """Abre (uma única vez) o cache de páginas configurado em config.PAGE_CACHE_PATH.
+
+    Ao abrir, as páginas sem uso há mais de config.PAGE_CACHE_MAX_AGE_DAYS e as imagens
+    codificadas que passam de config.PAGE_CACHE_MAX_PAYLOAD_BYTES são removidas.
+    """
+    global _page_cache
+    with _page_cache_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(config.PAGE_CACHE_PATH)
+            if config.PAGE_CACHE_MAX_AGE_DAYS is not None:
+                _page_cache.prune_pages(config.PAGE_CACHE_MAX_AGE_DAYS * 86400)
+            if config.PAGE_CACHE_MAX_PAYLOAD_BYTES is not None:
+                _page_cache.prune_payloads(config.PAGE_CACHE_MAX_PAYLOAD_BYTES)
+        return _page_cache
+
+
+def render_settings_for(root: WatchRoot) -> RenderSettings:
+    """Parâmetros de renderização do config com o crop da pasta `root`."""
+    return render_settings_from_config()._replace(crop_box=root.crop_box)
+
+
+def pipeline_fingerprint(root: WatchRoot = None) -> str:
+    """Hash da configuração que influencia o resultado de uma página.
+
+    Mudar o crop, a resolução, a codificação das imagens, o modelo de OCR ou o
+    prompt invalida o cache. Sem `root`, usa a pasta definida pelo config.
+    """
+    root = root or default_root()
+    settings = render_settings_for(root)._replace(debug_save_images=False)
+    parts = {
+        "render": list(settings),
+        "encode": list(encode_settings_from_config()),
+        "ocr_model": root.model_path,
+        "ocr_backend": config.OCR_BACKEND,
+        "onnx_quantize": config.ONNX_QUANTIZE,
+        "ocr_num_beams": config.OCR_NUM_BEAMS,
+        "spell": [config.SPELL_MAX_EDIT_DISTANCE, config.SPELL_PREFIX_LENGTH],
+        "vision_model": config.VISION_MODEL,
+        "prompt": hashlib.sha256(gpt_vision_client.PROMPT_TEMPLATE.encode("utf-8")).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def page_keys(pdf_path: str, root: WatchRoot = None) -> List[str]:
+    """Chave de cache de cada página: conteúdo da página + configuração do pipeline."""
+    fingerprint = pipeline_fingerprint(root)
+    return [hashlib.sha256(f"{content_hash}:{fingerprint}".encode("utf-8")).hexdigest()
+            for content_hash in page_content_hashes(pdf_path)]
+
+
+@dataclass
+class DocumentState:
+    """Estado de um PDF ao longo das etapas do pipeline."""
+
+    pdf_path: str
+    # Pasta monitorada de onde veio o PDF (modelo e crop); None usa a do config
+    root: Optional[WatchRoot] = None
+    keys: List[str] = field(default_factory=list)
+    cached: Dict[str, CachedPage] = field(default_factory=dict)
+    pages: List[PageResult] = field(default_factory=list)
+    local_texts: Dict[int, str] = field(default_factory=dict)
+    # Confiança do TrOCR em cada página e as páginas formatadas localmente, sem a API
+    confidences: Dict[int, float] = field(default_factory=dict)
+    local_pages: List[int] = field(default_factory=list)
+    markdown_pages: Dict[int, str] = field(default_factory=dict)
+    # Linhas enviadas ao TrOCR (as imagens das linhas são descartadas após o OCR)
+    lines: int = 0
+    # Duração (s) de cada etapa e tokens usados na API, para as métricas
+    timings: Dict[str, float] = field(default_factory=dict)
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+def _recognize_pages(state: DocumentState, pages: List[PageResult], done: Dict[int, PageResult],
+                     timings: Dict[str, float]):
+    """OCR local de um grupo de páginas; guarda o texto e descarta as imagens das linhas."""
+    cache = get_page_cache()
+    line_count = sum(len(page.lines) for page in pages)
+    metrics.LINES.inc(line_count)
+    state.lines += line_count
+    confidences = []
+    texts = local_ocr.extract_text_from_pages([[Image.fromarray(line) for line in page.lines] for page in pages],
+                                              page_numbers=[page.page_num for page in pages],
+                                              timings=timings, confidences=confidences,
+                                              model_path=(state.root or default_root()).model_path)
+    for page, text, confidence in zip(pages, texts, confidences):
+        state.local_texts[page.page_num] = text
+        state.confidences[page.page_num] = confidence
+        if not text.startswith("[ERRO"):
+            cache.put_local_text(state.keys[page.page_num], text, confidence)
+        done[page.page_num] = page._replace(lines=[])
+
+
+def prepare_document(pdf_path: str, state: DocumentState = None) -> DocumentState:
+    """Etapas 1 e 2: consulta o cache, renderiza/segmenta as páginas que faltam e faz o OCR local.
+
+    No fim, `route_pages` decide quais páginas precisam da API.
+
+    As páginas passam uma a uma por renderização, segmentação e TrOCR; depois do
+    OCR só a imagem codificada para a API fica em memória. No máximo
+    config.PAGE_BUFFER_LIMIT páginas com as linhas segmentadas ficam carregadas
+    ao mesmo tempo, qualquer que seja o tamanho do PDF: as que aguardam o OCR
+    contam no mesmo limite das que estão no pool de renderização.
+
+    Se `state` for informado, ele é preenchido em vez de um estado novo.
+    """
+    cache = get_page_cache()
+    state = state or DocumentState(pdf_path)
+    root = state.root or default_root()
+    state.keys = page_keys(pdf_path, root)
+    state.cached = cache.get_many(state.keys)
+
+    pending = []
+    for page_num, key in enumerate(state.keys):
+        entry = state.cached.get(key)
+        if entry and entry.markdown is not None:
+            state.markdown_pages[page_num] = entry.markdown
+        else:
+            pending.append(page_num)
+
+    logger.info(f"{len(state.keys) - len(pending)} página(s) reaproveitadas do cache, {len(pending)} para processar.")
+    metrics.PAGES.labels("cached").inc(len(state.keys) - len(pending))
+    metrics.PAGES.labels("processed").inc(len(pending))
+    if not pending:
+        return state
+
+    # Páginas com texto local e imagem codificada em cache nem precisam ser renderizadas
+    payloads = cache.get_payloads([state.keys[i] for i in pending])
+    done = {}
+    to_render = []
+    for page_num in pending:
+        key = state.keys[page_num]
+        entry = state.cached.get(key)
+        if entry and entry.local_text is not None:
+            state.local_texts[page_num] = entry.local_text
+            if entry.confidence is not None:
+                state.confidences[page_num] = entry.confidence
+            if key in payloads:
+                done[page_num] = PageResult(page_num, [], payloads[key])
+                continue
+        to_render.append(page_num)
+
+    # O TrOCR roda em grupos de páginas, para aproveitar os lotes sem acumular o PDF inteiro
+    timings = {}
+    awaiting_ocr: List[PageResult] = []
+    pages = iter_pdf_pages(pdf_path, page_numbers=to_render, settings=render_settings_for(root),
+                           held=lambda: len(awaiting_ocr)) if to_render else []
+    for page in pages:
+        cache.put_payload(state.keys[page.page_num], page.payload)
+        for stage, seconds in (page.timings or {}).items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        if page.page_num in state.local_texts:
+            done[page.page_num] = page._replace(lines=[])
+            continue
+        awaiting_ocr.append(page)
+        if (len(awaiting_ocr) >= config.PAGE_BUFFER_LIMIT
+                or sum(len(p.lines) for p in awaiting_ocr) >= config.OCR_STREAM_MIN_LINES):
+            _recognize_pages(state, awaiting_ocr, done, timings)
+            awaiting_ocr = []
+    if awaiting_ocr:
+        _recognize_pages(state, awaiting_ocr, done, timings)
+
+    if len(done) != len(pending):
+        raise RuntimeError(f"Falha ao renderizar as páginas de '{pdf_path}'.")
+    for stage, seconds in timings.items():
+        metrics.observe_stage(stage, seconds, state.timings)
+    state.pages = [done[page_num] for page_num in pending]
+
+    route_pages(state)
+    for page in state.pages:
+        if page.page_num not in state.markdown_pages:
+            logger.info(f"Página {page.page_num + 1}: {len(page.payload.data)} bytes para a API "
+                        f"({page.payload.mime_type}, {page.payload.width}x{page.payload.height}).")
+    return state
+
+
+def route_pages(state: DocumentState):
+    """Formata localmente as páginas em que o TrOCR tem confiança alta; as demais vão à API.
+
+    Páginas sem nenhuma linha reconhecida (desenhos, escrita que a segmentação não
+    achou) sempre vão à API, qualquer que seja a confiança.
+
+    A decisão de cada página é registrada por metrics.log_page_route. O Markdown
+    local não vai para o cache: é refeito (sem custo) a partir do texto em cache,
+    então mudar config.LOCAL_MARKDOWN_MIN_CONFIDENCE vale também para notas já vistas.
+    """
+    threshold = config.LOCAL_MARKDOWN_MIN_CONFIDENCE
+    for page in state.pages:
+        page_num = page.page_num
+        confidence = state.confidences.get(page_num)
+        text = state.local_texts.get(page_num, "")
+        if (threshold is not None and confidence is not None and confidence >= threshold
+                and not text.startswith("[ERRO") and local_markdown.has_text(text)):
+            state.markdown_pages[page_num] = local_markdown.format_page(text, first_page=page_num == 0)
+            state.local_pages.append(page_num)
+            route = "local"
+        else:
+            route = "api"
+        metrics.log_page_route(state.pdf_path, page_num, route, confidence, threshold)
+
+
+def plan_vision_groups(state: DocumentState) -> List[List[PageResult]]:
+    """Agrupa as páginas que aguardam a API em requisições.
+
+    Cada grupo tem páginas consecutivas, no máximo config.VISION_MAX_PAGES_PER_REQUEST,
+    e cabe (pela estimativa) em config.VISION_REQUEST_TOKEN_BUDGET tokens de entrada.
+    Uma página que sozinha passa do orçamento vai num grupo só dela.
+    """
+    groups: List[List[PageResult]] = []
+    for page in state.pages:
+        if page.page_num in state.markdown_pages:
+            continue
+        current = groups[-1] if groups else None
+        if (current and page.page_num == current[-1].page_num + 1
+                and len(current) < config.VISION_MAX_PAGES_PER_REQUEST
+                and gpt_vision_client.estimate_request_tokens(
+                    _group_text(state, current + [page]),
+                    [p.payload for p in current + [page]]) <= config.VISION_REQUEST_TOKEN_BUDGET):
+            current.append(page)
+        else:
+            groups.append([page])
+    return groups
+
+
+def _group_text(state: DocumentState, group: List[PageResult]) -> str:
+    if len(group) == 1:
+        return state.local_texts[group[0].page_num]
+    return "\n\n".join(f"[Página {i + 1}]\n{state.local_texts[page.page_num]}"
+                        for i, page in enumerate(group))
+
+
+def _group_key(state: DocumentState, group: List[PageResult]) -> str:
+    """Chave de cache de um grupo cuja resposta não pôde ser separada por página."""
+    keys = ",".join(state.keys[page.page_num] for page in group)
+    return hashlib.sha256(f"group:{keys}".encode("utf-8")).hexdigest()
+
+
+def _store_group_markdown(state: DocumentState, group: List[PageResult], markdown: str):
+    """Guarda o Markdown de um grupo, separado por página sempre que possível."""
+    cache = get_page_cache()
+    if len(group) == 1:
+        cache.put_markdown(state.keys[group[0].page_num], markdown)
+        state.markdown_pages[group[0].page_num] = markdown
+        return
+
+    pages = markdown_stitcher.split_pages(markdown, len(group))
+    if pages is None:
+        # Sem os marcadores, o grupo inteiro fica com a primeira página (e no cache do grupo)
+        logger.warning(f"A resposta das páginas {group[0].page_num + 1}-{group[-1].page_num + 1} "
+                       f"veio sem os marcadores de página; mantendo o grupo inteiro.")
+        cache.put_markdown(_group_key(state, group), markdown)
+        pages = [markdown] + [""] * (len(group) - 1)
+    else:
+        for page, page_markdown in zip(group, pages):
+            cache.put_markdown(state.keys[page.page_num], page_markdown)
+    for page, page_markdown in zip(group, pages):
+        state.markdown_pages[page.page_num] = page_markdown
+
+
+def request_markdown(state: DocumentState, latencies: List[float] = None):
+    """Etapa 3: Markdown das páginas pela API, em grupos de páginas enviados em paralelo.
+
+    Raises:
+        VisionAPIError: Se a API falhar para algum grupo. Os que deram certo
+            ficam no cache mesmo assim.
+
+    """
+    groups = plan_vision_groups(state)
+    if not groups:
+        return
+    group_keys = [_group_key(state, group) for group in groups]
+    cached_groups = get_page_cache().get_many([key for key, group in zip(group_keys, groups) if len(group) > 1])
+    to_send = []
+    for key, group in zip(group_keys, groups):
+        entry = cached_groups.get(key)
+        if entry and entry.markdown is not None:
+            for page, page_markdown in zip(group, [entry.markdown] + [""] * (len(group) - 1)):
+                state.markdown_pages[page.page_num] = page_markdown
+        else:
+            to_send.append(group)
+
+    logger.info(f"{sum(len(group) for group in groups)} página(s) em {len(groups)} grupo(s); "
+                f"{len(to_send)} requisição(ões) para a API.")
+    if not to_send:
+        return
+    with metrics.timed(metrics.STAGE_VISION_API, state.timings):
+        results = gpt_vision_client.get_markdown_for_pages(
+            [(_group_text(state, group), [page.payload for page in group]) for group in to_send],
+            latencies=latencies, usage=state.usage, page_markers=True)
+
+    errors = []
+    for group, result in zip(to_send, results):
+        if isinstance(result, gpt_vision_client.VisionAPIError):
+            errors.append(result)
+            continue
+        _store_group_markdown(state, group, result)
+
+    if errors:
+        raise errors[0]
+
+
+def assemble_markdown(state: DocumentState) -> str:
+    """Etapa 4: junta o Markdown das páginas na ordem original, tratando as emendas."""
+    return markdown_stitcher.stitch([state.markdown_pages[i] for i in range(len(state.keys))])
+
+
+def document_summary(state: DocumentState) -> Dict[str, Any]:
+    """Contagens de um documento para a linha de log de `metrics.log_document`."""
+    return {
+        "root": state.root.name if state.root else None,
+        "pages": len(state.keys),
+        "pages_processed": len(state.pages),
+        "pages_local": len(state.local_pages),
+        "lines": state.lines,
+        "payload_bytes": sum(len(page.payload.data) for page in state.pages),
+        "tokens": dict(state.usage),
+    }
+
+
+def markdown_path_for(pdf_path: str) -> str:
+    return os.path.splitext(pdf_path)[0] + ".md"
+
+
+def save_markdown(pdf_path: str, markdown: str) -> str:
+    """Salva o Markdown ao lado do PDF e devolve o caminho do arquivo.
+
+    A gravação é atômica e só acontece se o conteúdo mudou (ver markdown_writer).
+    """
+    markdown_path = markdown_path_for(pdf_path)
+    if markdown_writer.write_if_changed(markdown_path, markdown, config.OWN_WRITE_EVENT_WINDOW):
+        metrics.MARKDOWN_WRITES.labels("written").inc()
+    else:
+        metrics.MARKDOWN_WRITES.labels("unchanged").inc()
+        logger.info(f"O Markdown de {pdf_path} não mudou; {markdown_path} não foi regravado.")
+    return markdown_path
+
+
+def process_document(pdf_path: str, state: DocumentState = None) -> str:
+    """Gera o Markdown de um PDF, reprocessando apenas as páginas novas ou alteradas.
+
+    Páginas cujo conteúdo já está no cache não passam pelo TrOCR nem pela API, e
+    páginas em que o TrOCR tem confiança alta são formatadas localmente. Se
+    `state` for informado, ele guarda o estado (e as métricas) do processamento,
+    mesmo que alguma etapa falhe.
+
+    Returns:
+        str: O Markdown completo do documento, com as páginas na ordem original.
+
+    Raises:
+        VisionAPIError: Se a API falhar para alguma página; nada é salvo nesse caso.
+
+    """
+    state = prepare_document(pdf_path, state)
+    request_markdown(state)
+    return assemble_markdown(state)
@@ -0,0 +1,183 @@
+# response_cache.py
+"""Cache das respostas da API de visão, endereçado pelo conteúdo da requisição.
+
+A chave é o hash do que é enviado: o modelo, os parâmetros, o prompt completo (o
+modelo do prompt e o texto do OCR local) e os bytes de cada imagem codificada.
+Uma requisição idêntica (o mesmo PDF duplicado em outra pasta, um reinício, um
+ajuste de crop que gera as mesmas imagens) é respondida na hora, sem custo.
+
+Complementa o cache de páginas (page_cache), que depende da configuração do
+pipeline: aqui só importa o que chega à API.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse(NamedTuple):
+    """Uma resposta guardada e os tokens que ela custou."""
+
+    markdown: str
+    usage: Dict[str, int]
+    created_at: float
+
+
+class CacheStats(NamedTuple):
+    """Tamanho do cache e datas (time.time) da entrada mais antiga e da mais recente."""
+
+    entries: int
+    size_bytes: int
+    oldest: Optional[float]
+    newest: Optional[float]
+
+
+def request_key(model: str, params: Dict[str, object], prompt: str, images: Sequence[bytes]) -> str:
+    """Hash de uma requisição: modelo, parâmetros, prompt e bytes de cada imagem, em ordem."""
+    h = hashlib.sha256()
+    h.update(json.dumps({"model": model, "params": params}, sort_keys=True).encode("utf-8"))
+    h.update(hashlib.sha256(prompt.encode("utf-8")).digest())
+    for data in images:
+        h.update(hashlib.sha256(data).digest())
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """Cache persistente (SQLite) das respostas da API, com validade e limite de tamanho.
+
+    Entradas mais antigas que `ttl` segundos são ignoradas (e apagadas). Quando o
+    total passa de `max_bytes`, as entradas usadas há mais tempo são removidas.
+    """
+
+    def __init__(self, db_path: str, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                       key TEXT PRIMARY KEY,
+                       model TEXT NOT NULL,
+                       markdown TEXT NOT NULL,
+                       usage TEXT NOT NULL,
+                       size INTEGER NOT NULL,
+                       created_at REAL NOT NULL,
+                       accessed_at REAL NOT NULL
+                   )""",
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        logger.info(f"Cache de respostas da API em: {db_path}")
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Busca uma resposta; None se não existir ou tiver expirado."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT markdown, usage, created_at FROM responses WHERE key = ?", (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            markdown, usage, created_at = row
+            if self._expired(created_at, now):
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return CachedResponse(markdown, json.loads(usage), created_at)
+
+    def put(self, key: str, model: str, markdown: str, usage: Dict[str, int]):
+        """Guarda uma resposta e, se preciso, remove as menos usadas para caber no limite."""
+        usage_json = json.dumps(usage, sort_keys=True)
+        size = len(markdown.encode("utf-8")) + len(usage_json)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO responses (key, model, markdown, usage, size, created_at, accessed_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (key, model, markdown, usage_json, size, now, now),
+            )
+            if self.max_bytes is not None:
+                self._evict(self.max_bytes)
+
+    def _evict(self, max_bytes: int) -> int:
+        """Remove as entradas usadas há mais tempo até o total caber em `max_bytes` (com o lock)."""
+        cursor = self._conn.execute(
+            """DELETE FROM responses WHERE key IN (
+                   SELECT key FROM (
+                       SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running
+                       FROM responses)
+                   WHERE running > ?)""",
+            (max_bytes,),
+        )
+        if cursor.rowcount:
+            logger.info(f"{cursor.rowcount} resposta(s) removidas do cache para caber em {max_bytes} bytes.")
+        return cursor.rowcount
+
+    def prune(self) -> int:
+        """Aplica agora a validade e o limite de tamanho; devolve quantas entradas saíram."""
+        removed = 0
+        with self._lock, self._conn:
+            if self.ttl is not None:
+                removed += self._conn.execute("DELETE FROM responses WHERE created_at < ?",
+                                              (time.time() - self.ttl,)).rowcount
+            if self.max_bytes is not None:
+                removed += self._evict(self.max_bytes)
+        return removed
+
+    def clear(self, older_than: Optional[float] = None, model: Optional[str] = None) -> int:
+        """Invalida as respostas (todas, as criadas há mais de `older_than` segundos e/ou de `model`)."""
+        conditions, params = [], []
+        if older_than is not None:
+            conditions.append("created_at < ?")
+            params.append(time.time() - older_than)
+        if model is not None:
+            conditions.append("model = ?")
+            params.append(model)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock, self._conn:
+            return self._conn.execute(f"DELETE FROM responses{where}", params).rowcount
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), MIN(created_at), MAX(created_at) FROM responses",
+            ).fetchone()
+        return CacheStats(*row)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_from_config() -> ResponseCache:
+    """Abre o cache com o caminho, o limite e a validade do config."""
+    ttl = config.VISION_CACHE_TTL_DAYS * 86400 if config.VISION_CACHE_TTL_DAYS else None
+    return ResponseCache(config.VISION_CACHE_PATH, config.VISION_CACHE_MAX_BYTES, ttl)
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Abre (uma única vez) o cache configurado em config.VISION_CACHE_PATH; None se desativado."""
+    global _cache
+    if not config.VISION_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = cache_from_config()
+        return _cache
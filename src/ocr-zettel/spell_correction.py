@@ -0,0 +1,274 @@
+# spell_correction.py
+"""Correção ortográfica do texto do OCR local.
+
+Usa um índice de deleções simétricas (o algoritmo do SymSpell): cada palavra do
+dicionário é registrada sob todas as variantes obtidas apagando até
+`max_distance` letras do seu prefixo. Para corrigir uma palavra basta gerar as
+deleções dela e procurar as mesmas chaves no índice, em vez de testar todas as
+edições possíveis como faz o `SpellChecker.correction`.
+
+O índice é montado uma vez a partir do dicionário em português do pyspellchecker
+e salvo em disco como arrays NumPy (hash de 32 bits de cada deleção + índice da
+palavra), o que o deixa compacto e rápido de carregar.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Set
+
+import config
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Incrementar quando o formato do arquivo do índice mudar
+_INDEX_VERSION = 1
+
+# Separa a pontuação das bordas da palavra: "(casa," -> "(", "casa", ","
+_TOKEN_RE = re.compile(r"^(\W*)(.*?)(\W*)$", re.UNICODE)
+# Tokens deixados como estão: números, tags/menções, LaTeX e URLs
+_NUMBER_RE = re.compile(r"\d")
+_LATEX_RE = re.compile(r"[\\$^_{}=]")
+_URL_RE = re.compile(r"^(https?://|www\.)", re.IGNORECASE)
+# O `tag:`/`tags:` do início da linha, que o local_markdown converte em #tags
+# (a correção o trocaria por "tal:"/"tais:")
+_TAG_KEY_RE = re.compile(r"^\s*tags?\s*[:\-]", re.IGNORECASE)
+
+
+def should_skip(token: str) -> bool:
+    """Indica se o token não deve passar pela correção."""
+    return (token.startswith(("#", "@", "[["))
+            or bool(_NUMBER_RE.search(token))
+            or bool(_LATEX_RE.search(token))
+            or bool(_URL_RE.match(token)))
+
+
+def _strip_accents(word: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", word) if not unicodedata.combining(c))
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """A palavra e todas as variantes com até `max_distance` letras apagadas."""
+    result = {word}
+    for distance in range(1, min(max_distance, len(word)) + 1):
+        for positions in combinations(range(len(word)), distance):
+            result.add("".join(c for i, c in enumerate(word) if i not in positions))
+    return result
+
+
+def _hash(text: str) -> int:
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Distância de Damerau-Levenshtein (transposição adjacente), limitada.
+
+    Retorna `max_distance + 1` assim que a distância passa do limite.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SymSpellIndex:
+    """Índice de deleções simétricas sobre um dicionário palavra -> frequência."""
+
+    def __init__(self, words: List[str], frequencies: np.ndarray,
+                 delete_hashes: np.ndarray, delete_words: np.ndarray,
+                 max_distance: int, prefix_length: int):
+        self.words = words
+        self.frequencies = frequencies
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._delete_hashes = delete_hashes
+        self._delete_words = delete_words
+        self._word_ids: Dict[str, int] = {word: i for i, word in enumerate(words)}
+
+    @classmethod
+    def build(cls, dictionary: Dict[str, int], max_distance: int = 2,
+              prefix_length: int = 7) -> "SymSpellIndex":
+        """Monta o índice a partir de um dicionário palavra -> frequência."""
+        start = time.perf_counter()
+        words = sorted(dictionary)
+        frequencies = np.array([dictionary[word] for word in words], dtype=np.int64)
+
+        hashes, word_ids = [], []
+        for word_id, word in enumerate(words):
+            for delete in _deletes(word[:prefix_length], max_distance):
+                hashes.append(_hash(delete))
+                word_ids.append(word_id)
+
+        hashes = np.array(hashes, dtype=np.uint32)
+        word_ids = np.array(word_ids, dtype=np.int32)
+        order = np.argsort(hashes, kind="stable")
+        logger.info(f"Índice ortográfico montado: {len(words)} palavras, {len(hashes)} deleções, "
+                    f"em {time.perf_counter() - start:.1f}s.")
+        return cls(words, frequencies, hashes[order], word_ids[order], max_distance, prefix_length)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     meta=np.array([_INDEX_VERSION, self.max_distance, self.prefix_length], dtype=np.int64),
+                     words=np.frombuffer("\n".join(self.words).encode("utf-8"), dtype=np.uint8),
+                     frequencies=self.frequencies,
+                     delete_hashes=self._delete_hashes,
+                     delete_words=self._delete_words)
+        os.replace(tmp_path, path)
+        logger.info(f"Índice ortográfico salvo em: {path}")
+
+    @classmethod
+    def load(cls, path: str, max_distance: int, prefix_length: int) -> Optional["SymSpellIndex"]:
+        """Carrega o índice salvo; None se não existir ou tiver outros parâmetros."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                version, saved_distance, saved_prefix = data["meta"].tolist()
+                if (version, saved_distance, saved_prefix) != (_INDEX_VERSION, max_distance, prefix_length):
+                    logger.info(f"Índice ortográfico em {path} foi gerado com outros parâmetros.")
+                    return None
+                words = data["words"].tobytes().decode("utf-8").split("\n")
+                return cls(words, data["frequencies"], data["delete_hashes"], data["delete_words"],
+                           max_distance, prefix_length)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Não foi possível ler o índice ortográfico de {path}: {e}")
+            return None
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._word_ids
+
+    def lookup(self, word: str) -> Optional[str]:
+        """A correção mais provável para `word` (em minúsculas), ou None.
+
+        Ordena os candidatos como o pyspellchecker: menor distância primeiro; na
+        mesma distância, quem difere só na acentuação; depois a maior frequência.
+        """
+        if word in self._word_ids:
+            return word
+
+        keys = np.fromiter((_hash(d) for d in _deletes(word[:self.prefix_length], self.max_distance)),
+                           dtype=np.uint32)
+        left = np.searchsorted(self._delete_hashes, keys, side="left")
+        right = np.searchsorted(self._delete_hashes, keys, side="right")
+        if not (right > left).any():
+            return None
+        candidate_ids = np.unique(np.concatenate(
+            [self._delete_words[lo:hi] for lo, hi in zip(left, right) if hi > lo]))
+
+        unaccented = _strip_accents(word)
+        best, best_rank = None, None
+        for word_id in candidate_ids.tolist():
+            candidate = self.words[word_id]
+            distance = edit_distance(word, candidate, self.max_distance)
+            if distance > self.max_distance:
+                continue
+            rank = (distance, _strip_accents(candidate) != unaccented, -int(self.frequencies[word_id]))
+            if best_rank is None or rank < best_rank:
+                best, best_rank = candidate, rank
+        return best
+
+
+def _match_case(original: str, corrected: str) -> str:
+    if original.isupper() and len(original) > 1:
+        return corrected.upper()
+    if original[:1].isupper():
+        return corrected[:1].upper() + corrected[1:]
+    return corrected
+
+
+class SpellCorrector:
+    """Corrige o texto do OCR palavra a palavra, com cache LRU das correções."""
+
+    def __init__(self, index: SymSpellIndex, cache_size: int = 50_000):
+        self.index = index
+        self._correct_word = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, word: str) -> Optional[str]:
+        return self.index.lookup(word)
+
+    def correct_token(self, token: str) -> str:
+        """Corrige um token, preservando a pontuação das bordas e as maiúsculas.
+
+        Tokens sem correção conhecida são mantidos como vieram.
+        """
+        prefix, core, suffix = _TOKEN_RE.match(token).groups()
+        if not core or should_skip(token):
+            return token
+        corrected = self._correct_word(core.lower())
+        if corrected is None:
+            return token
+        return f"{prefix}{_match_case(core, corrected)}{suffix}"
+
+    def correct_lines(self, lines: Iterable[str]) -> List[str]:
+        """Corrige as linhas de uma página de uma vez.
+
+        Cada palavra distinta é consultada uma única vez, mesmo que se repita na página.
+        O `tag:` (ou `tags:`) do início de uma linha é mantido como veio.
+        """
+        lines = list(lines)
+        tokenized = [line.split() for line in lines]
+        kept = [1 if _TAG_KEY_RE.match(line) else 0 for line in lines]
+        corrections = {token: self.correct_token(token)
+                       for token in {token for tokens, skip in zip(tokenized, kept) for token in tokens[skip:]}}
+        return [" ".join(tokens[:skip] + [corrections[token] for token in tokens[skip:]])
+                for tokens, skip in zip(tokenized, kept)]
+
+    def correct(self, text: str) -> str:
+        return self.correct_lines([text])[0]
+
+    def cache_info(self):
+        return self._correct_word.cache_info()
+
+
+_corrector = None
+_corrector_lock = threading.Lock()
+
+
+def load_corrector(index_path: str, max_distance: int = 2, prefix_length: int = 7,
+                   cache_size: int = 50_000) -> SpellCorrector:
+    """Carrega o índice salvo em `index_path` ou, na primeira vez, monta e salva o índice."""
+    index = SymSpellIndex.load(index_path, max_distance, prefix_length)
+    if index is None:
+        from spellchecker import SpellChecker
+
+        logger.info("Montando o índice ortográfico a partir do dicionário em português (só na primeira vez)...")
+        dictionary = dict(SpellChecker(language="pt").word_frequency.dictionary)
+        index = SymSpellIndex.build(dictionary, max_distance, prefix_length)
+        index.save(index_path)
+    return SpellCorrector(index, cache_size)
+
+
+def get_corrector() -> SpellCorrector:
+    """O corretor configurado em config.SPELL_*, carregado uma única vez."""
+    global _corrector
+    with _corrector_lock:
+        if _corrector is None:
+            _corrector = load_corrector(config.SPELL_INDEX_PATH,
+                                        config.SPELL_MAX_EDIT_DISTANCE,
+                                        config.SPELL_PREFIX_LENGTH,
+                                        config.SPELL_CACHE_SIZE)
+        return _corrector
@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# Os módulos do serviço são importados pelo nome, a partir da pasta do projeto
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,36 @@
+# test_file_handler.py
+"""Testes do manipulador de eventos: o que chega à fila de estabilidade."""
+import config
+import markdown_writer
+import pytest
+from file_handler import PDFChangeHandler
+from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "JOURNAL_PATH", str(tmp_path / "journal.sqlite"))
+    handler = PDFChangeHandler(workers=1)
+    watched = []
+    monkeypatch.setattr(handler, "enqueue", lambda path, priority: watched.append(path))
+    handler.watched = watched
+    return handler
+
+
+def test_own_markdown_writes_are_ignored(tmp_path, handler):
+    markdown = tmp_path / "nota.md"
+    markdown_writer.write_if_changed(str(markdown), "# Nota")
+
+    handler.on_created(FileCreatedEvent(str(markdown)))
+    handler.on_modified(FileModifiedEvent(str(markdown)))
+
+    assert handler.watched == []
+
+
+def test_pdf_events_are_enqueued(tmp_path, handler):
+    pdf = tmp_path / "nota.pdf"
+    pdf.write_bytes(b"%PDF-1.4")
+
+    handler.on_created(FileCreatedEvent(str(pdf)))
+
+    assert handler.watched == [str(pdf)]
@@ -0,0 +1,170 @@
+# test_gpt_vision_client.py
+"""Testes do cliente da API de visão contra um servidor local no formato da OpenAI."""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import gpt_vision_client
+import pytest
+import response_cache
+from PIL import Image
+
+
+class _MockAPI(BaseHTTPRequestHandler):
+    """Responde a /chat/completions com o total de imagens recebidas."""
+
+    requests = []
+    status = []
+    delay = 0.0
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        cls = type(self)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with cls.lock:
+            cls.requests.append(body)
+            cls.active += 1
+            cls.max_active = max(cls.max_active, cls.active)
+        try:
+            time.sleep(cls.delay)
+            self._respond(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def _respond(self, body):
+        status = type(self).status.pop(0) if type(self).status else 200
+        if status != 200:
+            self._reply(status, {"error": {"message": "tente de novo", "type": "server_error"}})
+            return
+        images = sum(1 for part in body["messages"][0]["content"] if part["type"] == "image_url")
+        self._reply(200, {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"# Nota\n\n{images} imagem(ns)"}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120,
+                      "completion_tokens_details": {"reasoning_tokens": 5}},
+        })
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def mock_api(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MockAPI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    _MockAPI.requests, _MockAPI.status = [], []
+    _MockAPI.delay, _MockAPI.active, _MockAPI.max_active = 0.0, 0, 0
+
+    monkeypatch.setattr(config, "OPENAI_API_KEY", "test")
+    monkeypatch.setattr(config, "OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(config, "VISION_CACHE_PATH", str(tmp_path / "responses.db"))
+    monkeypatch.setattr(config, "VISION_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(gpt_vision_client, "_client", None)
+    monkeypatch.setattr(gpt_vision_client, "_semaphore", None)
+    monkeypatch.setattr(response_cache, "_cache", None)
+    yield _MockAPI
+    server.shutdown()
+    server.server_close()
+
+
+def _page():
+    return Image.new("L", (200, 280), 255)
+
+
+def test_async_call_on_callers_loop(mock_api):
+    async def run():
+        usage = {}
+        text = await gpt_vision_client.get_markdown_from_vision_async("texto local", [_page()], usage)
+        return text, usage
+
+    text, usage = asyncio.run(run())
+    assert text == "# Nota\n\n1 imagem(ns)"
+    assert usage["prompt"] == 100
+    assert len(mock_api.requests) == 1
+
+
+def test_concurrent_calls_on_several_loops(mock_api, monkeypatch):
+    monkeypatch.setattr(config, "VISION_CACHE_ENABLED", False)
+
+    async def run(pages):
+        return await asyncio.gather(*(
+            gpt_vision_client.get_markdown_from_vision_async(f"nota {i}", [_page()] * pages)
+            for i in range(4)))
+
+    assert asyncio.run(run(1)) == ["# Nota\n\n1 imagem(ns)"] * 4
+    assert asyncio.run(run(2)) == ["# Nota\n\n2 imagem(ns)"] * 4
+    assert len(mock_api.requests) == 8
+
+
+def test_concurrency_limit_is_process_wide(mock_api, monkeypatch):
+    monkeypatch.setattr(config, "VISION_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "VISION_MAX_CONCURRENCY", 2)
+    mock_api.delay = 0.1
+
+    async def run(name):
+        return await asyncio.gather(*(
+            gpt_vision_client.get_markdown_from_vision_async(f"{name} {i}", [_page()]) for i in range(3)))
+
+    # Cada thread aguarda as requisições no seu próprio loop
+    threads = [threading.Thread(target=asyncio.run, args=(run(f"nota {n}"),)) for n in range(3)]
+    for thread in threads:
+        thread.start()
+    gpt_vision_client.get_markdown_for_pages([("outra", [_page()])] * 3)
+    for thread in threads:
+        thread.join()
+    assert len(mock_api.requests) == 12
+    assert mock_api.max_active == 2
+
+
+def test_retries_server_errors(mock_api):
+    mock_api.status = [503]
+    text = gpt_vision_client.get_markdown_from_vision("texto local", [_page()])
+    assert text == "# Nota\n\n1 imagem(ns)"
+    assert len(mock_api.requests) == 2
+
+
+def test_identical_request_served_from_cache(mock_api):
+    first = gpt_vision_client.get_markdown_from_vision("texto local", [_page()])
+    second = asyncio.run(gpt_vision_client.get_markdown_from_vision_async("texto local", [_page()]))
+    assert first == second
+    assert len(mock_api.requests) == 1
+
+
+def test_cache_hit_needs_no_api_key(mock_api, monkeypatch):
+    first = gpt_vision_client.get_markdown_from_vision("texto local", [_page()])
+    monkeypatch.setattr(config, "OPENAI_API_KEY", None)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(gpt_vision_client, "_client", None)
+    assert gpt_vision_client.get_markdown_from_vision("texto local", [_page()]) == first
+    assert gpt_vision_client._client is None
+    assert len(mock_api.requests) == 1
+
+
+def test_batch_failures_come_back_as_vision_errors(mock_api, monkeypatch):
+    def broken_cache(*args):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(gpt_vision_client, "_lookup_cached", broken_cache)
+    results = gpt_vision_client.get_markdown_for_pages([("texto local", [_page()])])
+    assert len(results) == 1
+    assert isinstance(results[0], gpt_vision_client.VisionAPIError)
+    assert isinstance(results[0].__cause__, OSError)
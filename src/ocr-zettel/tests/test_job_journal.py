@@ -0,0 +1,57 @@
+# test_job_journal.py
+"""Testes do journal: quando um PDF já processado precisa ser refeito."""
+import os
+import sqlite3
+
+from job_journal import JobJournal, file_sha256
+
+
+def _done(journal, pdf, markdown, fingerprint):
+    st = os.stat(pdf)
+    content_hash = file_sha256(pdf)
+    journal.mark_processing(str(pdf), st.st_mtime, st.st_size, content_hash)
+    markdown.write_text("# Nota")
+    journal.mark_done(str(pdf), content_hash, str(markdown), fingerprint)
+    return content_hash
+
+
+def test_pipeline_change_requires_processing(tmp_path):
+    pdf, markdown = tmp_path / "nota.pdf", tmp_path / "nota.md"
+    pdf.write_bytes(b"%PDF-1.4 conteudo")
+    journal = JobJournal(str(tmp_path / "journal.sqlite"))
+    content_hash = _done(journal, pdf, markdown, "modelo-a")
+
+    assert not journal.needs_processing(str(pdf), str(markdown), "modelo-a")
+    assert journal.is_up_to_date(str(pdf), content_hash, "modelo-a")
+    assert journal.needs_processing(str(pdf), str(markdown), "modelo-b")
+    assert not journal.is_up_to_date(str(pdf), content_hash, "modelo-b")
+
+
+def test_unjournaled_pdf_uses_markdown_mtime(tmp_path):
+    pdf, markdown = tmp_path / "nota.pdf", tmp_path / "nota.md"
+    pdf.write_bytes(b"%PDF-1.4 conteudo")
+    journal = JobJournal(str(tmp_path / "journal.sqlite"))
+    assert journal.needs_processing(str(pdf), str(markdown), "modelo-a")
+    markdown.write_text("# Nota")
+    os.utime(pdf, (1_000_000, 1_000_000))
+    assert not journal.needs_processing(str(pdf), str(markdown), "modelo-a")
+
+
+def test_journal_without_fingerprint_column_is_migrated(tmp_path):
+    db_path = str(tmp_path / "journal.sqlite")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""CREATE TABLE files (path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL,
+                        content_hash TEXT, stage TEXT NOT NULL, output_path TEXT, last_success_hash TEXT,
+                        error TEXT, updated_at REAL NOT NULL)""")
+    pdf, markdown = tmp_path / "nota.pdf", tmp_path / "nota.md"
+    pdf.write_bytes(b"%PDF-1.4 conteudo")
+    journal = JobJournal(db_path)
+    st = os.stat(pdf)
+    content_hash = file_sha256(str(pdf))
+    journal.mark_processing(str(pdf), st.st_mtime, st.st_size, content_hash)
+    markdown.write_text("# Nota")
+    journal.mark_done(str(pdf), content_hash, str(markdown))
+
+    # Sem fingerprint registrado, o PDF não é refeito só por causa da atualização
+    assert journal.get(str(pdf)).fingerprint is None
+    assert not journal.needs_processing(str(pdf), str(markdown), "modelo-a")
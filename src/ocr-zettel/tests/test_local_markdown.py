@@ -0,0 +1,57 @@
+# test_local_markdown.py
+"""Testes da formatação local do texto do OCR em Markdown."""
+import pytest
+from local_markdown import format_page
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("- comprar pão", "- comprar pão"),
+    ("• ligar para o banco", "- ligar para o banco"),
+    ("-5 graus lá fora", "-5 graus lá fora"),
+    ("*importante* lembrar", "*importante* lembrar"),
+])
+def test_bullets_need_a_space_after_the_marker(line, expected):
+    assert format_page(line) == expected
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("1. comprar pão", "1. comprar pão"),
+    ("2) ligar", "2. ligar"),
+    ("3.5 kg de farinha", "3.5 kg de farinha"),
+    ("12.03.2024 reunião", "12.03.2024 reunião"),
+    ("10.30 café", "10.30 café"),
+])
+def test_numbered_items_but_not_decimals_or_dates(line, expected):
+    assert format_page(line) == expected
+
+
+def test_tags():
+    assert format_page("tag: carreira") == "#carreira"
+    assert format_page("Tags - gestão de tempo, leitura") == "#gestão-de-tempo #leitura"
+
+
+def test_title_only_on_first_page():
+    text = "Reunião semanal\nFalamos sobre o projeto."
+    assert format_page(text, first_page=True) == "# Reunião semanal\n\nFalamos sobre o projeto."
+    assert format_page(text) == "Reunião semanal\nFalamos sobre o projeto."
+
+
+def test_headings():
+    assert format_page("## Ideias") == "## Ideias"
+    assert format_page("PRÓXIMOS PASSOS\nrevisar o texto.") == "## PRÓXIMOS PASSOS\n\nrevisar o texto."
+    # Frases terminadas em pontuação não são títulos
+    assert format_page("Ideia boa.", first_page=True) == "Ideia boa."
+
+
+def test_blocks_group_lines_of_the_same_kind():
+    text = "Lista de compras:\n- pão\n- leite\nDepois passar no banco."
+    assert format_page(text) == "Lista de compras:\n\n- pão\n- leite\n\nDepois passar no banco."
+
+
+def test_placeholder_and_blank_lines_are_dropped():
+    text = ("[Nenhum texto detectado na linha 1, página 1]\n"
+            "  \n"
+            "Uma linha de texto.\n"
+            "[Nenhum texto detectado na linha 3, página 1]")
+    assert format_page(text) == "Uma linha de texto."
+    assert format_page("[Nenhum texto detectado na linha 1, página 2]\n") == ""
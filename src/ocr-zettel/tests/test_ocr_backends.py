@@ -0,0 +1,84 @@
+# test_ocr_backends.py
+"""Paridade entre os backends do TrOCR: o ONNX deve gerar o mesmo texto que o torch."""
+import numpy as np
+import pytest
+from ocr_backends import ban_repeated_ngrams
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+
+# Configurações de geração diferentes das do transformers, como nos modelos TrOCR ajustados
+GENERATION_CONFIGS = {
+    "trocr": dict(max_length=16, num_beams=4, no_repeat_ngram_size=3, length_penalty=2.0,
+                  early_stopping=True, min_length=6),
+    "never": dict(max_length=12, num_beams=3, no_repeat_ngram_size=2, length_penalty=0.5,
+                  early_stopping="never", min_length=3),
+}
+
+
+def _tiny_model(path, generation):
+    """Um TrOCR minúsculo e aleatório, com pesos grandes o bastante para o texto variar por imagem."""
+    from transformers import (TrOCRConfig, TrOCRForCausalLM, ViTConfig, ViTModel,
+                              VisionEncoderDecoderModel)
+
+    torch.manual_seed(0)
+    encoder = ViTModel(ViTConfig(image_size=32, patch_size=8, hidden_size=32, num_hidden_layers=1,
+                                 num_attention_heads=2, intermediate_size=64, initializer_range=1.0),
+                       add_pooling_layer=False)
+    decoder = TrOCRForCausalLM(TrOCRConfig(vocab_size=40, d_model=32, decoder_layers=2,
+                                           decoder_attention_heads=2, decoder_ffn_dim=64,
+                                           max_position_embeddings=64, init_std=0.3,
+                                           pad_token_id=1, bos_token_id=0, eos_token_id=2,
+                                           decoder_start_token_id=2))
+    model = VisionEncoderDecoderModel(encoder=encoder, decoder=decoder)
+    with torch.no_grad():
+        # Favorece o EOS, para as sequências terem comprimentos diferentes
+        decoder.output_projection.weight[2] *= 3
+    model.config.decoder_start_token_id = 2
+    model.config.pad_token_id = 1
+    model.config.eos_token_id = 2
+    for name, value in dict(generation, decoder_start_token_id=2, pad_token_id=1,
+                            eos_token_id=2, bos_token_id=0).items():
+        setattr(model.generation_config, name, value)
+    model.save_pretrained(path)
+
+
+@pytest.fixture(scope="module", params=sorted(GENERATION_CONFIGS))
+def exported_model(request, tmp_path_factory):
+    import export_onnx
+
+    path = str(tmp_path_factory.mktemp(request.param))
+    _tiny_model(path, GENERATION_CONFIGS[request.param])
+    export_onnx.export(path, f"{path}/onnx")
+    return path
+
+
+@pytest.mark.parametrize("num_beams", [1, 3, 4])
+def test_onnx_matches_torch(exported_model, num_beams):
+    from ocr_backends import OnnxTrOCRBackend, TorchTrOCRBackend
+
+    pixel_values = np.random.RandomState(0).randn(6, 3, 32, 32).astype(np.float32)
+    torch_backend = TorchTrOCRBackend(exported_model, num_beams=num_beams)
+    onnx_backend = OnnxTrOCRBackend(f"{exported_model}/onnx", num_beams=num_beams)
+
+    expected, expected_scores = torch_backend.generate_with_scores(pixel_values)
+    sequences, scores = onnx_backend.generate_with_scores(pixel_values)
+    np.testing.assert_array_equal(sequences, expected)
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-4)
+
+    # Sem as restrições de geração, o resultado seria outro
+    onnx_backend.no_repeat_ngram_size, onnx_backend.min_length = 0, 0
+    onnx_backend.length_penalty, onnx_backend.early_stopping = 1.0, False
+    unconstrained = onnx_backend.generate(pixel_values)
+    assert unconstrained.shape != expected.shape or (unconstrained != expected).any()
+
+
+def test_ban_repeated_ngrams():
+    sequences = np.array([[2, 5, 6, 7, 5], [2, 5, 6, 5, 6]])
+    scores = ban_repeated_ngrams(sequences, np.zeros((2, 10)), 2)
+    # A linha 0 termina em 5 e já tem o bigrama "5 6"; a linha 1 termina em 6 e já tem "6 5"
+    assert np.isneginf(scores[0]).nonzero()[0].tolist() == [6]
+    assert np.isneginf(scores[1]).nonzero()[0].tolist() == [5]
+    assert not np.isneginf(ban_repeated_ngrams(sequences, np.zeros((2, 10)), 0)).any()
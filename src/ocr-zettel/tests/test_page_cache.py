@@ -0,0 +1,43 @@
+# test_page_cache.py
+"""Testes do cache de páginas: lotes de chaves e remoção das páginas antigas."""
+import time
+
+import page_cache
+from image_encoder import EncodedImage
+from page_cache import PageCache
+
+
+def test_get_many_handles_more_keys_than_sqlite_parameters(tmp_path):
+    cache = PageCache(str(tmp_path / "cache.sqlite"))
+    keys = [f"pagina-{i}" for i in range(2 * page_cache._KEYS_PER_QUERY + 1200)]
+    for key in keys[::2]:
+        cache.put_local_text(key, f"texto {key}", 0.9)
+        cache.put_payload(key, EncodedImage(b"img", "image/png", 1, 1))
+
+    found = cache.get_many(keys)
+    payloads = cache.get_payloads(keys)
+
+    assert set(found) == set(keys[::2])
+    assert found[keys[0]].local_text == f"texto {keys[0]}"
+    assert set(payloads) == set(keys[::2])
+    cache.close()
+
+
+def test_prune_pages_removes_only_unused_pages(tmp_path, monkeypatch):
+    cache = PageCache(str(tmp_path / "cache.sqlite"))
+    now = time.time()
+    monkeypatch.setattr(page_cache.time, "time", lambda: now - 10 * 86400)
+    for key in ("antiga", "relida"):
+        cache.put_markdown(key, f"# {key}")
+        cache.put_payload(key, EncodedImage(b"img", "image/png", 1, 1))
+    monkeypatch.setattr(page_cache.time, "time", lambda: now)
+    cache.put_markdown("nova", "# nova")
+    # Ler a página conta como uso
+    cache.get_many(["relida"])
+    cache.get_payloads(["relida"])
+
+    assert cache.prune_pages(5 * 86400) == 1
+    assert set(cache.get_many(["antiga", "relida", "nova"])) == {"relida", "nova"}
+    assert set(cache.get_payloads(["antiga", "relida"])) == {"relida"}
+    assert cache.page_stats() == 2
+    cache.close()
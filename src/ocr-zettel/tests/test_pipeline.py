@@ -0,0 +1,85 @@
+# test_pipeline.py
+"""Testes da decisão de cada página entre o Markdown local e a API."""
+import json
+import logging
+
+import config
+import pipeline
+import pytest
+from image_encoder import EncodedImage
+from pdf_processor import PageResult
+from spell_correction import SpellCorrector, SymSpellIndex
+
+
+@pytest.fixture
+def threshold(monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_MARKDOWN_MIN_CONFIDENCE", 0.9)
+    return 0.9
+
+
+def _state(texts, confidences):
+    state = pipeline.DocumentState("nota.pdf")
+    payload = EncodedImage(b"", "image/webp", 1, 1)
+    for page_num, (text, confidence) in enumerate(zip(texts, confidences)):
+        state.pages.append(PageResult(page_num, [], payload))
+        state.local_texts[page_num] = text
+        if confidence is not None:
+            state.confidences[page_num] = confidence
+    return state
+
+
+def test_corrected_tag_line_becomes_tags(threshold):
+    corrector = SpellCorrector(SymSpellIndex.build(
+        {"tal": 1000, "tais": 500, "carreira": 10, "produtividade": 10, "leitura": 10}))
+    text = "\n".join(corrector.correct_lines(["Planejamento", "tag: carreira", "tags: produtividade, leitura"]))
+    state = _state([text], [0.95])
+    pipeline.route_pages(state)
+    assert state.local_pages == [0]
+    assert state.markdown_pages[0] == "# Planejamento\n\n#carreira\n\n#produtividade #leitura"
+
+
+def _routes(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records
+            if record.name == "metrics" and '"page_route"' in record.getMessage()]
+
+
+def test_routes_by_confidence(threshold, caplog):
+    caplog.set_level(logging.INFO, logger="metrics")
+    state = _state(["Nota segura.", "Nota duvidosa.", "Sem confiança."], [0.97, 0.5, None])
+    pipeline.route_pages(state)
+
+    assert state.local_pages == [0]
+    assert state.markdown_pages == {0: "Nota segura."}
+    assert [(r["page"], r["route"], r["confidence"], r["threshold"]) for r in _routes(caplog)] == [
+        (1, "local", 0.97, 0.9), (2, "api", 0.5, 0.9), (3, "api", None, 0.9)]
+
+
+def test_threshold_none_sends_everything_to_api(monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_MARKDOWN_MIN_CONFIDENCE", None)
+    state = _state(["Nota segura."], [0.99])
+    pipeline.route_pages(state)
+    assert state.local_pages == []
+    assert state.markdown_pages == {}
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "  \n",
+    "[Nenhum texto detectado na linha 1, página 1]\n[Nenhum texto detectado na linha 2, página 1]",
+])
+def test_empty_pages_go_to_api(threshold, text):
+    state = _state([text], [0.99])
+    pipeline.route_pages(state)
+    assert state.local_pages == []
+    assert 0 not in state.markdown_pages
+
+
+@pytest.mark.parametrize("text", [
+    "[ERRO: MOTOR TrOCR NÃO INICIALIZADO]",
+    "[ERRO DURANTE A EXECUÇÃO DO OCR LOCAL COM TrOCR]",
+])
+def test_error_pages_go_to_api(threshold, text):
+    state = _state([text], [0.99])
+    pipeline.route_pages(state)
+    assert state.local_pages == []
+    assert 0 not in state.markdown_pages
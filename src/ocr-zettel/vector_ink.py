@@ -0,0 +1,192 @@
+# vector_ink.py
+"""Linhas para o TrOCR a partir da tinta vetorial do PDF.
+
+Cadernos exportados por tablets de tinta eletrônica (ex.: Onyx) guardam a escrita
+como caminhos vetoriais. Nesses casos não é preciso renderizar a página inteira,
+binarizar e procurar as linhas nos pixels: os traços são lidos com
+`page.get_cdrawings()`, agrupados em linhas pela posição e cada linha é desenhada
+direto no tamanho de entrada do TrOCR, só com a tinta (sem o fundo nem as pautas
+do modelo de página).
+
+Páginas sem traços suficientes (scans, fotos) devolvem None e seguem pela
+renderização em pdf_processor.
+"""
+import logging
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Pontos usados para aproximar cada curva de Bézier
+_BEZIER_STEPS = 8
+_BEZIER_T = np.linspace(0.0, 1.0, _BEZIER_STEPS + 1)[1:, None]
+# Traços retos que atravessam mais que esta fração da região são pautas do modelo de página
+_TEMPLATE_SPAN = 0.5
+# Margem em volta de cada linha, em frações da altura típica dos traços
+_LINE_PADDING = 0.15
+# Linhas mais baixas que esta fração da altura típica são ruído (pontos soltos, riscos)
+_MIN_LINE_HEIGHT = 0.3
+
+
+class Stroke(NamedTuple):
+    """Um traço: os polígonos (em pontos do PDF) e como desenhá-los."""
+
+    rect: Tuple[float, float, float, float]
+    polylines: List[np.ndarray]
+    width: float
+    filled: bool
+    stroked: bool
+
+
+def _flatten(items: Sequence) -> List[np.ndarray]:
+    """Converte os itens de um caminho (linhas, curvas, retângulos) em polilinhas."""
+    polylines, current = [], []
+    for item in items:
+        kind = item[0]
+        if kind == "l":
+            start, end = item[1], item[2]
+            if not current or current[-1] != tuple(start):
+                if current:
+                    polylines.append(np.array(current, dtype=np.float32))
+                current = [tuple(start)]
+            current.append(tuple(end))
+        elif kind == "c":
+            p0, p1, p2, p3 = (np.array(p, dtype=np.float32) for p in item[1:5])
+            if not current or current[-1] != tuple(item[1]):
+                if current:
+                    polylines.append(np.array(current, dtype=np.float32))
+                current = [tuple(item[1])]
+            t = _BEZIER_T
+            points = ((1 - t) ** 3 * p0 + 3 * (1 - t) ** 2 * t * p1
+                      + 3 * (1 - t) * t ** 2 * p2 + t ** 3 * p3)
+            current.extend(map(tuple, points.tolist()))
+        elif kind == "re":
+            x0, y0, x1, y1 = item[1]
+            polylines.append(np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)], dtype=np.float32))
+        elif kind == "qu":
+            quad = [tuple(p) for p in item[1]]
+            # Ordem dos cantos de um Quad: ul, ur, ll, lr
+            polylines.append(np.array([quad[0], quad[1], quad[3], quad[2], quad[0]], dtype=np.float32))
+    if current:
+        polylines.append(np.array(current, dtype=np.float32))
+    return polylines
+
+
+def extract_strokes(page, clip) -> List[Stroke]:
+    """Lê os traços vetoriais dentro de `clip`, sem as pautas e fundos do modelo de página."""
+    clip_w, clip_h = clip.width, clip.height
+    strokes = []
+    for drawing in page.get_cdrawings():
+        x0, y0, x1, y1 = drawing["rect"]
+        if x1 <= clip.x0 or x0 >= clip.x1 or y1 <= clip.y0 or y0 >= clip.y1:
+            continue
+        w, h = x1 - x0, y1 - y0
+        # Pautas, margens e retângulos de fundo do modelo de página
+        if (w > _TEMPLATE_SPAN * clip_w and h < 0.02 * clip_h) or (h > _TEMPLATE_SPAN * clip_h and w < 0.02 * clip_w):
+            continue
+        if w > _TEMPLATE_SPAN * clip_w and h > _TEMPLATE_SPAN * clip_h:
+            continue
+        polylines = _flatten(drawing["items"])
+        if not polylines:
+            continue
+        kind = drawing["type"]
+        strokes.append(Stroke((x0, y0, x1, y1), polylines, drawing.get("width") or 1.0,
+                              "f" in kind, "s" in kind))
+    return strokes
+
+
+def cluster_lines(strokes: List[Stroke], line_gap: float = 0.7,
+                  word_gap: float = 6.0) -> List[List[Stroke]]:
+    """Agrupa os traços em linhas de texto, em ordem de leitura.
+
+    Cada traço ocupa uma faixa em volta do seu centro vertical, de `line_gap`
+    vezes a altura típica (mediana) dos traços; faixas que se sobrepõem formam
+    uma linha. Dentro da linha, vãos horizontais maiores que `word_gap` vezes a
+    altura típica separam colunas.
+    """
+    if not strokes:
+        return []
+    rects = np.array([stroke.rect for stroke in strokes], dtype=np.float32)
+    heights = rects[:, 3] - rects[:, 1]
+    typical = max(float(np.median(heights)), 1.0)
+    centers = (rects[:, 1] + rects[:, 3]) / 2
+
+    order = np.argsort(centers, kind="stable")
+    bands, current = [], [order[0]]
+    for previous, index in zip(order[:-1], order[1:]):
+        if centers[index] - centers[previous] > line_gap * typical:
+            bands.append(current)
+            current = []
+        current.append(index)
+    bands.append(current)
+
+    lines = []
+    for band in bands:
+        band = sorted(band, key=lambda i: rects[i, 0])
+        segment, right = [band[0]], rects[band[0], 2]
+        for index in band[1:]:
+            if rects[index, 0] - right > word_gap * typical:
+                lines.append(segment)
+                segment = []
+            segment.append(index)
+            right = max(right, rects[index, 2])
+        lines.append(segment)
+
+    result = []
+    for line in lines:
+        top, bottom = rects[line, 1].min(), rects[line, 3].max()
+        if bottom - top >= _MIN_LINE_HEIGHT * typical:
+            result.append([strokes[i] for i in line])
+    return result
+
+
+def _line_rect(line: List[Stroke], padding: float) -> Tuple[float, float, float, float]:
+    rects = np.array([stroke.rect for stroke in line], dtype=np.float32)
+    return (float(rects[:, 0].min()) - padding, float(rects[:, 1].min()) - padding,
+            float(rects[:, 2].max()) + padding, float(rects[:, 3].max()) + padding)
+
+
+def draw_line(line: List[Stroke], size: Tuple[int, int], padding: float = 0.0) -> np.ndarray:
+    """Desenha os traços de uma linha em uma imagem (uint8, tinta 0 e fundo 255) de `size` (largura, altura).
+
+    A linha é esticada para ocupar a imagem inteira, como faz o processador do
+    TrOCR ao redimensionar um recorte, mas sem perder nitidez.
+    """
+    width, height = size
+    x0, y0, x1, y1 = _line_rect(line, padding)
+    scale = np.array([width / max(x1 - x0, 1e-3), height / max(y1 - y0, 1e-3)], dtype=np.float32)
+    origin = np.array([x0, y0], dtype=np.float32)
+    # Espessura pela média geométrica das escalas, já que a linha é esticada de forma diferente em x e y
+    thickness_scale = float(np.sqrt(scale[0] * scale[1]))
+
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+    for stroke in line:
+        # Coordenadas em ponto fixo (4 bits fracionários) para o antialiasing do OpenCV
+        polylines = [np.round((points - origin) * scale * 16).astype(np.int32) for points in stroke.polylines]
+        if stroke.filled:
+            # Os polígonos de um caminho são preenchidos juntos, para que os furos (o, e, a) fiquem vazios
+            cv2.fillPoly(canvas, polylines, 0, cv2.LINE_AA, shift=4)
+        if stroke.stroked:
+            thickness = max(1, int(round(stroke.width * thickness_scale)))
+            cv2.polylines(canvas, polylines, False, 0, thickness, cv2.LINE_AA, shift=4)
+    return canvas
+
+
+def extract_lines(page, clip, line_size: Tuple[int, int] = (384, 384),
+                  min_strokes: int = 10, line_gap: float = 0.7) -> Optional[List[np.ndarray]]:
+    """Imagens das linhas manuscritas da região `clip`, desenhadas a partir dos vetores.
+
+    Returns:
+        Optional[List[np.ndarray]]: As linhas em ordem de leitura, ou None se a
+            região tiver menos de `min_strokes` traços (a página deve ser renderizada).
+
+    """
+    strokes = extract_strokes(page, clip)
+    if len(strokes) < min_strokes:
+        return None
+    lines = cluster_lines(strokes, line_gap)
+    typical = float(np.median([stroke.rect[3] - stroke.rect[1] for stroke in strokes]))
+    logger.debug(f"Página {page.number + 1}: {len(strokes)} traço(s) vetoriais em {len(lines)} linha(s).")
+    return [draw_line(line, line_size, _LINE_PADDING * typical) for line in lines]
@@ -0,0 +1,127 @@
+# watch_roots.py
+"""Pastas monitoradas e as configurações do pipeline de cada uma.
+
+Sem arquivo de configuração, o serviço monitora apenas config.WATCH_DIRECTORY com
+o modelo e o crop do config. Com um arquivo YAML (config.WATCH_ROOTS_FILE ou
+`--roots`), cada pasta (um aparelho, um usuário) tem o seu modelo e o seu crop:
+
+    roots:
+      - name: tab-ultra
+        path: /home/felipe/Google_Drive/onyx/TabUltraCPro/Notebooks/
+        model_path: /home/felipe/Projects/trocr/meu-trocr-final/
+        crop_box: [120, 100, 2350, 3300]
+      - name: note-air
+        path: /home/ana/Google_Drive/onyx/NoteAir/Notebooks/
+        crop_box: null      # página inteira
+        weight: 2           # recebe o dobro da capacidade quando há fila
+
+As chaves omitidas usam os valores do config. Pastas com o mesmo `model_path`
+compartilham o mesmo modelo carregado (local_ocr.get_engine).
+"""
+import logging
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import config
+import yaml
+from pdf_processor import crop_box_from_config
+
+logger = logging.getLogger(__name__)
+
+_ROOT_KEYS = {"name", "path", "model_path", "crop_box", "weight"}
+
+
+class WatchRoot(NamedTuple):
+    """Uma pasta monitorada e as configurações do pipeline das notas dela.
+
+    Attributes:
+        name (str): Nome da pasta nos logs e nas métricas.
+        path (str): Diretório monitorado (recursivamente).
+        model_path (str): Modelo TrOCR usado no OCR local.
+        crop_box (Optional[Tuple[int, int, int, int]]): Região das páginas, em
+            pixels a config.SCREEN_ASSUMED_DPI; None usa a página inteira.
+        weight (float): Parcela da capacidade de processamento quando várias
+            pastas têm notas na fila (ver job_queue.JobQueue).
+
+    """
+
+    name: str
+    path: str
+    model_path: str
+    crop_box: Optional[Tuple[int, int, int, int]]
+    weight: float = 1.0
+
+
+def _model_path(path: str) -> str:
+    """Normaliza o caminho do modelo, para que pastas com o mesmo modelo compartilhem o motor."""
+    return os.path.normpath(os.path.expanduser(str(path)))
+
+
+def default_root(path: str = None) -> WatchRoot:
+    """A pasta definida só pelo config (ou `path`, com as mesmas configurações)."""
+    return WatchRoot("default", os.path.abspath(path or config.WATCH_DIRECTORY),
+                     _model_path(config.FINAL_MODEL_PATH), crop_box_from_config())
+
+
+def _parse_root(item: dict, index: int) -> WatchRoot:
+    if not isinstance(item, dict) or "path" not in item:
+        raise ValueError(f"A pasta {index + 1} precisa de um `path`.")
+    unknown = set(item) - _ROOT_KEYS
+    if unknown:
+        raise ValueError(f"Chave(s) desconhecida(s) na pasta {index + 1}: {', '.join(sorted(unknown))}.")
+
+    crop_box = item.get("crop_box", crop_box_from_config())
+    if crop_box is not None:
+        if len(crop_box) != 4:
+            raise ValueError(f"O crop_box da pasta {index + 1} deve ter 4 valores (x0, y0, x1, y1).")
+        crop_box = tuple(int(c) for c in crop_box)
+
+    weight = float(item.get("weight", 1.0))
+    if weight <= 0:
+        raise ValueError(f"O weight da pasta {index + 1} deve ser positivo.")
+
+    path = os.path.abspath(os.path.expanduser(str(item["path"])))
+    return WatchRoot(str(item.get("name") or os.path.basename(os.path.normpath(path))), path,
+                     _model_path(item.get("model_path") or config.FINAL_MODEL_PATH),
+                     crop_box, weight)
+
+
+def load_roots(path: str) -> List[WatchRoot]:
+    """Lê as pastas monitoradas de um arquivo YAML (formato no docstring do módulo).
+
+    Raises:
+        ValueError: Se o arquivo não tiver pastas, tiver chaves inválidas ou nomes repetidos.
+
+    """
+    with open(path, encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    items = data.get("roots") if isinstance(data, dict) else None
+    if not items:
+        raise ValueError(f"Nenhuma pasta em `roots` no arquivo {path}.")
+
+    roots = [_parse_root(item, i) for i, item in enumerate(items)]
+    names = [root.name for root in roots]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Nomes de pasta repetidos em {path}: {', '.join(names)}.")
+    return roots
+
+
+def configured_roots(path: str = None) -> List[WatchRoot]:
+    """As pastas do arquivo `path` (padrão: config.WATCH_ROOTS_FILE) ou, sem arquivo, a do config."""
+    path = path or config.WATCH_ROOTS_FILE
+    if not path:
+        return [default_root()]
+    roots = load_roots(path)
+    logger.info(f"{len(roots)} pasta(s) monitorada(s) definidas em {path}.")
+    return roots
+
+
+def root_for_path(roots: List[WatchRoot], path: str) -> Optional[WatchRoot]:
+    """A pasta que contém `path`; com pastas aninhadas, a mais interna."""
+    path = os.path.abspath(path)
+    best = None
+    for root in roots:
+        if path == root.path or path.startswith(root.path.rstrip(os.sep) + os.sep):
+            if best is None or len(root.path) > len(best.path):
+                best = root
+    return best